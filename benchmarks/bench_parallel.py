@@ -0,0 +1,71 @@
+"""Speedup curve for MultiLoss.simulate_years with a process pool.
+
+Usage: python benchmarks/bench_parallel.py [--scenarios N] [--years N] [--workers 1 2 4 ...]
+
+Prints the wall time and speedup over a single process for each worker count,
+and checks that every worker count reproduces the single process result.
+"""
+
+#   Copyright 2019-2020 Netflix, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from argparse import ArgumentParser
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # This checkout's riskquant
+
+import numpy as np  # noqa: E402
+from riskquant import multiloss  # noqa: E402
+from riskquant import simpleloss  # noqa: E402
+
+
+def random_portfolio(num_scenarios, seed=0):
+    """A MultiLoss of SimpleLoss scenarios with register-like parameters."""
+    rng = np.random.default_rng(seed)
+    frequencies = 10 ** rng.uniform(-3, 0, num_scenarios)
+    low_losses = 10 ** rng.uniform(3, 6, num_scenarios)
+    high_losses = low_losses * 10 ** rng.uniform(0.5, 2, num_scenarios)
+    return multiloss.MultiLoss([simpleloss.SimpleLoss('L%d' % i, 'scenario %d' % i, f, lo, hi)
+                                for i, (f, lo, hi) in enumerate(zip(frequencies, low_losses, high_losses))])
+
+
+def main():
+    cpus = os.cpu_count() or 1
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenarios', type=int, default=1000)
+    parser.add_argument('--years', type=int, default=100000)
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=sorted({1, 2, 4, 8, 16, 32, cpus} & set(range(1, cpus + 1))))
+    args = parser.parse_args()
+
+    m = random_portfolio(args.scenarios)
+    m.simulate_years(1, seed=0)  # Warm up lazily built distributions before timing
+    print('{} scenarios x {} years, {} CPUs'.format(args.scenarios, args.years, cpus))
+    print('{:>8} {:>10} {:>8}'.format('workers', 'seconds', 'speedup'))
+    baseline_time = baseline = None
+    for workers in args.workers:
+        start = time.perf_counter()
+        result = m.simulate_years(args.years, seed=1, workers=workers)
+        elapsed = time.perf_counter() - start
+        if baseline is None:
+            baseline_time, baseline = elapsed, result
+        elif not np.array_equal(result, baseline):
+            raise AssertionError('{} workers did not reproduce the baseline result'.format(workers))
+        print('{:>8} {:>10.3f} {:>8.2f}'.format(workers, elapsed, baseline_time / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+"""Benchmark suite for the simulation hot paths, with saved baselines and a regression check.
+
+Usage: python benchmarks/bench_suite.py [--scenarios 10 100 ...] [--years 1000 10000 ...]
+                                        [--max-cells N] [--filter TEXT] [--repeat N]
+                                        [--save FILE] [--compare FILE] [--threshold 0.2]
+
+Every case is set up, run once to warm up, timed (best of --repeat runs), then run under
+tracemalloc for its peak traced memory; numpy reports its array allocations to
+tracemalloc, so this is the peak of the arrays a case allocates. The import time of
+riskquant is measured in a fresh interpreter. Portfolio cases are skipped when
+scenarios x years exceeds --max-cells.
+
+--save writes the results as JSON. --compare checks them against a saved baseline and
+exits with status 1 if any case got slower, or used more memory, by more than the
+threshold (timing differences under a millisecond are ignored as noise). Nothing needs
+network access.
+
+benchmarks/baseline.json is a baseline of the default cases, saved on the machine described
+in its 'environment' (a single CPU). Every case runs in one process, so it says nothing about
+speedups with workers; see bench_parallel.py for those, on a machine with several cores.
+Timings only compare on similar hardware, so save a fresh baseline before a change on any
+other machine and compare against that.
+
+The benchmarks import riskquant from this checkout, so they run without installing it.
+"""
+
+#   Copyright 2019-2020 Netflix, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from argparse import ArgumentParser
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # This checkout's riskquant
+
+from benchmarks.bench_parallel import random_portfolio  # noqa: E402
+import numpy as np  # noqa: E402
+import riskquant  # noqa: E402
+from riskquant import simpleloss  # noqa: E402
+from riskquant.model import pert_frequency  # noqa: E402
+
+
+# Timing differences below this many seconds are not reported as regressions.
+NOISE_SECONDS = 0.001
+
+
+def _simulate_loss(years):
+    loss = simpleloss.SimpleLoss('L', 'benchmark', 0.5, 1000, 1000000)
+    return lambda: loss.simulate_years(years, rng=1)
+
+
+def _draw_pert(years):
+    frequency = pert_frequency.PERTFrequency(0.1, 0.9, 0.3, 4)
+    return lambda: frequency.draw(years, rng=1)
+
+
+def _simulate_portfolio(scenarios, years):
+    m = random_portfolio(scenarios)
+    return lambda: m.simulate_years(years, seed=1)
+
+
+def _plot_lec(scenarios, years, directory):
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib import pyplot as plt
+    m = random_portfolio(scenarios)
+    savefile = os.path.join(directory, 'lec.png')
+
+    def run():
+        m.loss_exceedance_curve(years, savefile=savefile, seed=1)
+        plt.close('all')
+    return run
+
+
+def _run_main(scenarios, directory):
+    register = os.path.join(directory, 'register_{}.csv'.format(scenarios))
+    with open(register, 'w') as f:
+        for i, loss in enumerate(random_portfolio(scenarios).loss_list):
+            f.write('L{},scenario {},{:.17g},{:.17g},{:.17g}\n'.format(i, i, loss.frequency, loss.low_loss, loss.high_loss))
+    return lambda: riskquant.main(['--file', register])
+
+
+def cases(scenarios, years, max_cells, directory):
+    """:return List of (name, setup) benchmark cases. setup() returns the function to time."""
+    result = []
+    for n in years:
+        result.append(('Loss.simulate_years[years={}]'.format(n), lambda n=n: _simulate_loss(n)))
+        result.append(('PERTFrequency.draw[years={}]'.format(n), lambda n=n: _draw_pert(n)))
+    for k in scenarios:
+        result.append(('main[scenarios={}]'.format(k), lambda k=k: _run_main(k, directory)))
+        for n in years:
+            if k * n > max_cells:
+                continue
+            size = '[scenarios={},years={}]'.format(k, n)
+            result.append(('MultiLoss.simulate_years' + size, lambda k=k, n=n: _simulate_portfolio(k, n)))
+            result.append(('MultiLoss.loss_exceedance_curve' + size, lambda k=k, n=n: _plot_lec(k, n, directory)))
+    return result
+
+
+def measure(setup, repeat):
+    """:return Dictionary of the best wall time in seconds, and the peak traced memory in bytes"""
+    run = setup()
+    best = float('inf')
+    with contextlib.redirect_stderr(io.StringIO()):  # Keep progress messages out of the table
+        run()  # Warm up: lazy imports and distributions are set up on first use
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            best = min(best, time.perf_counter() - start)
+        tracemalloc.start()
+        try:
+            run()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return {'seconds': best, 'peak_bytes': peak}
+
+
+def measure_import(repeat):
+    """:return Dictionary of the best cumulative import time of riskquant in a fresh interpreter"""
+    best = float('inf')
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import riskquant'],
+                                stderr=subprocess.PIPE, universal_newlines=True, check=True,
+                                cwd=os.path.dirname(os.path.dirname(riskquant.__file__)))
+        for line in result.stderr.splitlines():
+            fields = line[len('import time:'):].split('|')
+            if line.startswith('import time:') and len(fields) == 3 and fields[2].strip() == 'riskquant':
+                best = min(best, int(fields[1]) / 1e6)
+    return {'seconds': best, 'peak_bytes': None}
+
+
+def compare(results, baseline, threshold):
+    """:return List of messages, one for each metric that regressed beyond the threshold"""
+    regressions = []
+    for name, result in results.items():
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        for metric, slack in (('seconds', NOISE_SECONDS), ('peak_bytes', 0)):
+            now, then = result.get(metric), before.get(metric)
+            if now is not None and then is not None and now > then * (1 + threshold) + slack:
+                regressions.append('{}: {} {:.4g} -> {:.4g} ({:+.0%})'.format(name, metric, then, now, now / then - 1))
+    return regressions
+
+
+def environment():
+    return {'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count()}
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenarios', type=int, nargs='+', default=[10, 100, 1000, 10000])
+    parser.add_argument('--years', type=int, nargs='+', default=[1000, 10000, 100000, 1000000, 10000000])
+    parser.add_argument('--max-cells', type=float, default=1e8,
+                        help='skip portfolio cases with more than this many scenarios x years')
+    parser.add_argument('--filter', help='only run cases whose name contains this text')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--save', metavar='FILE', help='write the results to this JSON file')
+    parser.add_argument('--compare', metavar='FILE', help='check the results against this saved baseline')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative slowdown or memory growth reported as a regression')
+    args = parser.parse_args()
+
+    results = {}
+    print('{:<64} {:>10} {:>10}'.format('case', 'seconds', 'peak MB'))
+    with tempfile.TemporaryDirectory() as directory:
+        suite = [('import riskquant', lambda: None)] + cases(args.scenarios, args.years, args.max_cells, directory)
+        for name, setup in suite:
+            if args.filter and args.filter not in name:
+                continue
+            results[name] = measure_import(args.repeat) if name == 'import riskquant' else measure(setup, args.repeat)
+            peak = results[name]['peak_bytes']
+            print('{:<64} {:>10.4f} {:>10}'.format(name, results[name]['seconds'],
+                                                   '-' if peak is None else '{:.1f}'.format(peak / 2 ** 20)))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'environment': environment(), 'results': results}, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print('REGRESSION ' + regression)
+        if regressions:
+            sys.exit(1)
+        print('No regressions beyond {:.0%} against {}'.format(args.threshold, args.compare))
+
+
+if __name__ == '__main__':
+    main()
@@ -15,11 +15,17 @@
 #   limitations under the License.
 
 from argparse import ArgumentParser
+from contextlib import contextmanager
 import csv
+import gc
 import os
 import sys
 
+import numpy as np
+from riskquant import cache
 from riskquant import multiloss
+from riskquant import portfolio
+from riskquant import profiling
 from riskquant import simpleloss
 
 
@@ -29,24 +35,102 @@ __version__ = '1.0.4'
 NAME_VERSION = '%s %s' % (__appname__, __version__)
 
 
+# Number of problems listed in the error for an invalid register file.
+MAX_REPORTED_ROWS = 100
+
+
+def csv_to_arrays(file):
+    """Read a csv file of SimpleLoss parameters into arrays, validating every row at once.
+
+    :arg: file = Name of CSV file to read. Each row should contain
+                 label, name, probability, low_loss, high_loss
+
+    :returns: Tuple (labels, names, frequency, low_loss, high_loss) of two lists of
+              strings and three numpy arrays, one entry per row.
+    :raises: ValueError listing the bad rows, if any row is malformed or out of range.
+    """
+    with open(file, 'r', newline='\n') as csvfile, _gc_paused():
+        rows = list(csv.reader(csvfile))
+    return rows_to_arrays(rows, file)
+
+
+def rows_to_arrays(rows, source='rows'):
+    """Validate rows of SimpleLoss parameters and convert them to arrays, as csv_to_arrays.
+
+    :arg: rows = List of rows, each a sequence of label, name, probability, low_loss, high_loss
+                 strings. Empty rows are skipped.
+          [source] = Name of the rows in the error message, e.g. the file they were read from.
+
+    :returns: Tuple (labels, names, frequency, low_loss, high_loss), as csv_to_arrays.
+    :raises: ValueError listing the bad rows (numbered from 1), if any row is malformed or out of range.
+    """
+    with _gc_paused():
+        errors = [(line_number, 'expected 5 fields, found {}'.format(len(row)))
+                  for line_number, row in enumerate(rows, 1) if row and len(row) != 5]
+        line_numbers = np.array([line_number for line_number, row in enumerate(rows, 1) if len(row) == 5],
+                                dtype=np.int64)
+        columns = list(zip(*[row for row in rows if len(row) == 5])) or [()] * 5
+        labels, names = list(columns[0]), list(columns[1])
+    frequency, low_loss, high_loss = (_parse_floats(column) for column in columns[2:])
+
+    with np.errstate(invalid='ignore'):
+        checks = [(np.isnan(frequency) | np.isnan(low_loss) | np.isnan(high_loss), 'values must be numbers'),
+                  (frequency < 0, 'probability must be non-negative'),
+                  (low_loss <= 0, 'low loss must be positive'),
+                  (high_loss <= low_loss, 'high loss must exceed low loss')]
+    for bad, message in checks:
+        errors += [(line_number, message) for line_number in line_numbers[bad].tolist()]
+    if errors:
+        listed = ['line {}: {}'.format(*error) for error in sorted(errors)[:MAX_REPORTED_ROWS]]
+        raise ValueError("{} has {} invalid values:\n{}".format(source, len(errors), "\n".join(listed)))
+    return labels, names, frequency, low_loss, high_loss
+
+
+@contextmanager
+def _gc_paused():
+    """Pause the cyclic garbage collector, which would otherwise scan the growing lists of
+    rows and columns again and again while a large file is read. They hold no reference cycles."""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _parse_floats(strings):
+    """Convert a list of strings to a float array, with NaN for any that are not numbers."""
+    try:
+        return np.array(strings, dtype=float)
+    except ValueError:
+        pass
+    values = np.full(len(strings), np.nan)
+    for i, string in enumerate(strings):
+        try:
+            values[i] = float(string)
+        except ValueError:
+            continue
+    return values
+
+
 def csv_to_simpleloss(file):
     """Convert a csv file with parameters to SimpleModel objects
 
     :arg: file = Name of CSV file to read. Each row should contain rows with
-                 name, probability, low_loss, high_loss
+                 label, name, probability, low_loss, high_loss
 
     :returns: List of SimpleLoss objects
+    :raises: ValueError listing the bad rows (see csv_to_arrays)
     """
+    return _arrays_to_simpleloss(csv_to_arrays(file))
 
-    loss_list = []
-    with open(file, 'r', newline='\n') as csvfile:
-        loss_reader = csv.reader(csvfile)
-        for label, name, p, low_loss, high_loss in loss_reader:
-            label: str
-            name: str
-            loss_list += [simpleloss.SimpleLoss(
-                label, name, float(p), float(low_loss), float(high_loss))]
-    return loss_list
+
+def _arrays_to_simpleloss(columns):
+    """:arg: columns = Tuple (labels, names, frequency, low_loss, high_loss) from csv_to_arrays"""
+    labels, names, frequency, low_loss, high_loss = columns
+    return [simpleloss.SimpleLoss(label, name, p, low, high) for label, name, p, low, high
+            in zip(labels, names, frequency.tolist(), low_loss.tolist(), high_loss.tolist())]
 
 
 def _sigdigs(number, digits):
@@ -55,11 +139,88 @@ def _sigdigs(number, digits):
           digits = How many significant digits to keep
     :returns: A formatted currency string rounded to 'digits' significant digits.
               Example: _sigdigs(1234.56, 3) returns $1,230"""
-    float_format = "{:." + str(digits) + "g}"
-    return "${:,.0f}".format(float(float_format.format(number)))
+    return _sigdigs_array([number], digits)[0]
+
+
+def _sigdigs_array(numbers, digits):
+    """Vectorized _sigdigs: the rounding is done with numpy, only the final formatting per value.
+    :returns: List of formatted currency strings"""
+    numbers = np.asarray(numbers, dtype=float)
+    nonzero = numbers != 0
+    exponent = np.floor(np.log10(np.abs(numbers), out=np.zeros_like(numbers), where=nonzero))
+    scale = 10.0 ** (int(digits) - 1 - exponent)
+    rounded = np.round(numbers * scale) / scale
+    return list(map("${:,.0f}".format, rounded.tolist()))
+
+
+def _write_prioritized(output, labels, names, annualized_losses, digits):
+    """Write the scenarios to a csv file in descending order of annualized loss."""
+    order = np.argsort(-annualized_losses, kind='stable')
+    formatted = _sigdigs_array(annualized_losses[order], digits)
+    with open(output, 'w') as csvfile:
+        writer = csv.writer(csvfile, quoting=csv.QUOTE_MINIMAL)
+        writer.writerows(zip([labels[i] for i in order], [names[i] for i in order], formatted))
+
+
+def _write_tail_contributions(output, labels, names, annualized_losses, report, digits):
+    """Write each scenario's contribution to the tail (see riskquant.yearloss.tail_contributions)
+    to a csv file with a header, in descending order of contribution at the highest level."""
+    contribution, without = report['contribution'], report['value_at_risk_without']
+    order = np.argsort(-contribution[:, -1], kind='stable')
+    percents = ['{:g}%'.format(100 * level) for level in report['levels'].tolist()]
+    columns = [[labels[i] for i in order], [names[i] for i in order], _sigdigs_array(annualized_losses[order], digits)]
+    header = ['Identifier', 'Name', 'Annualized loss']
+    for i, percent in enumerate(percents):
+        columns.append(_sigdigs_array(contribution[order, i], digits))
+        columns.append(_sigdigs_array(report['value_at_risk'][i] - without[order, i], digits))
+        header += ['Contribution to {} TVaR'.format(percent), '{} VaR change without'.format(percent)]
+    with open(output, 'w') as csvfile:
+        writer = csv.writer(csvfile, quoting=csv.QUOTE_MINIMAL)
+        writer.writerow(header)
+        writer.writerows(zip(*columns))
+
+
+def _run_file(args, simulation_cache):
+    """Prioritize the scenarios of args.file, and simulate them if a table or plot was requested.
+    Prioritizing works on the parameter arrays; SimpleLoss objects are only built to simulate."""
+    started = profiling.start()
+    columns = csv_to_arrays(args.file)
+    labels, names, frequency, low_loss, high_loss = columns
+    started = profiling.record('read register', started, size=len(labels))
+    path, ext = os.path.splitext(args.file)
+    output = path + '_prioritized' + ext
+    sys.stderr.write("Writing prioritized threats to:\n{}\n".format(output))
+    annualized_losses = portfolio.SimpleLossPortfolio.from_ranges(frequency, low_loss, high_loss).annualized_losses()
+    _write_prioritized(output, labels, names, annualized_losses, args.sigdigs)
+    started = profiling.record('prioritize', started, size=len(labels))
+    if not (args.year_loss_table or args.tail_contributions or args.plot):
+        return
+    m = multiloss.MultiLoss(_arrays_to_simpleloss(columns), cache=simulation_cache)
+    profiling.record('build losses', started, size=len(labels))
+    table = None
+    if args.year_loss_table:
+        sys.stderr.write("Writing year-loss table to:\n{}\n".format(args.year_loss_table))
+        table = m.write_year_loss_table(args.year_loss_table, args.years, seed=args.seed, workers=args.workers)
+    if args.tail_contributions:
+        output = path + '_tail_contributions' + ext
+        sys.stderr.write("Writing tail contributions to:\n{}\n".format(output))
+        if table is not None:
+            report = table.tail_contributions()
+        else:
+            report = m.tail_contributions(args.years, seed=args.seed, workers=args.workers)
+        _write_tail_contributions(output, labels, names, annualized_losses, report, args.sigdigs)
+    if args.plot:
+        m.loss_exceedance_curve(args.years, savefile=path + '.png', seed=args.seed,
+                                workers=args.workers, streaming=args.streaming, analytic=args.analytic,
+                                tolerance=args.tolerance, variance_reduction=args.variance_reduction, qmc=args.qmc)
 
 
 def main(args=None):
+    arguments = sys.argv[1:] if args is None else args
+    if arguments[:1] == ['serve']:
+        from riskquant import server
+        return server.main(arguments[1:])
+
     parser = ArgumentParser(args)
 
     parser.add_argument('--file', metavar='FILE', help='CSV of scenario name and parameters')
@@ -68,41 +229,73 @@ def main(args=None):
 
     parser.add_argument('--years', help='number of years to simulate', type=int)
     parser.add_argument('--sigdigs', help='number of significant digits in output values')
+    parser.add_argument('--seed', help='random seed, for reproducible simulations', type=int)
+    parser.add_argument('--workers', help='number of worker processes for simulations', type=int)
 
     parser.add_argument('--plot', dest='plot', action='store_true')
+    parser.add_argument('--streaming', action='store_true',
+                        help='simulate the plotted LEC in bounded memory, from a quantile sketch')
+    parser.add_argument('--analytic', action='store_true',
+                        help='compute the plotted LEC with the analytic compound Poisson engine instead of simulating')
+    parser.add_argument('--tolerance', type=float,
+                        help='simulate the plotted LEC only until its tail quantiles are within this relative '
+                             'error, with --years as the most years')
+    parser.add_argument('--variance-reduction', choices=multiloss.VARIANCE_REDUCTION_METHODS,
+                        help='simulate the plotted LEC with stratified or importance sampling, for more accurate tails')
+    parser.add_argument('--qmc', action='store_true',
+                        help='simulate the plotted LEC by quasi-Monte Carlo, from scrambled Sobol sequences; each replicate is rounded up to a power of 2 years')
+    parser.add_argument('--year-loss-table', metavar='DIR',
+                        help='simulate and save every scenario\'s year losses to this directory')
+    parser.add_argument('--tail-contributions', action='store_true',
+                        help='simulate and write each scenario\'s contribution to the 95%% and 99%% tail years to a CSV')
+    parser.add_argument('--no-cache', dest='cache', action='store_false',
+                        help='don\'t re-use or save seeded simulations in the simulation cache')
+    parser.add_argument('--cache-dir', metavar='DIR',
+                        help='simulation cache directory [default {}]'.format(cache.default_directory()))
+    parser.add_argument('--profile', metavar='FILE',
+                        help='write the time, calls, events and array sizes of each phase to this JSON file')
 
     parser.set_defaults(plot=False,
                         years=100000,
-                        sigdigs=3)
+                        sigdigs=3,
+                        cache=True)
 
     if args:
         args = parser.parse_args(args)
     else:
         args = parser.parse_args()
+    modes = [flag for flag, value in (('--streaming', args.streaming), ('--analytic', args.analytic),
+                                      ('--tolerance', args.tolerance is not None),
+                                      ('--variance-reduction', args.variance_reduction), ('--qmc', args.qmc)) if value]
+    if len(modes) > 1:
+        parser.error("only one of {} can be used at a time".format(', '.join(modes)))
 
-    if args.file:
-        loss_list = csv_to_simpleloss(args.file)
+    if args.profile:
+        with profiling.Profile() as profile:
+            _run(args)
+        sys.stderr.write("Writing profile to:\n{}\n".format(args.profile))
+        profile.write_json(args.profile)
     else:
-        loss_list = None
+        _run(args)
+    return 0
 
-    m = multiloss.MultiLoss(loss_list)
-    priorities = m.prioritized_losses()
+
+def _run(args):
+    """Run the CLI with parsed arguments."""
+    simulation_cache = None
+    if args.cache and args.seed is not None:
+        simulation_cache = cache.SimulationCache(directory=args.cache_dir or cache.default_directory())
     if args.file:
-        path, ext = os.path.splitext(args.file)
-        output = path + '_prioritized' + ext
-        sys.stderr.write("Writing prioritized threats to:\n{}\n".format(output))
-        with open(output, 'w') as csvfile:
-            writer = csv.writer(csvfile, quoting=csv.QUOTE_MINIMAL)
-            for label, name, annualized_loss in priorities:
-                writer.writerow([label, name, _sigdigs(annualized_loss, args.sigdigs)])
-        if args.plot:
-            m.loss_exceedance_curve(args.years, savefile=path + '.png')
+        _run_file(args, simulation_cache)
     else:
-        print("\n".join([str(x) for x in priorities]))
+        m = multiloss.MultiLoss(None, cache=simulation_cache)
+        print("\n".join([str(x) for x in m.prioritized_losses()]))
         if args.plot:
-            m.loss_exceedance_curve(args.years)
-
-    return 0
+            m.loss_exceedance_curve(args.years, seed=args.seed, workers=args.workers,
+                                    streaming=args.streaming, analytic=args.analytic, tolerance=args.tolerance,
+                                    variance_reduction=args.variance_reduction, qmc=args.qmc)
+    if simulation_cache is not None and simulation_cache.hits + simulation_cache.misses:
+        sys.stderr.write("Simulation cache: {hits} hits, {misses} misses\n".format(**simulation_cache.stats()))
 
 
 if __name__ == '__main__':
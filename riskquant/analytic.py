@@ -0,0 +1,272 @@
+"""Deterministic annual aggregate loss distributions for Poisson x lognormal portfolios.
+
+A sum of independent compound Poisson losses is itself compound Poisson, with the
+total rate and the rate-weighted mixture of the magnitude distributions. The
+mixture is discretized on grids of step h and the aggregate distribution is
+computed with an FFT (with exponential tilting to suppress wrap-around), so no
+years are simulated and the result has no sampling noise.
+
+One grid can't be fine enough for the middle of the distribution and long enough
+for its tail, so there is a ladder of grids: the finest step is a small fraction of
+the median magnitude, each grid's step is GRID_RATIO times the previous one's, and
+the last grid reaches max_loss. Magnitudes beyond a grid's end are left out of its
+aggregate rather than moved onto the grid: a year with one of them exceeds the end,
+so the aggregate distribution below the end is exact (up to the discretization).
+Each quantile is read from the finest grid that reaches it.
+
+The discretization error is stated, not estimated: the magnitudes are also
+discretized downward (to the grid point below) and upward (to the grid point
+above). Those aggregates are stochastically smaller and larger than the true one,
+so their quantiles bound the true quantile (up to the tail_probability beyond the last grid).
+"""
+
+#   Copyright 2019-2020 Netflix, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import numpy as np
+from riskquant import portfolio
+
+
+# Number of points each grid discretizes the magnitude distribution on.
+DEFAULT_GRID_SIZE = 2 ** 16
+
+# The finest grid's step is at most the median magnitude divided by this.
+DEFAULT_STEPS_PER_MEDIAN = 2 ** 10
+
+# Each grid's step is this many times the previous one's.
+GRID_RATIO = 2 ** 5
+
+# Most grids in the ladder. The finest step is coarsened to stay within it.
+MAX_GRIDS = 6
+
+# The last grid reaches far enough that on average fewer than this many magnitudes per year
+# exceed it, so quantiles up to about 1 - tail_probability are reliable.
+DEFAULT_TAIL_PROBABILITY = 1e-6
+
+# Exponential tilt over the FFT length: wrapped-around mass is damped by exp(-_TILT).
+_TILT = 10.
+
+# Standard normal quantile beyond which a lognormal's CDF is taken to be 0 or 1. The mass
+# this moves (Phi(-6) ~ 1e-9 of each magnitude) is far below DEFAULT_TAIL_PROBABILITY.
+_Z_CUTOFF = 6.
+
+# Where grid points are closer than this in log(magnitude), the mixture CDF is interpolated
+# (cubic Hermite, in log(magnitude)) between exact values this far apart. It is also at most
+# the smallest sigma / _LOG_STEPS_PER_SIGMA, which keeps the interpolation error of each
+# lognormal's CDF below 1.38 / (384 * _LOG_STEPS_PER_SIGMA ** 4) ~ 2e-8.
+_LOG_STEP = 0.02
+_LOG_STEPS_PER_SIGMA = 20.
+
+
+class AggregateDistribution(object):
+    def __init__(self, grids, mean):
+        """The distribution of the annual aggregate loss, on a ladder of grids.
+
+        :param grids = List of (step, pmf, lower_pmf, upper_pmf), finest first, each on the grid
+                       0, step, 2 * step, ... of twice its magnitude grid's size. pmf has each
+                       magnitude rounded to the nearest point, lower_pmf and upper_pmf have them
+                       rounded down and up. Magnitudes beyond the magnitude grid are left out of
+                       pmf and upper_pmf, and moved to its end in lower_pmf, except that the
+                       last grid covers every quantile of pmf it reaches.
+        :param mean = Mean of the aggregate annual loss
+        """
+        self._grids = []
+        for i, (step, pmf, lower_pmf, upper_pmf) in enumerate(grids):
+            end = pmf.size - 1 if i == len(grids) - 1 else pmf.size // 2 - 1  # Last exact point of pmf
+            self._grids.append((step, end, np.cumsum(pmf), np.cumsum(lower_pmf), np.cumsum(upper_pmf)))
+        self._mean = mean
+
+    def _quantiles(self, which, q, exact):
+        """:return Array of the quantiles at q of one cdf (2 nearest, 3 lower, 4 upper) on each grid,
+        inf where the grid doesn't reach them (or only beyond its exact part, with exact)"""
+        q = np.asarray(q, dtype=float)
+        result = []
+        for grid in self._grids:
+            step, end, cdf = grid[0], grid[1], grid[which]
+            index = np.searchsorted(cdf, q, side='left')
+            result.append(np.where(index <= (end if exact else cdf.size - 1), index * step, np.inf))
+        return np.array(result)
+
+    def quantile(self, q):
+        """:param q = Quantile or array of quantiles in [0, 1]
+        :return The aggregate annual loss at q (within the quantile_bounds), from the finest grid
+                that reaches it, or inf beyond the last grid"""
+        quantiles = self._quantiles(2, q, exact=True)
+        finest = np.argmax(np.isfinite(quantiles), axis=0)
+        return np.take_along_axis(quantiles, finest[np.newaxis], axis=0)[0]
+
+    def quantile_bounds(self, q):
+        """:return Tuple (lower, upper) of arrays that bound the true quantile(s) at q"""
+        lower = self._quantiles(3, q, exact=False)
+        lower[np.isinf(lower)] = 0.
+        return lower.max(axis=0), self._quantiles(4, q, exact=False).min(axis=0)
+
+    def exceedance_probability(self, losses):
+        """:return The probability that the aggregate annual loss exceeds each of losses"""
+        losses = np.asarray(losses, dtype=float)
+        step, end, cdf, _, _ = self._grids[-1]
+        result = np.array(1. - cdf[np.clip(np.floor(losses / step), 0, end).astype(np.int64)])
+        for step, end, cdf, _, _ in reversed(self._grids[:-1]):  # Finer grids overwrite coarser ones
+            index = np.floor(losses / step)
+            within = index <= end
+            result[within] = 1. - cdf[np.maximum(index[within], 0).astype(np.int64)]
+        return result[()]
+
+    def exceedance_curve(self, probs=None):
+        """Loss Exceedance Curve data, as MultiLoss.exceedance_curve.
+
+        :returns: Tuple (losses, probs) of numpy arrays."""
+        if probs is None:
+            from riskquant import multiloss
+            probs = multiloss.DEFAULT_EXCEEDANCE_PROBS
+        probs = np.asarray(probs, dtype=float)
+        return self.quantile(1. - probs), probs
+
+    def mean(self):
+        return self._mean
+
+
+def aggregate_distribution(losses, grid_size=DEFAULT_GRID_SIZE, tail_probability=DEFAULT_TAIL_PROBABILITY,
+                           max_loss=None, step=None):
+    """Compute the annual aggregate loss distribution of independent Poisson x lognormal losses.
+
+    :arg: losses = A riskquant.portfolio.SimpleLossPortfolio, or a list of losses that it
+                   supports (e.g. SimpleLoss). A single loss is a list of one.
+          [grid_size] = Number of points of each magnitude grid. The aggregate is computed
+                        on twice as many. Each magnitude is moved by at most half a step.
+          [tail_probability] = Sets the end of the last grid (see DEFAULT_TAIL_PROBABILITY).
+          [max_loss] = End of the last grid, instead of deriving it from tail_probability.
+          [step] = Step of the finest grid, instead of the median magnitude divided by
+                   DEFAULT_STEPS_PER_MEDIAN. The grids' steps are GRID_RATIO apart.
+
+    :returns: An AggregateDistribution."""
+    if not isinstance(losses, portfolio.SimpleLossPortfolio):
+        losses = portfolio.SimpleLossPortfolio.from_losses(losses)
+    active = losses.frequency > 0
+    frequency, mu, sigma = losses.frequency[active], losses.mu[active], losses.sigma[active]
+    rate = float(frequency.sum())
+    mean = float(np.dot(frequency, np.exp(mu + sigma ** 2 / 2.)))
+    if rate == 0:
+        pmf = _compound_poisson(np.zeros(grid_size), 0.)
+        return AggregateDistribution([(1., pmf, pmf, pmf)], mean)
+    if max_loss is None:
+        max_loss = _default_max_loss(frequency, mu, sigma, tail_probability)
+    last_step = max_loss / (grid_size - 1)
+    if step is None:
+        step = np.exp(_log_magnitude_quantile(frequency, mu, sigma, rate / 2.)) / DEFAULT_STEPS_PER_MEDIAN
+    finer = int(np.ceil(np.log(last_step / step) / np.log(GRID_RATIO))) if step < last_step else 0
+    steps = last_step / float(GRID_RATIO) ** np.arange(min(finer, MAX_GRIDS - 1), -1, -1)
+    mixture = _MixtureCDF(frequency, mu, sigma, steps[0] / 2., max_loss)
+    return AggregateDistribution([_grid(h, grid_size, mixture, rate) for h in steps], mean)
+
+
+def _grid(step, grid_size, mixture, rate):
+    """:return Tuple (step, pmf, lower_pmf, upper_pmf) of the aggregate on one grid (see AggregateDistribution)"""
+    # Mixture CDF at every half step: the grid points are the even entries.
+    cdf = mixture.at_multiples(step / 2., 2 * grid_size - 1)
+    points, midpoints = cdf[0::2], cdf[1::2]
+    nearest = np.diff(midpoints, prepend=0., append=points[-1])
+    down = np.diff(points, append=rate)  # Magnitudes beyond the grid go to its end
+    up = np.diff(points, prepend=0.)
+    return (step,) + tuple(_compound_poisson(masses, rate) for masses in (nearest, down, up))
+
+
+def _default_max_loss(frequency, mu, sigma, tail_probability):
+    """A grid end beyond which fewer than tail_probability magnitudes fall per year on average,
+    and which is well past the bulk (mean + 10 standard deviations) of the aggregate."""
+    mean = np.dot(frequency, np.exp(mu + sigma ** 2 / 2.))
+    second_moment = np.dot(frequency, np.exp(2. * mu + 2. * sigma ** 2))
+    return float(max(np.exp(_log_magnitude_quantile(frequency, mu, sigma, tail_probability)),
+                     mean + 10. * np.sqrt(second_moment)))
+
+
+def _log_magnitude_quantile(frequency, mu, sigma, rate_above):
+    """The log of the magnitude that on average rate_above magnitudes per year exceed."""
+    from scipy.special import ndtr
+    low, high = (mu - 10. * sigma).min(), (mu + 10. * sigma).max()
+    for _ in range(60):  # Bisect
+        middle = (low + high) / 2.
+        if np.dot(frequency, ndtr((mu - middle) / sigma)) > rate_above:
+            low = middle
+        else:
+            high = middle
+    return high
+
+
+class _MixtureCDF(object):
+    def __init__(self, frequency, mu, sigma, smallest_step, largest):
+        """The sum of frequency[i] * (CDF of lognormal i), for grids of steps from smallest_step
+        up to points at largest.
+
+        Beyond the points closer than the log_step (_LOG_STEP, or the smallest sigma /
+        _LOG_STEPS_PER_SIGMA) in log(magnitude), it is interpolated between exact values that
+        far apart, from the CDF and its derivative (the lognormal densities)."""
+        self.frequency, self.mu, self.sigma = frequency, mu, sigma
+        self.log_step = min(_LOG_STEP, sigma.min() / _LOG_STEPS_PER_SIGMA)
+        self.exact = int(1. / np.expm1(self.log_step)) + 2  # log(k + 1) - log(k) < log_step from here on
+        first, last = np.log((self.exact - 1) * smallest_step), np.log(max(largest, self.exact * smallest_step))
+        self.knots = np.linspace(first, last, int(np.ceil((last - first) / self.log_step)) + 1)
+        self.values, self.slopes = _exact_mixture_cdf(self.knots, frequency, mu, sigma, slopes=True)
+
+    def at_multiples(self, step, size):
+        """:return The sum at 0, step, ..., (size - 1) * step"""
+        exact = min(size, self.exact)
+        log_points = np.full(exact, -np.inf)
+        log_points[1:] = np.log(np.arange(1, exact) * step)
+        cdf = np.empty(size)
+        cdf[:exact] = _exact_mixture_cdf(log_points, self.frequency, self.mu, self.sigma)
+        if exact < size:
+            cdf[exact:] = self._interpolate(np.log(np.arange(exact, size) * step))
+        return cdf
+
+    def _interpolate(self, log_points):
+        """Cubic Hermite interpolation between the knots"""
+        width = self.knots[1] - self.knots[0]
+        index = np.clip(((log_points - self.knots[0]) / width).astype(np.int64), 0, self.knots.size - 2)
+        t = np.clip((log_points - self.knots[index]) / width, 0., 1.)
+        t2, t3 = t * t, t * t * t
+        start = (2. * t3 - 3. * t2 + 1.) * self.values[index] + (t3 - 2. * t2 + t) * width * self.slopes[index]
+        end = (-2. * t3 + 3. * t2) * self.values[index + 1] + (t3 - t2) * width * self.slopes[index + 1]
+        return start + end
+
+
+def _exact_mixture_cdf(log_points, frequency, mu, sigma, slopes=False):
+    """The sum of frequency[i] * (CDF of lognormal i) at increasing log(magnitude) points,
+    and with slopes, also its derivative with respect to log(magnitude).
+
+    Each lognormal is only evaluated within _Z_CUTOFF standard deviations of its log-mean."""
+    from scipy.special import ndtr
+    low = np.searchsorted(log_points, mu - _Z_CUTOFF * sigma)
+    high = np.searchsorted(log_points, mu + _Z_CUTOFF * sigma)
+    cdf = np.zeros(log_points.size)
+    derivative = np.zeros(log_points.size)
+    saturated = np.zeros(log_points.size + 1)  # Rate of the lognormals whose CDF is 1 from each point on
+    for i in range(frequency.size):
+        z = (log_points[low[i]:high[i]] - mu[i]) / sigma[i]
+        cdf[low[i]:high[i]] += frequency[i] * ndtr(z)
+        if slopes:
+            derivative[low[i]:high[i]] += frequency[i] / (sigma[i] * np.sqrt(2. * np.pi)) * np.exp(-z * z / 2.)
+        saturated[high[i]] += frequency[i]
+    cdf += np.cumsum(saturated)[:-1]
+    return (cdf, derivative) if slopes else cdf
+
+
+def _compound_poisson(masses, rate):
+    """Aggregate pmf of a Poisson(rate) number of events, each at grid point k with
+    probability masses[k] / rate, on a grid twice as long as masses."""
+    size = 2 * masses.size
+    tilt = np.exp(-_TILT / size * np.arange(size))
+    transform = np.fft.rfft(np.concatenate([masses, np.zeros(masses.size)]) * tilt)
+    pmf = np.fft.irfft(np.exp(transform - rate), size) / tilt
+    return np.maximum(pmf, 0.)
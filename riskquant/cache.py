@@ -0,0 +1,165 @@
+"""A content-addressed cache of simulated year losses.
+
+Entries are numpy arrays keyed by a hash of everything that determines them (the
+model types and parameters of the losses, the years, the seed and the random
+stream), so an unchanged scenario re-uses its earlier simulation and a changed one
+simply misses. There are two tiers: an in-memory LRU, and an optional on-disk
+directory with a size cap that evicts the least recently used files.
+"""
+
+#   Copyright 2019-2020 Netflix, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+
+# Part of every key. Bump it when a change to the simulation code changes what a key simulates.
+FORMAT_VERSION = 2
+
+
+def default_directory():
+    """The per-user cache directory, $XDG_CACHE_HOME/riskquant or ~/.cache/riskquant."""
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'riskquant')
+
+
+def make_key(*parts):
+    """Hash JSON-serializable parts (ints, floats, strings, lists, dicts) into a hex key.
+    Floats are serialized with repr, so keys distinguish every distinct parameter value."""
+    data = json.dumps([FORMAT_VERSION] + list(parts), sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(data.encode('UTF-8')).hexdigest()
+
+
+class SimulationCache(object):
+    def __init__(self, max_memory_bytes=256 * 2 ** 20, directory=None, max_disk_bytes=2 ** 30):
+        """:param max_memory_bytes = Size cap of the in-memory LRU tier
+        :param directory = Directory of the on-disk tier, or None for memory only
+        :param max_disk_bytes = Size cap of the on-disk tier
+        """
+        self.max_memory_bytes = max_memory_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()  # Concurrent simulations (e.g. riskquant.server) share the cache
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._disk_bytes = sum(size for _, _, size in self._disk_entries())
+
+    def get(self, key):
+        """:return The cached array for key (read-only), or None on a miss"""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+            path = self._path(key)
+            if path and os.path.exists(path):
+                try:
+                    value = np.load(path)
+                except (OSError, ValueError):
+                    value = None  # Unreadable (e.g. evicted by another process mid-read): a miss
+                if value is not None:
+                    os.utime(path)  # Most recently used
+                    self._remember(key, value)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return value
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        """Store an array under key in both tiers."""
+        with self._lock:
+            value = np.asarray(value)
+            self._remember(key, value)
+            path = self._path(key)
+            if path and not os.path.exists(path):
+                # Write to a temporary file and rename, so readers never see a partial entry.
+                fd, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+                with os.fdopen(fd, 'wb') as f:
+                    np.save(f, value)
+                os.replace(temporary, path)
+                self._disk_bytes += os.path.getsize(path)
+                self._evict_disk()
+
+    def stats(self):
+        """:return Dictionary of hit/miss counts and the size of each tier"""
+        with self._lock:
+            return {'hits': self.hits,
+                    'disk_hits': self.disk_hits,
+                    'misses': self.misses,
+                    'memory_entries': len(self._memory),
+                    'memory_bytes': self._memory_bytes,
+                    'disk_bytes': self._disk_bytes}
+
+    def clear(self):
+        """Remove every entry from both tiers."""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            for path, _, _ in self._disk_entries():
+                os.remove(path)
+            self._disk_bytes = 0
+
+    def _remember(self, key, value):
+        if value.nbytes > self.max_memory_bytes:
+            return
+        value.setflags(write=False)  # Callers share the cached array
+        if key in self._memory:
+            self._memory_bytes -= self._memory.pop(key).nbytes
+        self._memory[key] = value
+        self._memory_bytes += value.nbytes
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted.nbytes
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.npy') if self.directory else None
+
+    def _disk_entries(self):
+        """:return List of (path, last use time, size) of the on-disk entries"""
+        if not self.directory:
+            return []
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.npy'):
+                stat = entry.stat()
+                entries.append((entry.path, stat.st_mtime, stat.st_size))
+        return entries
+
+    def _evict_disk(self):
+        if self._disk_bytes <= self.max_disk_bytes:
+            return
+        entries = sorted(self._disk_entries(), key=lambda entry: entry[1])
+        self._disk_bytes = sum(size for _, _, size in entries)
+        for path, _, size in entries:
+            if self._disk_bytes <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue  # Already evicted by another process
+            self._disk_bytes -= size
@@ -16,13 +16,21 @@
 #   limitations under the License.
 
 import numpy as np
-import scipy
+from riskquant import profiling
+from riskquant import qmc as riskquant_qmc
+from riskquant import streams
+
+
+# Number of histogram bins used by summarize_loss to estimate the mode of continuous losses.
+DEFAULT_MODE_BINS = 1000
 
 
 class Loss(object):
     def __init__(self, frequency_model, magnitude_model):
-        """:param frequency_model: A class with method draw(n=1) to draw a list of n int values
-        :param magnitude_model: A class with method draw(n=1) to draw a list of n float values
+        """:param frequency_model: A class with method draw(n=1, rng=None) to draw a list of n int values
+        :param magnitude_model: A class with method draw(n=1, rng=None) to draw a list of n float values
+
+        rng is a numpy Generator to draw from, or None for numpy's global random state.
         """
         self.frequency_model = frequency_model
         self.magnitude_model = magnitude_model
@@ -30,37 +38,143 @@ class Loss(object):
     def annualized_loss(self):
         return self.frequency_model.mean() * self.magnitude_model.mean()
 
-    def simulate_losses_one_year(self):
-        """:return List of zero or more loss magnitudes for a single simulated year"""
-        num_losses = self.frequency_model.draw()[0]  # Draw a single number of events
-        return list(self.magnitude_model.draw(num_losses))
+    def parameters(self):
+        """Describe the models, e.g. to identify simulations in a riskquant.cache.SimulationCache.
+
+        :return Dictionary of the model class names and parameters, or None if a model
+                has no parameters() method."""
+        models = {}
+        for role, model in (('frequency', self.frequency_model), ('magnitude', self.magnitude_model)):
+            if not hasattr(model, 'parameters'):
+                return None
+            models[role] = [type(model).__name__, model.parameters()]
+        return models
 
-    def simulate_years(self, n):
+    def simulate_losses_one_year(self, rng=None):
+        """:param rng = A numpy Generator or seed, or None for numpy's global random state
+        :return List of zero or more loss magnitudes for a single simulated year"""
+        rng = streams.as_generator(rng) if rng is not None else None
+        num_losses = streams.call_with_rng(self.frequency_model.draw, rng=rng)[0]  # Draw a single number of events
+        return list(streams.call_with_rng(self.magnitude_model.draw, num_losses, rng=rng))
+
+    def simulate_years(self, n, vectorized=True, rng=None, dtype=np.float64, out=None, qmc=False):
         """:param n = Number of years to simulate
-        :return A list of length n, each entry is the sum of losses for that simulated year"""
-        num_losses = self.frequency_model.draw(n)  # Draw a list of the number of events in each year
-        loss_values = self.magnitude_model.draw(sum(num_losses))
-        losses = [0] * n
-        losses_used = 0
-        for i in range(n):
-            new_losses = num_losses[i]
-            losses[i] = sum(loss_values[losses_used:losses_used + new_losses])
-            losses_used += new_losses
-        return losses
+        :param vectorized = Sum each year's losses with a single segmented reduction (default).
+                            Set to False to use the reference per-year Python loop.
+        :param rng = A numpy Generator or seed, or None for numpy's global random state
+        :param dtype = Floating point type of the result, e.g. np.float32 to halve its memory.
+                       Each year is summed in float64 before it is stored.
+        :param out = Optional array of length n to write the result into instead of allocating one
+        :param qmc = Draw the years from a scrambled Sobol sequence through the models' ppf methods,
+                     instead of from their draw methods (see riskquant.qmc). rng seeds the scrambling.
+        :return A numpy array of length n, each entry is the sum of losses for that simulated year"""
+        if out is None:
+            out = np.empty(n, dtype=dtype)
+        elif out.shape != (n,):
+            raise AssertionError("out must have shape ({},)".format(n))
+        rng = streams.as_generator(rng) if rng is not None else None
+        scenario = getattr(self, 'label', None)
+        started = profiling.start()
+        if qmc:
+            num_losses, uniforms = self._qmc_events(n, rng)
+            events = int(num_losses.sum())
+            started = profiling.record('frequency draw', started, scenario, events, n)
+            loss_values = np.asarray(self.magnitude_model.ppf(uniforms[:, 0]), dtype=float)
+        else:
+            num_losses = np.asarray(streams.call_with_rng(self.frequency_model.draw, n, rng=rng))  # Number of events in each year
+            events = int(num_losses.sum())
+            started = profiling.record('frequency draw', started, scenario, events, n)
+            loss_values = np.asarray(streams.call_with_rng(self.magnitude_model.draw, events, rng=rng), dtype=float)
+        started = profiling.record('magnitude draw', started, scenario, events, events)
+        if vectorized:
+            out[:] = _sum_by_year(num_losses, loss_values, n)
+        else:
+            losses_used = 0
+            for i in range(n):
+                new_losses = num_losses[i]
+                out[i] = sum(loss_values[losses_used:losses_used + new_losses])
+                losses_used += new_losses
+        profiling.record('aggregation', started, scenario, 0, n)
+        return out
+
+    def _qmc_events(self, n, rng):
+        """:return Arrays (number of events in each of n years, uniform of each event) from a Sobol sequence"""
+        if not (hasattr(self.frequency_model, 'ppf') and hasattr(self.magnitude_model, 'ppf')):
+            raise AssertionError("Quasi-Monte Carlo needs frequency and magnitude models with a ppf method.")
+        num_losses, _, uniforms = riskquant_qmc.event_uniforms(n, self.frequency_model.ppf, rng=rng)
+        return num_losses, uniforms
 
     @staticmethod
-    def summarize_loss(loss_array):
+    def summarize_loss(loss_array, mode_bins=DEFAULT_MODE_BINS):
         """Get statistics about a numpy array.
         Risk is a range of possibilities, not just one outcome.
 
-        :arg: loss_array = Numpy array of simulated losses
-        :returns: Dictionary of statistics about the loss
+        All the order statistics come from one partition-based np.quantile call. The mode of
+        continuous losses is estimated as the mean of the values in the fullest of mode_bins
+        equal-width histogram bins, unless exact zeros (years without loss) are more common.
+
+        :arg: loss_array = Numpy array of simulated losses, or a 2-D array with one row of
+                           simulated losses per scenario to summarize every row at once.
+                           Floating point arrays (e.g. float32) are summarized without a float64 copy.
+              [mode_bins] = Number of histogram bins used to estimate the mode.
+        :returns: Dictionary of statistics about the loss. For a 2-D array, each statistic
+                  is an array with one entry per row.
         """
-        percentiles = np.percentile(loss_array, [10, 50, 90]).astype(int)
-        loss_summary = {'minimum': np.min(loss_array).astype(int),
-                        'tenth_percentile': percentiles[0],
-                        'mode': scipy.stats.mode(loss_array)[0].astype(int),
-                        'median': percentiles[1],
-                        'ninetieth_percentile': percentiles[2],
-                        'maximum': np.max(loss_array).astype(int)}
+        started = profiling.start()
+        losses = np.asarray(loss_array)
+        if not np.issubdtype(losses.dtype, np.floating):
+            losses = losses.astype(float)
+        minimum, tenth, median, ninetieth, maximum = np.quantile(losses, [0., .1, .5, .9, 1.], axis=-1)
+        loss_summary = {'minimum': minimum.astype(int),
+                        'tenth_percentile': tenth.astype(int),
+                        'mode': histogram_mode(losses, minimum, maximum, mode_bins).astype(int),
+                        'median': median.astype(int),
+                        'ninetieth_percentile': ninetieth.astype(int),
+                        'maximum': maximum.astype(int)}
+        profiling.record('summary', started, size=losses.size)
         return loss_summary
+
+
+def _sum_by_year(num_losses, loss_values, n):
+    """Sum consecutive runs of loss_values, one run per year.
+
+    :arg: num_losses = Array of length n with the number of losses in each year
+          loss_values = Array of length sum(num_losses) with every loss, in year order
+          n = Number of years
+
+    :returns: Numpy array of length n with the total loss for each year.
+              bincount accumulates each year's values in order, so the totals
+              are identical to summing each slice in a Python loop."""
+    year_index = np.repeat(np.arange(n), num_losses)
+    return np.bincount(year_index, weights=loss_values, minlength=n)
+
+
+def histogram_mode(losses, minimum, maximum, bins, zeros=0, weights=None):
+    """Estimate the mode of each row of losses (or of a 1-D array) with a histogram.
+    zeros is a number of further zero losses of each row that are not in the array.
+    weights, if given, is an array like losses that counts each loss with its weight.
+
+    :returns: The mean of the values in each row's fullest bin, or 0 where exact zeros
+              outnumber every bin. A scalar for 1-D losses, else an array per row."""
+    rows = losses.reshape(-1, losses.shape[-1])
+    low = np.reshape(minimum, (-1, 1))
+    span = np.reshape(maximum, (-1, 1)) - low
+    scale = np.divide(bins, span, out=np.zeros_like(span), where=span > 0)
+    index = np.minimum(((rows - low) * scale).astype(np.int64), bins - 1)
+    index[rows == 0] = bins  # Exact zeros are counted in their own slot
+    index += np.arange(rows.shape[0])[:, None] * (bins + 1)
+    size = rows.shape[0] * (bins + 1)
+    if weights is None:
+        counts = np.bincount(index.ravel(), minlength=size).reshape(-1, bins + 1)
+        sums = np.bincount(index.ravel(), weights=rows.ravel(), minlength=size).reshape(-1, bins + 1)
+    else:
+        weights = np.reshape(weights, rows.shape)
+        counts = np.bincount(index.ravel(), weights=weights.ravel(), minlength=size).reshape(-1, bins + 1)
+        sums = np.bincount(index.ravel(), weights=(rows * weights).ravel(), minlength=size).reshape(-1, bins + 1)
+    counts[:, bins] += zeros
+    fullest = np.argmax(counts[:, :bins], axis=1)
+    row = np.arange(rows.shape[0])
+    fullest_count = counts[row, fullest]
+    mode = np.where(counts[:, bins] >= fullest_count, 0.,
+                    np.divide(sums[row, fullest], fullest_count, out=np.zeros(row.size), where=fullest_count > 0))
+    return mode.reshape(np.shape(minimum))[()]
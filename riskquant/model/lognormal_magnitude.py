@@ -16,12 +16,25 @@
 #   limitations under the License.
 
 import math
+from statistics import NormalDist
+import weakref
 
-from scipy.stats import norm
-from scipy.stats import lognorm
+import numpy as np
+from riskquant import streams
+
+
+# Scale from a 90% confidence interval width (in log space) to the lognormal's standard deviation.
+# Computed with the standard library so that constructing models does not import scipy.stats.
+_CI_FACTOR = -0.5 / NormalDist().inv_cdf(0.05)
+
+# The LognormalMagnitude of each (class, low_loss, high_loss) handed out by shared(), while in use.
+_shared = weakref.WeakValueDictionary()
 
 
 class LognormalMagnitude(object):
+    # No per-object __dict__: registers can hold hundreds of thousands of magnitudes.
+    __slots__ = ('low_loss', 'high_loss', 'mu', 'sigma', '_scale', '_distribution', '__weakref__')
+
     def __init__(self, low_loss, high_loss):
         """:param  low_loss = Low loss estimate
         :param high_loss = High loss estimate
@@ -39,15 +52,49 @@ class LognormalMagnitude(object):
         self.high_loss = high_loss
         self._setup_lognormal(low_loss, high_loss)
 
+    @classmethod
+    def shared(cls, low_loss, high_loss):
+        """Get the LognormalMagnitude for a range, shared by every caller asking for the same range.
+        Magnitudes are not changed after construction, so scenarios with identical ranges can
+        share one object (and its scipy distribution, if one is built)."""
+        key = (cls, low_loss, high_loss)
+        magnitude = _shared.get(key)
+        if magnitude is None:
+            magnitude = cls(low_loss, high_loss)
+            _shared[key] = magnitude
+        return magnitude
+
     def _setup_lognormal(self, low_loss, high_loss):
-        # Set up the lognormal distribution
-        factor = -0.5 / norm.ppf(0.05)
-        mu = (math.log(low_loss) + math.log(high_loss)) / 2.  # Average of the logn of low/high
-        shape = factor * (math.log(high_loss) - math.log(low_loss))  # Standard deviation
-        self.distribution = lognorm(shape, scale=math.exp(mu))
+        # Set up the lognormal distribution parameters
+        self.mu = (math.log(low_loss) + math.log(high_loss)) / 2.  # Average of the logn of low/high
+        self.sigma = _CI_FACTOR * (math.log(high_loss) - math.log(low_loss))  # Standard deviation
+        self._scale = math.exp(self.mu)
+        self._distribution = None
 
-    def draw(self, n=1):
-        return self.distribution.rvs(size=n)
+    @property
+    def distribution(self):
+        """The frozen scipy.stats lognormal distribution, built (and scipy.stats imported) on first use."""
+        if self._distribution is None:
+            from scipy.stats import lognorm
+            self._distribution = lognorm(self.sigma, scale=self._scale)
+        return self._distribution
+
+    def draw(self, n=1, rng=None):
+        """:param n = Number of losses to draw
+        :param rng = A numpy Generator, or None for numpy's global random state
+
+        Transforms standard normals with the cached parameters: the same draws as
+        self.distribution.rvs(size=n, random_state=rng), without scipy's per-call overhead."""
+        return np.exp(self.sigma * streams.as_generator(rng).standard_normal(n)) * self._scale
+
+    def ppf(self, u):
+        """:param u = Array of probabilities in (0, 1)
+        :return Numpy array of the losses at each cumulative probability of u"""
+        from scipy.special import ndtri
+        return np.exp(self.mu + self.sigma * ndtri(u))
 
     def mean(self):
-        return self.distribution.mean()
+        return math.exp(self.mu + self.sigma ** 2 / 2.)
+
+    def parameters(self):
+        return {'low_loss': float(self.low_loss), 'high_loss': float(self.high_loss)}
@@ -15,29 +15,60 @@
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 
-import numpy as np
-import tensorflow_probability as tfp
+from riskquant import streams
 
 
 class PERTFrequency(object):
 
     def __init__(self, min_freq, max_freq, most_likely_freq, kurtosis):
-        """:param frequency = Mean rate per interval"""
+        """:param min_freq = Lowest rate per interval
+        :param max_freq = Highest rate per interval
+        :param most_likely_freq = Most likely rate per interval (the peak of the distribution)
+        :param kurtosis = Confidence in the most likely rate. Higher values give a sharper peak."""
         if min_freq >= max_freq:
             # Min frequency must exceed max frequency
             raise AssertionError
         if not min_freq <= most_likely_freq <= max_freq:
             # Most likely should be between min and max frequencies.
             raise AssertionError
+        self.min_freq = min_freq
+        self.max_freq = max_freq
+        self.most_likely_freq = most_likely_freq
+        self.kurtosis = kurtosis
 
-        # Set up the PERT distribution
+        # Set up the Modified PERT distribution: a beta distribution scaled to [min_freq, max_freq].
         # From FAIR: the most likely frequency will set the skew/peak, and
         # the "confidence" in the most likely frequency will set the kurtosis/temp of the distribution.
-        self.distribution = tfp.distributions.PERT(
-            low=min_freq, peak=most_likely_freq, high=max_freq, temperature=kurtosis)
+        span = max_freq - min_freq
+        self.alpha = 1. + kurtosis * (most_likely_freq - min_freq) / span
+        self.beta = 1. + kurtosis * (max_freq - most_likely_freq) / span
 
-    def draw(self, n=1):
-        return [np.random.poisson(x) for x in self.distribution.sample(n)]
+    @property
+    def distribution(self):
+        """The equivalent tensorflow_probability PERT distribution.
+        Requires the optional tensorflow dependencies (pip install riskquant[tensorflow])."""
+        import tensorflow_probability as tfp
+        return tfp.distributions.PERT(
+            low=self.min_freq, peak=self.most_likely_freq, high=self.max_freq, temperature=self.kurtosis)
+
+    def draw_rates(self, n=1, rng=None):
+        """:param rng = A numpy Generator, or None for numpy's global random state
+        :return Numpy array of n event rates drawn from the Modified PERT distribution"""
+        rng = streams.as_generator(rng)
+        return self.min_freq + (self.max_freq - self.min_freq) * rng.beta(self.alpha, self.beta, n)
+
+    def draw(self, n=1, rng=None):
+        """:param rng = A numpy Generator, or None for numpy's global random state
+        :return Numpy array of n event counts, each Poisson distributed around a PERT rate"""
+        rng = streams.as_generator(rng)
+        return rng.poisson(self.draw_rates(n, rng))
 
     def mean(self):
-        return self.distribution.mode()
+        # The peak (mode) of the rate distribution is used as the expected frequency.
+        return self.most_likely_freq
+
+    def parameters(self):
+        return {'min_freq': float(self.min_freq),
+                'max_freq': float(self.max_freq),
+                'most_likely_freq': float(self.most_likely_freq),
+                'kurtosis': float(self.kurtosis)}
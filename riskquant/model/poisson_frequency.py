@@ -16,6 +16,7 @@
 #   limitations under the License.
 
 import numpy as np
+from riskquant import streams
 
 
 class PoissonFrequency(object):
@@ -25,8 +26,22 @@ class PoissonFrequency(object):
             raise AssertionError("Frequency must be non-negative.")
         self.frequency = frequency
 
-    def draw(self, n=1):
-        return np.random.poisson(self.frequency, n)
+    def draw(self, n=1, rng=None):
+        """:param n = Number of intervals to draw
+        :param rng = A numpy Generator, or None for numpy's global random state"""
+        return streams.as_generator(rng).poisson(self.frequency, n)
+
+    def ppf(self, u):
+        """:param u = Array of probabilities in [0, 1)
+        :return Numpy array of the smallest event count whose cumulative probability exceeds each of u.
+                Uses a table of the CDF, which is much faster than scipy.stats.poisson.ppf."""
+        from scipy.stats import poisson
+        top = int(self.frequency + 12. * self.frequency ** 0.5 + 12.)  # The CDF reaches 1 well before
+        cdf = poisson.cdf(range(top + 1), self.frequency)
+        return np.minimum(np.searchsorted(cdf, u, side='right'), top)
 
     def mean(self):
         return self.frequency
+
+    def parameters(self):
+        return {'frequency': float(self.frequency)}
@@ -12,18 +12,136 @@
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+import hashlib
+import json
+from statistics import NormalDist
 import sys
 
-from matplotlib import pyplot as plt
-from matplotlib import ticker as mtick
 import numpy as np
+from riskquant import analytic as riskquant_analytic
+from riskquant import cache
+from riskquant import loss
+from riskquant import portfolio
+from riskquant import profiling
+from riskquant import qmc as riskquant_qmc
+from riskquant import sketch
+from riskquant import sparse
+from riskquant import streams
+from riskquant import yearloss
+
+
+# Exceedance probabilities 0.99, 0.98, ..., 0.01 used for the default LEC.
+DEFAULT_EXCEEDANCE_PROBS = np.array([float(100 - x) / 100.0 for x in range(1, 100, 1)])
+
+# Number of consecutive scenarios summed together in one simulation task. Tasks are
+# the same whether they run in-process or in a pool, so the floating point summation
+# order (and therefore the result for a seed) does not depend on the number of workers.
+SCENARIOS_PER_TASK = 64
+
+# Quantiles that simulate_years_adaptive checks for convergence by default.
+DEFAULT_ADAPTIVE_QUANTILES = (0.9, 0.99, 0.999)
+
+# Years per chunk (and so between stopping checks) of simulate_years_adaptive, so a quick
+# convergence isn't held up by simulating a whole default chunk of years first.
+ADAPTIVE_CHUNK_YEARS = 4096
+
+# After a stopping check, the next one waits for this many times more years, so all the
+# checks together cost in proportion to the years rather than to their square.
+CHECK_GROWTH = 0.125
+
+# A quantile's confidence interval is only trusted with at least this many simulated years on each side of it.
+MIN_YEARS_PER_SIDE = 10
+
+# Variance reduction methods of simulate_years_weighted.
+VARIANCE_REDUCTION_METHODS = ('stratified', 'importance')
+
+# The aggregate of a portfolio is simulated in sparse form when the expected share of years
+# with any loss is at most this; beyond it, dense year totals are faster.
+SPARSE_MAX_YEAR_SHARE = 0.25
+
+# The simulator and seed of the simulation a pool worker process is serving.
+_worker_state = {}
 
 
 class MultiLoss(object):
     """A container for a list of loss objects and methods for generating summaries of them."""
 
-    def __init__(self, loss_list):
+    def __init__(self, loss_list, engine='auto', cache=None):
+        """:param loss_list = List of loss objects, e.g. SimpleLoss
+        :param engine = How simulations draw the losses:
+                        'scenario': each loss simulates itself with its own simulate_years.
+                        'portfolio': all losses are drawn together by a struct-of-arrays
+                                     riskquant.portfolio.SimpleLossPortfolio. Every loss must
+                                     have a Poisson frequency and a lognormal magnitude.
+                        'auto' (default): 'portfolio' when every loss supports it, else 'scenario'.
+        :param cache = A riskquant.cache.SimulationCache to re-use simulations from. It is only
+                       used for seeded simulations, and the results are the same as without it.
+        """
+        if engine not in ('auto', 'scenario', 'portfolio'):
+            raise AssertionError("Unknown engine {}".format(engine))
         self.loss_list = loss_list
+        self.engine = engine
+        self.cache = cache
+        self._incremental = None
+
+    def _simulator(self):
+        """The loss list itself, or a SimpleLossPortfolio of it, according to the engine."""
+        if self.engine == 'portfolio' or (
+                self.engine == 'auto' and all(portfolio.supports(loss) for loss in self.loss_list)):
+            return portfolio.SimpleLossPortfolio.from_losses(self.loss_list)
+        return self.loss_list
+
+    def start_incremental(self, n, seed=None, chunk_years=streams.DEFAULT_CHUNK_YEARS, dtype=np.float64):
+        """Simulate n years once and keep every scenario's year losses, for incremental updates.
+
+        Afterwards, add_loss, remove_loss and update_loss re-simulate only the scenario
+        that changed and adjust the kept aggregate, and simulate_years, exceedance_curve
+        and summarize_loss for n years with no seed return results from the kept aggregate
+        (exceedance_curve only when none of its alternative modes, such as qmc, is requested).
+        Each scenario draws from its own random stream, which an updated scenario with the
+        same label keeps, so an update changes the results only as much as its parameters do. The year
+        losses are kept sparse (see riskquant.sparse), so they take memory in proportion
+        to the years with a loss.
+
+        :arg: n = The number of years to simulate
+              [seed] = Seed, SeedSequence or numpy Generator. None uses fresh entropy.
+              [chunk_years] = Number of years drawn from each random stream.
+              [dtype] = Floating point type of the kept year losses of each scenario.
+                        np.float32 halves the memory of their values; the aggregate is kept in float64."""
+        state = _Incremental(n, streams.seed_sequence(seed), chunk_years, dtype)
+        for scenario, stream_id in zip(self.loss_list, _stream_ids(self.loss_list)):
+            state.add(scenario, stream_id)
+        self._incremental = state
+
+    def stop_incremental(self):
+        """Discard the kept year losses. Simulations run from scratch again."""
+        self._incremental = None
+
+    def add_loss(self, loss):
+        """Append a loss to the list (and, in incremental mode, simulate only it)."""
+        self.loss_list.append(loss)
+        if self._incremental:
+            self._incremental.add(loss, _stream_ids(self.loss_list)[-1])
+
+    def remove_loss(self, index):
+        """Remove the loss at index from the list (and, in incremental mode, its year losses)."""
+        del self.loss_list[index]
+        if self._incremental:
+            self._incremental.remove(index)
+
+    def update_loss(self, index, loss):
+        """Replace the loss at index (and, in incremental mode, re-simulate only it)."""
+        self.loss_list[index] = loss
+        if self._incremental:
+            self._incremental.update(index, loss, _stream_ids(self.loss_list)[index])
+
+    def _kept_years(self, n, seed):
+        """The kept incremental aggregate, if it answers a simulation of n years with this seed."""
+        if self._incremental and seed is None and n == self._incremental.years:
+            return self._incremental.totals
+        return None
 
     def prioritized_losses(self):
         """Generate a prioritized list of losses from the loss list.
@@ -33,33 +151,521 @@ class MultiLoss(object):
         result = [(loss.label, loss.name, loss.annualized_loss()) for loss in self.loss_list]
         return sorted(result, key=lambda x: x[2], reverse=True)
 
-    def simulate_years(self, n):
+    def simulate_years(self, n, seed=None, chunk_years=streams.DEFAULT_CHUNK_YEARS, workers=None,
+                       dtype=np.float64, out=None):
         """Simulate n years across all the losses in the list.
 
+        Each loss (or, with the portfolio engine, each group of losses) simulates each chunk
+        of years from its own independent random stream (see riskquant.streams), so a given
+        seed always reproduces the same years. The work is split into tasks of up to
+        SCENARIOS_PER_TASK scenarios by one chunk of years, which can be run in a pool of
+        worker processes.
+
         :arg: n = The number of years to simulate
+              [seed] = Seed, SeedSequence or numpy Generator. None uses fresh entropy.
+              [chunk_years] = Number of years drawn from each random stream.
+              [workers] = Number of worker processes. None or 1 simulates in this process.
+                          The result for a given seed is the same for any number of workers.
+              [dtype] = Floating point type of the result, e.g. np.float32 to halve its memory.
+                        Each chunk of years is summed in float64 before it is stored.
+              [out] = Optional array of length n to write the result into instead of allocating one.
 
-        :returns: List of [loss_year_1, loss_year_2, ...] where each is a sum of all
+        :returns: Array of [loss_year_1, loss_year_2, ...] where each is a sum of all
                   losses experienced that year."""
+        if out is None:
+            out = np.empty(n, dtype=dtype)
+        elif out.shape != (n,):
+            raise AssertionError("out must have shape ({},)".format(n))
+        kept = self._kept_years(n, seed)
+        if kept is not None:
+            out[:] = kept
+            return out
+        start = 0
+        for chunk_totals in self.iter_simulated_years(n, seed, chunk_years, workers):
+            out[start:start + chunk_totals.size] = chunk_totals
+            start += chunk_totals.size
+        return out
+
+    def simulate_years_adaptive(self, tolerance, max_years, quantiles=DEFAULT_ADAPTIVE_QUANTILES, confidence=0.95,
+                                seed=None, chunk_years=ADAPTIVE_CHUNK_YEARS, workers=None):
+        """Simulate chunks of years until the given quantiles of the year totals are known to within tolerance.
+
+        After a chunk, a distribution-free confidence interval of each quantile is read from
+        the order statistics of the years so far. Simulation stops once every interval lies
+        within the relative tolerance of its estimate, or after max_years. Checks follow each
+        chunk until the years so far outnumber the chunk by 1 / CHECK_GROWTH, and then each
+        CHECK_GROWTH more years. The years are the same as the first years of simulate_years
+        with the same seed and chunk_years (ADAPTIVE_CHUNK_YEARS by default, not simulate_years's).
+
+        :arg: tolerance = Relative error allowed on each quantile, e.g. 0.01 for +/- 1%
+              max_years = Most years to simulate
+              [quantiles] = Quantiles to check, e.g. (0.9, 0.99, 0.999) for the 1-in-10, 1-in-100
+                            and 1-in-1000 year losses.
+              [confidence] = Confidence level of the intervals.
+              [seed], [chunk_years], [workers] = As for simulate_years.
+
+        :returns: Tuple (year_losses, report). year_losses is the array of simulated year totals.
+                  report is a dictionary with the number of 'years' simulated, whether the
+                  quantiles 'converged', and arrays of the 'quantiles', their 'estimates', the
+                  'lower' and 'upper' ends of their confidence intervals and their 'relative_error'."""
+        quantiles = np.asarray(quantiles, dtype=float)
+        years = np.empty(max_years)
+        used = 0
+        next_check = 0
+        report = None
+        for chunk_totals in self.iter_simulated_years(max_years, seed, chunk_years, workers):
+            years[used:used + chunk_totals.size] = chunk_totals
+            used += chunk_totals.size
+            if used < next_check and used < max_years:
+                continue
+            report = _quantile_report(years[:used], quantiles, confidence, tolerance)
+            if report['converged']:
+                break
+            next_check = used * (1. + CHECK_GROWTH)
+        return years[:used], report
+
+    def simulate_years_weighted(self, n, method='stratified', seed=None):
+        """Simulate about n years with variance reduction, for more accurate tail quantiles.
+
+        Every loss must have a Poisson frequency and a lognormal magnitude. The years are
+        drawn by a riskquant.portfolio.SimpleLossPortfolio of the losses, in one process.
+
+        :arg: n = Number of years to simulate
+              [method] = 'stratified' (default): stratify years by their number of events, and
+                         skip the years without (see SimpleLossPortfolio.simulate_years_stratified).
+                         'importance': tilt the event rates and magnitudes towards large losses
+                         (see SimpleLossPortfolio.simulate_years_importance).
+              [seed] = Seed for the simulation (see simulate_years).
+
+        :returns: A riskquant.weighted.WeightedYearLosses with the weighted year totals."""
+        if method not in VARIANCE_REDUCTION_METHODS:
+            raise AssertionError("Unknown variance reduction method {}".format(method))
+        simulator = portfolio.SimpleLossPortfolio.from_losses(self.loss_list)
+        rng = np.random.default_rng(streams.seed_sequence(seed))
+        if method == 'importance':
+            return simulator.simulate_years_importance(n, rng=rng)
+        return simulator.simulate_years_stratified(n, rng=rng)
+
+    def simulate_years_qmc(self, n, seed=None, replicates=riskquant_qmc.DEFAULT_REPLICATES):
+        """Simulate about n years by quasi-Monte Carlo, in independently scrambled replicates.
+
+        With the portfolio engine, each replicate is one Sobol sequence for the whole
+        portfolio (see SimpleLossPortfolio.simulate_years_qmc). Otherwise each loss simulates
+        its own sequence (see Loss.simulate_years) in a random order of years, so every
+        frequency and magnitude model needs a ppf method. Runs in one process.
+
+        :arg: n = Number of years to simulate, split evenly across the replicates. Each replicate
+                  is rounded up to a power of 2 years, which keeps the Sobol sequence balanced.
+              [seed] = Seed for the scrambling (see simulate_years).
+              [replicates] = Number of independently scrambled replicates.
+
+        :returns: A numpy array with one row of year totals per replicate, each of the smallest
+                  power of 2 that is at least n / replicates years."""
+        years = 1 << max(-(-n // replicates) - 1, 0).bit_length()
+        seed_seq = streams.seed_sequence(seed)
+        simulator = self._simulator()
+        result = np.zeros((replicates, years))
+        for replicate in range(replicates):
+            if isinstance(simulator, portfolio.SimpleLossPortfolio):
+                result[replicate] = simulator.simulate_years_qmc(years, rng=streams.stream(seed_seq, replicate))
+                continue
+            for i, scenario in enumerate(simulator):
+                rng = streams.stream(seed_seq, i, replicate)
+                # Differently scrambled copies of one sequence are far from independent, so each
+                # loss's years are shuffled before they are added up (Latin supercube sampling).
+                result[replicate] += rng.permutation(scenario.simulate_years(years, rng=rng, qmc=True))
+        return result
+
+    def quantiles_qmc(self, n, q, seed=None, replicates=riskquant_qmc.DEFAULT_REPLICATES):
+        """Quantiles of the aggregate annual loss by quasi-Monte Carlo, with error estimates.
+
+        :arg: n, [seed], [replicates] = As for simulate_years_qmc.
+              q = Quantile or array of quantiles in [0, 1]
+
+        :returns: Tuple (estimates, standard_errors), see riskquant.qmc.replicate_quantiles."""
+        return riskquant_qmc.replicate_quantiles(self.simulate_years_qmc(n, seed, replicates), q)
+
+    def iter_simulated_years(self, n, seed=None, chunk_years=streams.DEFAULT_CHUNK_YEARS, workers=None):
+        """Simulate n years across all the losses in the list, one chunk of years at a time.
+
+        Takes the same arguments as simulate_years, and yields the same years in order,
+        but only holds one chunk of year totals in memory at a time.
+
+        :returns: Iterator of arrays with the summed losses of each chunk of years."""
+        if not self.loss_list:
+            for _, start, stop in streams.year_chunks(n, chunk_years):
+                yield np.zeros(stop - start)
+            return
+        tasks = self._tasks(n, chunk_years)
+        chunk_totals = None
+        for (first, _, _, start, stop), partial in self._run_tasks(tasks, self._simulator(), seed, workers):
+            if first == 0:
+                if chunk_totals is not None:
+                    yield chunk_totals
+                chunk_totals = np.zeros(stop - start)
+            chunk_totals += partial
+        if chunk_totals is not None:
+            yield chunk_totals
+
+    def write_year_loss_table(self, path, n, seed=None, chunk_years=streams.DEFAULT_CHUNK_YEARS, workers=None,
+                              dtype=np.float64):
+        """Simulate n years and save every scenario's own year losses as a year-loss table.
+
+        Each scenario's row comes from the same random streams as simulate_years, so for
+        the same seed the rows add up to the simulate_years result (up to rounding).
+        The table is written through a memory map, one task at a time, so it can be
+        larger than memory.
+
+        :arg: path = Directory to write the table to (see riskquant.yearloss)
+              n = Number of years to simulate
+              [seed], [chunk_years], [workers], [dtype] = As for simulate_years.
+
+        :returns: The written riskquant.yearloss.YearLossTable, opened read-only."""
+        table = yearloss.YearLossTable.create(path, [loss.label for loss in self.loss_list],
+                                              [loss.name for loss in self.loss_list], n, dtype)
+        for (first, last, _, start, stop), rows in self._run_tasks(
+                self._tasks(n, chunk_years), self._simulator(), seed, workers, rows=True):
+            table.losses[first:last, start:stop] = rows
+        table.flush()
+        return yearloss.YearLossTable(path)
+
+    def tail_contributions(self, n, levels=yearloss.DEFAULT_TAIL_LEVELS, seed=None,
+                           chunk_years=streams.DEFAULT_CHUNK_YEARS, workers=None):
+        """Simulate n years once and report each scenario's contribution to the worst years.
+
+        The scenarios' year losses come from the same random streams as write_year_loss_table,
+        held in memory as one (scenarios x years) array; for larger simulations, write a
+        table and use YearLossTable.tail_contributions.
+
+        :arg: n = Number of years to simulate
+              [levels] = Quantile levels of the tail (see riskquant.yearloss.tail_contributions).
+              [seed], [chunk_years], [workers] = As for simulate_years.
+
+        :returns: Dictionary as from riskquant.yearloss.tail_contributions, with the rows of
+                  its arrays in the order of loss_list."""
+        losses = np.empty((len(self.loss_list), n))
+        for (first, last, _, start, stop), rows in self._run_tasks(
+                self._tasks(n, chunk_years), self._simulator(), seed, workers, rows=True):
+            losses[first:last, start:stop] = rows
+        return yearloss.tail_contributions(losses, levels)
+
+    def simulate_sparse(self, n, seed=None, chunk_years=streams.DEFAULT_CHUNK_YEARS, workers=None, aggregate=False):
+        """Simulate n years and keep each scenario's own year losses in sparse form.
+
+        Each scenario's losses come from the same random streams as write_year_loss_table.
+        With the portfolio engine, the events are summed straight into the years they fall
+        in, so the work and memory scale with the number of events rather than scenarios
+        x years. (With the scenario engine, each loss still simulates every year itself.)
+
+        :arg: n = Number of years to simulate
+              [seed], [chunk_years], [workers] = As for simulate_years.
+              [aggregate] = Return the sparse total of all the scenarios instead. Its years
+                            are the same as simulate_years's.
+
+        :returns: List of riskquant.sparse.SparseYearLosses, one per scenario, or with
+                  aggregate a single SparseYearLosses of the total loss in each year."""
+        tasks = self._tasks(n, chunk_years)
+        if aggregate:
+            return self._sparse_totals(n, tasks, seed, workers)
+        parts = [[] for _ in self.loss_list]
+        for (first, last, _, start, stop), packed in self._run_tasks(
+                tasks, self._simulator(), seed, workers, rows=True, as_sparse=True):
+            for offset, scenario_losses in enumerate(sparse.SparseYearLosses.unpack_rows(last - first, stop - start,
+                                                                                         packed)):
+                parts[first + offset].append(scenario_losses)
+        return [sparse.SparseYearLosses.concatenate(scenario_parts) for scenario_parts in parts]
+
+    def _sparse_totals(self, n, tasks, seed, workers):
+        """:return SparseYearLosses of the total loss of each of n years, summed task by task"""
+        if not self.loss_list:
+            return sparse.SparseYearLosses(n, [], [])
+        chunks = []
+        chunk_parts = []
+        for (first, _, _, start, stop), packed in self._run_tasks(tasks, self._simulator(), seed, workers,
+                                                                  as_sparse=True):
+            if first == 0 and chunk_parts:
+                chunks.append(sparse.SparseYearLosses.sum(chunk_parts))
+                chunk_parts = []
+            chunk_parts.append(sparse.SparseYearLosses.unpack(stop - start, packed))
+        chunks.append(sparse.SparseYearLosses.sum(chunk_parts))
+        return sparse.SparseYearLosses.concatenate(chunks)
 
-        return np.array([loss.simulate_years(n) for loss in self.loss_list]).sum(axis=0)
+    def _tasks(self, n, chunk_years):
+        """Iterator of (first, last, chunk, start, stop) simulation tasks, chunk by chunk."""
+        return ((first, min(first + SCENARIOS_PER_TASK, len(self.loss_list)), chunk, start, stop)
+                for chunk, start, stop in streams.year_chunks(n, chunk_years)
+                for first in range(0, len(self.loss_list), SCENARIOS_PER_TASK))
+
+    def _run_tasks(self, tasks, simulator, seed, workers, rows=False, as_sparse=False):
+        """Yield (task, partial year losses) for each (first, last, chunk, start, stop) task, in order.
+        With rows, the partial year losses of each scenario are returned as rows of a matrix.
+        With as_sparse, they are returned packed as from SparseYearLosses.pack (or pack_rows).
+
+        With a cache and an explicit seed, each scenario's losses in a task are looked up in
+        the cache first, and only the scenarios that miss are simulated. Row tasks, which
+        are as large as the year-loss table, are never cached.
+        With workers, at most 2 * workers tasks are in flight, so finished results waiting
+        to be consumed in order stay bounded."""
+        seed_seq = streams.seed_sequence(seed)
+        ids = _stream_ids(self.loss_list)
+        task_cache = self.cache if seed is not None and not rows else None
+        executor = None
+        if workers is not None and workers > 1:
+            executor = ProcessPoolExecutor(max_workers=workers,
+                                           initializer=_init_worker,
+                                           initargs=(simulator, seed_seq, ids))
+        try:
+            pending = deque()
+            for task in tasks:
+                keys = self._scenario_keys(task, simulator, seed_seq, ids) if task_cache else None
+                cached = [task_cache.get(key) for key in keys] if keys else None
+                missing = None if keys is None else [offset for offset, packed in enumerate(cached) if packed is None]
+                if missing == []:
+                    result = []
+                elif executor is None:
+                    result = _simulate_group(simulator, seed_seq, ids, *task, rows=rows, as_sparse=as_sparse,
+                                             missing=missing)
+                else:
+                    result = executor.submit(_simulate_task, task, rows, as_sparse, profiling.active() is not None,
+                                             missing)
+                pending.append((task, keys, cached, missing, result))
+                while pending and len(pending) >= (2 * workers if executor else 1):
+                    yield self._finish_task(pending.popleft(), task_cache, as_sparse)
+            while pending:
+                yield self._finish_task(pending.popleft(), task_cache, as_sparse)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    @staticmethod
+    def _finish_task(pending_task, task_cache, as_sparse):
+        """Wait for a pending task's result. With cache keys, cache the scenarios that were
+        simulated, and add up the task's result from the entries of all its scenarios.
+        A worker's profile of the task comes back with the result, and is merged into this process's."""
+        task, keys, cached, missing, result = pending_task
+        if isinstance(result, Future):
+            result = result.result()
+            if isinstance(result, tuple):
+                result, stats = result
+                profiling.merge(stats)
+        if keys is None:
+            return task, result
+        for offset, packed in zip(missing, result):
+            task_cache.put(keys[offset], packed)
+            cached[offset] = packed
+        _, _, _, start, stop = task
+        return task, _add_scenarios(cached, stop - start, as_sparse)
+
+    def _scenario_keys(self, task, simulator, seed_seq, ids):
+        """Cache key of each scenario of a simulation task, or None if one of its losses can't describe itself.
+        A key covers the scenario's own random stream (see _stream_ids), not its position,
+        so inserting or removing other rows leaves it unchanged."""
+        first, last, chunk, start, stop = task
+        parameters = [scenario.parameters() if hasattr(scenario, 'parameters') else None
+                      for scenario in self.loss_list[first:last]]
+        if None in parameters:
+            return None
+        engine = 'portfolio' if isinstance(simulator, portfolio.SimpleLossPortfolio) else 'scenario'
+        return [cache.make_key(engine, scenario_parameters, ids[index], chunk, stop - start,
+                               seed_seq.entropy, list(seed_seq.spawn_key))
+                for index, scenario_parameters in enumerate(parameters, first)]
+
+    def simulate_sketch(self, n, seed=None, chunk_years=streams.DEFAULT_CHUNK_YEARS, workers=None,
+                        relative_accuracy=0.001):
+        """Simulate n years in streaming mode, keeping only a quantile sketch of the year totals.
+
+        Peak memory is one chunk of years plus the sketch, independent of n and of
+        the number of losses. Takes the same simulation arguments as simulate_years.
+
+        :arg: [relative_accuracy] = Maximum relative error of quantiles read from the sketch.
+
+        :returns: A riskquant.sketch.QuantileSketch of the simulated year totals."""
+        result = sketch.QuantileSketch(relative_accuracy)
+        for chunk_totals in self.iter_simulated_years(n, seed, chunk_years, workers):
+            result.add(chunk_totals)
+        return result
+
+    def exceedance_curve(self, n, probs=None, seed=None, workers=None, streaming=False, analytic=False,
+                         tolerance=None, variance_reduction=None, qmc=False):
+        """Compute the Loss Exceedance Curve data from a single simulation of n years.
+
+        streaming, analytic, tolerance, variance_reduction and qmc each choose a different
+        way to compute the curve, so at most one of them may be given. Plain simulation
+        and the streaming and tolerance modes run on workers and re-use the simulation
+        cache; the analytic, variance_reduction and qmc modes run in this process and
+        use neither.
+
+        :arg: n = Number of years to simulate.
+              [probs] = Exceedance probabilities to evaluate, each in (0, 1).
+                        Defaults to 0.99, 0.98, ..., 0.01.
+              [seed] = Seed for the simulation (see simulate_years).
+              [workers] = Number of worker processes for the simulation (see simulate_years).
+              [streaming] = Read the curve from a bounded-memory sketch (see simulate_sketch)
+                            instead of keeping all n year totals.
+              [analytic] = Compute the curve deterministically instead of simulating (see
+                           riskquant.analytic). n, seed and workers are then unused.
+                           Every loss must have a Poisson frequency and a lognormal magnitude.
+              [tolerance] = Simulate only until the losses at every one of the given probs (or,
+                            for the default curve, the 1-in-10, 1-in-100 and 1-in-1000 year losses)
+                            are known to within this relative error, with n as the most years
+                            (see simulate_years_adaptive). The years used and the achieved error
+                            bounds are written to stderr.
+              [variance_reduction] = Read the curve from about n years simulated with one of the
+                                     VARIANCE_REDUCTION_METHODS (see simulate_years_weighted).
+              [qmc] = Simulate at least n years by quasi-Monte Carlo (see simulate_years_qmc).
+
+        :returns: Tuple (losses, probs) of numpy arrays, where losses[i] is the
+                  aggregate annual loss exceeded with probability probs[i]."""
+        modes = {'streaming': streaming, 'analytic': analytic, 'tolerance': tolerance is not None,
+                 'variance_reduction': variance_reduction, 'qmc': qmc}
+        requested = sorted(mode for mode, value in modes.items() if value)
+        if len(requested) > 1:
+            raise AssertionError("Only one of {} can be used at a time.".format(', '.join(requested)))
+        # The default curve's low points, next to the years without a loss, would take many years to pin
+        # down to a relative error, so it checks the tail quantiles instead.
+        adaptive_quantiles = DEFAULT_ADAPTIVE_QUANTILES if probs is None else 1.0 - np.asarray(probs, dtype=float)
+        if probs is None:
+            probs = DEFAULT_EXCEEDANCE_PROBS
+        probs = np.asarray(probs, dtype=float)
+        if analytic:
+            return riskquant_analytic.aggregate_distribution(self.loss_list).exceedance_curve(probs)
+        if variance_reduction:
+            return self.simulate_years_weighted(n, variance_reduction, seed=seed).exceedance_curve(probs)
+        # The kept incremental years only stand in for a plain simulation.
+        kept = None if requested else self._kept_years(n, seed)
+        if qmc:
+            kept = self.simulate_years_qmc(n, seed=seed).ravel()
+        if tolerance is not None:
+            kept, report = self.simulate_years_adaptive(tolerance, n, quantiles=adaptive_quantiles, seed=seed,
+                                                        workers=workers)
+            _write_quantile_report(report)
+        if streaming:
+            result = self.simulate_sketch(n, seed=seed, workers=workers)
+            started = profiling.start()
+            losses = result.quantile(1.0 - probs)
+        else:
+            years = kept if kept is not None else self._aggregate_years(n, seed, workers)
+            started = profiling.start()
+            if isinstance(years, sparse.SparseYearLosses):
+                losses = years.percentile(100.0 * (1.0 - probs))
+            else:
+                losses = np.percentile(years, 100.0 * (1.0 - probs))
+        profiling.record('percentiles', started, size=probs.size)
+        return losses, probs
+
+    def summarize_loss(self, n, seed=None, workers=None):
+        """Loss.summarize_loss of the aggregate losses of n simulated years (see simulate_years)."""
+        kept = self._kept_years(n, seed)
+        years = kept if kept is not None else self._aggregate_years(n, seed, workers)
+        if isinstance(years, sparse.SparseYearLosses):
+            return years.summarize_loss()
+        return loss.Loss.summarize_loss(years)
+
+    def _aggregate_years(self, n, seed, workers):
+        """Simulate the total loss of n years: as SparseYearLosses (see simulate_sparse) if few
+        years have any loss (see SPARSE_MAX_YEAR_SHARE), else as simulate_years. The years
+        are the same either way."""
+        simulator = self._simulator()
+        if isinstance(simulator, portfolio.SimpleLossPortfolio) and (
+                -np.expm1(-simulator.frequency.sum()) <= SPARSE_MAX_YEAR_SHARE):
+            return self.simulate_sparse(n, seed=seed, workers=workers, aggregate=True)
+        return self.simulate_years(n, seed=seed, workers=workers)
+
+    def evaluate_variants(self, variants, n, probs=None, seed=None):
+        """Compare what-if variants of the losses' parameters, simulated with common random numbers.
+
+        All the variants are simulated in one pass over the same random events (see
+        riskquant.portfolio.SimpleLossPortfolio.simulate_variants), so the differences
+        between them reflect the parameter changes rather than sampling noise. Every loss
+        must have a Poisson frequency and a lognormal magnitude.
+
+        :arg: variants = Dictionary of variant name to its changes: a dictionary of loss label
+                         to the new values of any of 'frequency', 'low_loss' and 'high_loss'
+                         for every loss with that label (unlabeled losses are never changed), e.g.
+                         {'halve BOB': {'BOB': {'frequency': 0.05}},
+                          'cap ALICE': {'ALICE': {'high_loss': 5000000}}}
+              n = Number of years to simulate
+              [probs] = Exceedance probabilities of the curves (see exceedance_curve).
+              [seed] = Seed for the simulation (see simulate_years).
+
+        :returns: Dictionary of 'base' and each variant name to a dictionary of its
+                  'annualized_loss' (expected, from the parameters), 'mean' (of the
+                  simulated years), 'summary' (see Loss.summarize_loss) and 'exceedance_curve'
+                  (a tuple (losses, probs) as from exceedance_curve)."""
+        if 'base' in variants:
+            raise AssertionError("'base' is the name of the unchanged losses.")
+        if probs is None:
+            probs = DEFAULT_EXCEEDANCE_PROBS
+        probs = np.asarray(probs, dtype=float)
+        if not all(portfolio.supports(scenario) for scenario in self.loss_list):
+            raise AssertionError("Every loss needs a Poisson frequency and a lognormal magnitude.")
+        base = self._variant({})
+        portfolios = [self._variant(changes) for changes in variants.values()]
+        years = base.simulate_variants(portfolios, n, rng=np.random.default_rng(streams.seed_sequence(seed)))
+        summaries = loss.Loss.summarize_loss(years)
+        curves = np.percentile(years, 100.0 * (1.0 - probs), axis=1).T
+        result = {}
+        for row, (name, simulated) in enumerate(zip(['base'] + list(variants), [base] + portfolios)):
+            result[name] = {'annualized_loss': float(simulated.annualized_losses().sum()),
+                            'mean': float(years[row].mean()),
+                            'summary': {key: value[row] for key, value in summaries.items()},
+                            'exceedance_curve': (curves[row], probs)}
+        return result
+
+    def _variant(self, changes):
+        """:return A SimpleLossPortfolio of the losses with the parameter changes of one variant.
+        Losses without a label keep their parameters in every variant."""
+        labels = [getattr(scenario, 'label', None) for scenario in self.loss_list]
+        unknown = set(changes) - set(labels)
+        if unknown:
+            raise AssertionError("No losses with labels {}".format(', '.join(sorted(map(str, unknown)))))
+        parameters = {'frequency': [scenario.frequency_model.frequency for scenario in self.loss_list],
+                      'low_loss': [scenario.magnitude_model.low_loss for scenario in self.loss_list],
+                      'high_loss': [scenario.magnitude_model.high_loss for scenario in self.loss_list]}
+        for i, label in enumerate(labels):
+            for parameter, value in (changes.get(label, {}) if label is not None else {}).items():
+                if parameter not in parameters:
+                    raise AssertionError("Unknown parameter {}".format(parameter))
+                parameters[parameter][i] = value
+        return portfolio.SimpleLossPortfolio.from_ranges(**parameters)
 
     def loss_exceedance_curve(self,
                               n,
                               title="Aggregated Loss Exceedance",
                               xlim=[1000000, 10000000000],
-                              savefile=None):
-        """Generate the Loss Exceedance Curve for the list of losses. (Uses simulate_years)
+                              savefile=None,
+                              seed=None,
+                              workers=None,
+                              streaming=False,
+                              analytic=False,
+                              tolerance=None,
+                              variance_reduction=None,
+                              qmc=False):
+        """Generate the Loss Exceedance Curve for the list of losses. (Uses exceedance_curve)
 
         :arg: n = Number of years to simulate and display the LEC for.
               [title] = An alternative title for the plot.
               [xlim] = An alternative lower and upper limit for the plot's x axis.
               [savefile] = Save a PNG version to this file location instead of displaying.
+              [seed] = Seed for the simulation (see simulate_years).
+              [workers] = Number of worker processes for the simulation (see simulate_years).
+              [streaming] = Simulate in bounded memory (see exceedance_curve).
+              [analytic] = Compute the curve without simulating (see exceedance_curve).
+              [tolerance] = Stop simulating once the tail quantiles converge (see exceedance_curve).
+              [variance_reduction] = Simulate with variance reduction (see exceedance_curve).
+              [qmc] = Simulate by quasi-Monte Carlo (see exceedance_curve).
 
         :returns: None. If display=False, returns the matplotlib axis array
                   (for customization)."""
 
-        losses = np.array([np.percentile(self.simulate_years(n), x) for x in range(1, 100, 1)])
-        percentiles = np.array([float(100 - x) / 100.0 for x in range(1, 100, 1)])
+        # Plotting is optional; only pay for importing matplotlib when a plot is requested.
+        from matplotlib import pyplot as plt
+        from matplotlib import ticker as mtick
+
+        losses, percentiles = self.exceedance_curve(n, seed=seed, workers=workers, streaming=streaming,
+                                                    analytic=analytic, tolerance=tolerance,
+                                                    variance_reduction=variance_reduction, qmc=qmc)
+        started = profiling.start()
         _ = plt.figure()
         ax = plt.gca()
         ax.plot(losses, percentiles)
@@ -77,3 +683,194 @@ class MultiLoss(object):
             plt.savefig(savefile)
         else:
             plt.show()
+        profiling.record('plot', started, size=losses.size)
+
+
+class _Incremental(object):
+    """The year losses of each scenario of a MultiLoss in incremental mode, and their sum.
+    Each scenario's losses are kept as riskquant.sparse.SparseYearLosses."""
+
+    def __init__(self, years, seed_seq, chunk_years, dtype):
+        self.years = years
+        self.seed_seq = seed_seq
+        self.chunk_years = chunk_years
+        self.dtype = dtype
+        self.contributions = []
+        self.totals = np.zeros(years)
+
+    def _simulate(self, loss, stream_id):
+        parts = []
+        for chunk, start, stop in streams.year_chunks(self.years, self.chunk_years):
+            rng = streams.stream(self.seed_seq, stream_id, chunk)
+            losses = np.asarray(streams.call_with_rng(loss.simulate_years, stop - start, rng=rng), dtype=self.dtype)
+            parts.append(sparse.SparseYearLosses.from_dense(losses))
+        return sparse.SparseYearLosses.concatenate(parts)
+
+    def add(self, loss, stream_id):
+        contribution = self._simulate(loss, stream_id)
+        self.contributions.append(contribution)
+        self.totals[contribution.index] += contribution.values
+
+    def remove(self, index):
+        del self.contributions[index]
+        self._sum()
+
+    def update(self, index, loss, stream_id):
+        self.contributions[index] = self._simulate(loss, stream_id)
+        self._sum()
+
+    def _sum(self):
+        """Sum the totals again from the contributions. Subtracting a contribution would leave
+        floating point residue in the totals, which would build up over many updates."""
+        self.totals = np.zeros(self.years)
+        for contribution in self.contributions:
+            self.totals[contribution.index] += contribution.values
+
+
+def _quantile_report(years, quantiles, confidence, tolerance):
+    """Estimate quantiles of years with confidence intervals from its order statistics.
+    The ranks of the interval ends use the normal approximation to the binomial distribution."""
+    n = years.size
+    z = NormalDist().inv_cdf((1. + confidence) / 2.)
+    spread = z * np.sqrt(n * quantiles * (1. - quantiles))
+    low_rank = np.clip(np.floor(n * quantiles - spread), 0, n - 1).astype(np.int64)
+    high_rank = np.clip(np.ceil(n * quantiles + spread), 0, n - 1).astype(np.int64)
+    position = quantiles * (n - 1)  # np.quantile's linear interpolation between two ranks
+    below = np.floor(position).astype(np.int64)
+    above = np.minimum(below + 1, n - 1)
+    ordered = np.partition(years, np.unique(np.concatenate([low_rank, high_rank, below, above])))
+    estimates = ordered[below] + (position - below) * (ordered[above] - ordered[below])
+    lower, upper = ordered[low_rank], ordered[high_rank]
+    error = np.maximum(estimates - lower, upper - estimates)
+    relative_error = np.divide(error, np.abs(estimates), out=np.where(error > 0, np.inf, 0.), where=estimates != 0)
+    enough_years = min(n * quantiles.min(), n * (1. - quantiles.max())) >= MIN_YEARS_PER_SIDE
+    return {'years': n,
+            'converged': bool(enough_years and np.all(relative_error <= tolerance)),
+            'quantiles': quantiles,
+            'estimates': estimates,
+            'lower': lower,
+            'upper': upper,
+            'relative_error': relative_error}
+
+
+def _write_quantile_report(report):
+    outcome = 'Converged after' if report['converged'] else 'Did not converge in'
+    sys.stderr.write("{} {} years:\n".format(outcome, report['years']))
+    for q, estimate, lower, upper, error in zip(report['quantiles'], report['estimates'], report['lower'],
+                                                report['upper'], report['relative_error']):
+        sys.stderr.write("  {:g} quantile ${:,.0f} (${:,.0f} to ${:,.0f}, +/- {:.2%})\n".format(
+            q, estimate, lower, upper, error))
+
+
+def _stream_ids(loss_list):
+    """The random stream id of each loss: a hash of its label (or, for a loss without one, its
+    parameters) and of how many earlier losses have the same label. Unlike the loss's position,
+    it doesn't change when other losses are inserted, removed or edited."""
+    ids = []
+    seen = {}
+    for scenario in loss_list:
+        label = getattr(scenario, 'label', None)
+        if label is None:
+            identity = ['parameters', scenario.parameters() if hasattr(scenario, 'parameters') else None]
+        else:
+            identity = ['label', label]
+        name = json.dumps(identity, sort_keys=True, default=repr)
+        occurrence = seen.get(name, 0)
+        seen[name] = occurrence + 1
+        digest = hashlib.sha256(json.dumps([name, occurrence]).encode('UTF-8')).hexdigest()
+        ids.append(int(digest[:15], 16))
+    return ids
+
+
+def _simulate_group(simulator, seed_seq, ids, first, last, chunk, start, stop, rows=False, as_sparse=False,
+                    missing=None):
+    """Sum the losses of scenarios [first, last) over one chunk of years.
+    With rows, return the (last - first, stop - start) matrix of each scenario's losses instead.
+    With as_sparse, return them as a packed SparseYearLosses (or list of them, with rows).
+    With missing, a list of offsets into [first, last), return a list of the cache entries
+    of only those scenarios instead (see _simulate_scenario).
+
+    Scenario i draws from its own stream, streams.stream(seed_seq, ids[i], chunk). simulator
+    is either a SimpleLossPortfolio, which draws the whole group in one pass, or a list of
+    losses, each simulating itself."""
+    if missing is not None:
+        return [_simulate_scenario(simulator, seed_seq, ids, first + offset, chunk, stop - start)
+                for offset in missing]
+    if as_sparse:
+        return _simulate_group_sparse(simulator, seed_seq, ids, first, last, chunk, start, stop, rows)
+    if isinstance(simulator, portfolio.SimpleLossPortfolio):
+        rngs = [streams.stream(seed_seq, ids[index], chunk) for index in range(first, last)]
+        if rows:
+            return simulator.simulate_scenario_years(stop - start, rng=rngs, first=first, last=last)
+        return simulator.simulate_years(stop - start, rng=rngs, first=first, last=last)
+    partial = np.zeros((last - first, stop - start) if rows else stop - start)
+    for index in range(first, last):
+        rng = streams.stream(seed_seq, ids[index], chunk)
+        losses = streams.call_with_rng(simulator[index].simulate_years, stop - start, rng=rng)
+        if rows:
+            partial[index - first] = losses
+        else:
+            partial += losses
+    return partial
+
+
+def _simulate_group_sparse(simulator, seed_seq, ids, first, last, chunk, start, stop, rows):
+    """_simulate_group with as_sparse. The scenarios are summed in the same order, so the
+    sparse totals are exactly the dense ones."""
+    if isinstance(simulator, portfolio.SimpleLossPortfolio):
+        rngs = [streams.stream(seed_seq, ids[index], chunk) for index in range(first, last)]
+        result = simulator.simulate_sparse(stop - start, rng=rngs, first=first, last=last, rows=rows)
+    else:
+        result = [_scenario_year_losses(simulator, seed_seq, ids, index, chunk, stop - start)
+                  for index in range(first, last)]
+        if not rows:
+            result = sparse.SparseYearLosses.sum(result)
+    return sparse.SparseYearLosses.pack_rows(result) if rows else result.pack()
+
+
+def _simulate_scenario(simulator, seed_seq, ids, index, chunk, years):
+    """Simulate one scenario over one chunk of years, as _simulate_group draws it, for the cache.
+
+    :return A (2 x k) array of years and losses: the scenario's events with the portfolio
+            engine, which sums a group's events in one pass, or its year losses (as from
+            SparseYearLosses.pack) with the scenario engine, which sums scenario by scenario"""
+    if isinstance(simulator, portfolio.SimpleLossPortfolio):
+        year, magnitude = simulator.simulate_events(years, rng=[streams.stream(seed_seq, ids[index], chunk)],
+                                                    first=index, last=index + 1)
+        return np.stack([year.astype(float), magnitude])
+    return _scenario_year_losses(simulator, seed_seq, ids, index, chunk, years).pack()
+
+
+def _scenario_year_losses(simulator, seed_seq, ids, index, chunk, years):
+    """:return SparseYearLosses of scenario index of a list of losses over one chunk of years"""
+    rng = streams.stream(seed_seq, ids[index], chunk)
+    return sparse.SparseYearLosses.from_dense(streams.call_with_rng(simulator[index].simulate_years, years, rng=rng))
+
+
+def _add_scenarios(entries, years, as_sparse):
+    """Add up the cache entries of a task's scenarios (see _simulate_scenario) in scenario order,
+    which is the order _simulate_group sums them in, so the result is exactly the same."""
+    stacked = np.concatenate([np.empty((2, 0))] + list(entries), axis=1)
+    year = stacked[0].astype(np.int64)
+    if as_sparse:
+        return sparse.SparseYearLosses.from_events(years, year, stacked[1]).pack()
+    return np.bincount(year, weights=stacked[1], minlength=years)
+
+
+def _init_worker(simulator, seed_seq, ids):
+    """Pool initializer: ship the losses to each worker once rather than with every task."""
+    _worker_state['simulator'] = simulator
+    _worker_state['seed_seq'] = seed_seq
+    _worker_state['ids'] = ids
+
+
+def _simulate_task(task, rows, as_sparse=False, profiled=False, missing=None):
+    """Run one task in a pool worker (see _simulate_group).
+    With profiled, return (result, Profile.stats() of the task)."""
+    if not profiled:
+        return _simulate_group(_worker_state['simulator'], _worker_state['seed_seq'], _worker_state['ids'], *task,
+                               rows=rows, as_sparse=as_sparse, missing=missing)
+    with profiling.Profile() as profile:
+        result = _simulate_group(_worker_state['simulator'], _worker_state['seed_seq'], _worker_state['ids'], *task,
+                                 rows=rows, as_sparse=as_sparse, missing=missing)
+    return result, profile.stats()
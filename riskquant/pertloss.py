@@ -33,7 +33,7 @@ from riskquant.model import lognormal_magnitude, pert_frequency
 class PERTLoss(loss.Loss):
     def __init__(self, low_loss, high_loss, min_freq, max_freq, most_likely_freq, kurtosis=4):
         self.frequency_model = pert_frequency.PERTFrequency(min_freq, max_freq, most_likely_freq, kurtosis)
-        self.magnitude_model = lognormal_magnitude.LognormalMagnitude(low_loss, high_loss)
+        self.magnitude_model = lognormal_magnitude.LognormalMagnitude.shared(low_loss, high_loss)
         super(PERTLoss, self).__init__(
             self.frequency_model,
             self.magnitude_model)
@@ -0,0 +1,357 @@
+"""A struct-of-arrays simulation engine for portfolios of Poisson x lognormal losses.
+
+Instead of asking each SimpleLoss to draw its own events, the parameters of every
+scenario are kept in contiguous numpy arrays and a simulation draws all the event
+counts with one Poisson call, all the magnitudes with one lognormal call, and
+scatter-adds them into the year totals.
+
+Event counts are drawn per scenario over the whole span of years and each event is
+then assigned a uniformly random year. For a Poisson process this has exactly the
+same distribution as drawing a count for every year, but the work (and memory)
+scales with the number of events rather than scenarios x years.
+"""
+
+#   Copyright 2019-2020 Netflix, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import numpy as np
+from riskquant import profiling
+from riskquant import qmc
+from riskquant import sparse
+from riskquant import streams
+from riskquant import weighted
+from riskquant.model import lognormal_magnitude, poisson_frequency
+
+
+def supports(loss):
+    """True if the loss has a Poisson frequency and a lognormal magnitude (e.g. a SimpleLoss)."""
+    poisson = isinstance(getattr(loss, 'frequency_model', None), poisson_frequency.PoissonFrequency)
+    return poisson and isinstance(getattr(loss, 'magnitude_model', None), lognormal_magnitude.LognormalMagnitude)
+
+
+class SimpleLossPortfolio(object):
+    def __init__(self, frequency, mu, sigma, labels=None):
+        """:param frequency = Array of mean event rates per year, one per scenario
+        :param mu = Array of the mean of the log of each scenario's loss magnitude
+        :param sigma = Array of the standard deviation of the log of each scenario's loss magnitude
+        :param labels = Optional list of the label of each scenario, for riskquant.profiling
+        """
+        self.frequency = np.ascontiguousarray(frequency, dtype=float)
+        self.mu = np.ascontiguousarray(mu, dtype=float)
+        self.sigma = np.ascontiguousarray(sigma, dtype=float)
+        self.labels = labels
+        if not self.frequency.shape == self.mu.shape == self.sigma.shape:
+            raise AssertionError("Parameter arrays must have the same shape.")
+        if labels is not None and len(labels) != self.frequency.size:
+            raise AssertionError("Every scenario needs exactly one label.")
+        if np.any(self.frequency < 0):
+            raise AssertionError("Frequency must be non-negative.")
+
+    @classmethod
+    def from_losses(cls, loss_list):
+        """Build a portfolio from losses for which supports(loss) is True."""
+        if not all(supports(loss) for loss in loss_list):
+            raise AssertionError("Every loss needs a Poisson frequency and a lognormal magnitude.")
+        return cls([loss.frequency_model.frequency for loss in loss_list],
+                   [loss.magnitude_model.mu for loss in loss_list],
+                   [loss.magnitude_model.sigma for loss in loss_list],
+                   [getattr(loss, 'label', None) for loss in loss_list])
+
+    @classmethod
+    def from_ranges(cls, frequency, low_loss, high_loss):
+        """Build a portfolio from arrays of SimpleLoss parameters, without building SimpleLoss objects.
+
+        :param frequency = Array of mean event rates per year
+        :param low_loss, high_loss = Arrays of the 90% confidence interval of each loss magnitude,
+                                     fit as in riskquant.model.lognormal_magnitude"""
+        log_low = np.log(np.asarray(low_loss, dtype=float))
+        log_high = np.log(np.asarray(high_loss, dtype=float))
+        if np.any(log_low >= log_high):
+            raise AssertionError("High loss must exceed low loss.")
+        return cls(frequency, (log_low + log_high) / 2., lognormal_magnitude._CI_FACTOR * (log_high - log_low))
+
+    def __len__(self):
+        return self.frequency.size
+
+    def annualized_losses(self):
+        """:return Array of each scenario's expected loss per year"""
+        return self.frequency * np.exp(self.mu + self.sigma ** 2 / 2.)
+
+    def simulate_years(self, n, rng=None, first=0, last=None):
+        """Simulate n years of the summed losses of scenarios [first, last).
+
+        :param n = Number of years to simulate
+        :param rng = A numpy Generator or seed, or None for numpy's global random state, or a
+                     list of one Generator per scenario in [first, last) that draws all of that
+                     scenario's events, so they don't depend on the other scenarios
+        :param first, last = Range of scenarios to include. Defaults to all of them.
+        :return A numpy array of length n with the total loss of each simulated year"""
+        _, years, magnitudes = self._draw_events(n, rng, first, last)
+        started = profiling.start()
+        totals = np.bincount(years, weights=magnitudes, minlength=n)
+        profiling.record('aggregation', started, size=n)
+        return totals
+
+    def simulate_scenario_years(self, n, rng=None, first=0, last=None):
+        """Simulate n years of each of the scenarios [first, last) separately.
+
+        Draws exactly the same events as simulate_years with the same rng, so the rows
+        add up to its result (up to rounding).
+
+        :return A numpy array of shape (last - first, n) with one row of year losses per scenario"""
+        scenario, years, magnitudes = self._draw_events(n, rng, first, last)
+        num_scenarios = self.frequency[first:last].size
+        started = profiling.start()
+        rows = np.bincount(scenario * n + years, weights=magnitudes,
+                           minlength=num_scenarios * n).reshape(num_scenarios, n)
+        profiling.record('aggregation', started, size=rows.size)
+        return rows
+
+    def simulate_sparse(self, n, rng=None, first=0, last=None, rows=False):
+        """Simulate n years of scenarios [first, last) as riskquant.sparse.SparseYearLosses.
+
+        Draws exactly the same events as simulate_years with the same rng, but sums them
+        into only the years they fall in, so the work and memory scale with the number
+        of events rather than with n (or scenarios x n, with rows).
+
+        :param rows = Keep each scenario's year losses apart, as simulate_scenario_years does
+        :return SparseYearLosses of the total loss in each year, or with rows a list of
+                SparseYearLosses, one per scenario"""
+        scenario, years, magnitudes = self._draw_events(n, rng, first, last)
+        started = profiling.start()
+        if rows:
+            result = sparse.SparseYearLosses.from_scenario_events(self.frequency[first:last].size, n,
+                                                                  scenario, years, magnitudes)
+        else:
+            result = sparse.SparseYearLosses.from_events(n, years, magnitudes)
+        profiling.record('aggregation', started, size=magnitudes.size)
+        return result
+
+    def simulate_events(self, n, rng=None, first=0, last=None):
+        """Simulate the loss events of n years of scenarios [first, last): the events
+        that simulate_years, with the same rng, sums into each year.
+
+        :return Arrays (year, magnitude) with one entry per event, ordered by scenario"""
+        _, years, magnitudes = self._draw_events(n, rng, first, last)
+        return years, magnitudes
+
+    def simulate_variants(self, variants, n, rng=None):
+        """Simulate n years of this portfolio and of variants of its parameters, with common random numbers.
+
+        Every variant sees the same events: each scenario's events are drawn at the highest
+        of its rates, and a variant keeps an event with probability (its rate / that rate),
+        using one uniform per event shared by all variants (thinning a Poisson process gives
+        a Poisson process). Each kept event's magnitude comes from the same standard normal
+        z in every variant, exp(mu + sigma * z). So a variant with a lower rate loses a subset
+        of the events of one with a higher rate, and differences between variants have far
+        less sampling noise than separate simulations, at about the cost of one.
+
+        :param variants = List of SimpleLossPortfolio with the same scenarios as this one
+        :param n = Number of years to simulate
+        :param rng = A numpy Generator or seed, or None for numpy's global random state
+        :return A numpy array of shape (1 + len(variants), n): one row of year totals for this
+                portfolio, then one per variant"""
+        portfolios = [self] + list(variants)
+        if any(len(variant) != len(self) for variant in variants):
+            raise AssertionError("Every variant must have the same scenarios as the portfolio.")
+        frequency = np.array([variant.frequency for variant in portfolios])
+        rng = streams.as_generator(rng)
+        highest = frequency.max(axis=0)
+        started = profiling.start()
+        counts = rng.poisson(highest * n)
+        events = int(counts.sum())
+        started = profiling.record('frequency draw', started, events=events, size=counts.size)
+        scenario = np.repeat(np.arange(counts.size), counts)
+        normals = rng.standard_normal(events)
+        years = np.minimum((rng.random(events) * n).astype(np.int64), n - 1)
+        thinning = rng.random(events) * highest[scenario]
+        base_magnitudes = np.exp(self.mu[scenario] + self.sigma[scenario] * normals)
+        variant_magnitudes = []
+        for variant in portfolios:
+            magnitudes = base_magnitudes
+            changed = ((variant.mu != self.mu) | (variant.sigma != self.sigma))[scenario]
+            if changed.any():  # Only the events of scenarios with a changed magnitude are redrawn
+                magnitudes = base_magnitudes.copy()
+                changed_scenario = scenario[changed]
+                magnitudes[changed] = np.exp(variant.mu[changed_scenario] + variant.sigma[changed_scenario] * normals[changed])
+            variant_magnitudes.append(magnitudes)
+        started = profiling.record('magnitude draw', started, events=events, size=events)
+        totals = np.empty((len(portfolios), n))
+        for row, magnitudes in enumerate(variant_magnitudes):
+            if np.array_equal(frequency[row], highest):
+                totals[row] = np.bincount(years, weights=magnitudes, minlength=n)
+            else:
+                kept = thinning < frequency[row, scenario]
+                totals[row] = np.bincount(years[kept], weights=magnitudes[kept], minlength=n)
+        profiling.record('aggregation', started, size=totals.size)
+        return totals
+
+    def simulate_years_qmc(self, n, rng=None):
+        """Simulate n years from a scrambled Sobol sequence (see riskquant.qmc).
+
+        The portfolio is simulated as one compound Poisson process: each year's number of
+        events is Poisson with the total rate, and each event takes two coordinates, one for
+        its scenario (scenario i with probability frequency[i] / rate) and one for its magnitude.
+
+        :param n = Number of years to simulate
+        :param rng = A numpy Generator or seed for the scrambling
+        :return A numpy array of length n with the total loss of each simulated year"""
+        from scipy.special import ndtri
+        rate = float(self.frequency.sum())
+        if rate == 0:
+            return np.zeros(n)
+        started = profiling.start()
+        _, year, uniforms = qmc.event_uniforms(n, poisson_frequency.PoissonFrequency(rate).ppf, 2, rng)
+        started = profiling.record('frequency draw', started, events=year.size, size=n)
+        scenario = np.searchsorted(np.cumsum(self.frequency) / rate, uniforms[:, 0], side='right')
+        scenario = np.minimum(scenario, len(self) - 1)
+        magnitudes = np.exp(self.mu[scenario] + self.sigma[scenario] * ndtri(uniforms[:, 1]))
+        started = profiling.record('magnitude draw', started, events=year.size, size=year.size)
+        totals = np.bincount(year, weights=magnitudes, minlength=n)
+        profiling.record('aggregation', started, size=n)
+        return totals
+
+    def simulate_years_importance(self, n, frequency_tilt=None, magnitude_tilt=None, rng=None):
+        """Simulate n years from a distribution tilted towards large losses, with likelihood-ratio weights.
+
+        Every event rate is multiplied by frequency_tilt, and the log of every magnitude is
+        drawn magnitude_tilt of its standard deviations higher. A year with K events, whose
+        magnitudes were drawn z_1, ..., z_K standard deviations above their log-means, then
+        has the likelihood ratio (true over tilted density)
+
+            exp(rate * (frequency_tilt - 1)) / frequency_tilt ** K * prod_j exp(magnitude_tilt ** 2 / 2 - magnitude_tilt * z_j)
+
+        where rate is the total event rate of the portfolio. The ratio depends on the events
+        of a year, not on the number of scenarios. By default, the tilts add one standard
+        deviation (sqrt(rate)) to the expected number of events, and shift each magnitude by
+        1 / sqrt(rate) standard deviations (1 when rate < 1), so the year's total moves about
+        one standard deviation. Larger tilts make a few years dominate the weights (see
+        WeightedYearLosses.effective_sample_size). Importance sampling helps most for
+        rare losses; where a few heavy-tailed scenarios dominate a busy portfolio,
+        simulate_years_stratified is the better choice.
+
+        :param n = Number of years to simulate
+        :param frequency_tilt = Factor on every event rate, or None for 1 + 1 / sqrt(rate)
+        :param magnitude_tilt = Shift of every log-magnitude in standard deviations, or None for 1 / sqrt(max(rate, 1))
+        :param rng = A numpy Generator or seed, or None for numpy's global random state
+        :return riskquant.weighted.WeightedYearLosses of the n years"""
+        rate = float(self.frequency.sum())
+        if frequency_tilt is None:
+            frequency_tilt = 1. + 1. / np.sqrt(rate) if rate > 0 else 1.
+        if magnitude_tilt is None:
+            magnitude_tilt = 1. / np.sqrt(max(rate, 1.))
+        if frequency_tilt <= 0:
+            raise AssertionError("frequency_tilt must be positive.")
+        rng = streams.as_generator(rng)
+        started = profiling.start()
+        counts = rng.poisson(self.frequency * (frequency_tilt * n))
+        events = int(counts.sum())
+        started = profiling.record('frequency draw', started, events=events, size=counts.size)
+        scenario = np.repeat(np.arange(counts.size), counts)
+        shifts = rng.standard_normal(events) + magnitude_tilt
+        magnitudes = np.exp(self.mu[scenario] + self.sigma[scenario] * shifts)
+        years = np.minimum((rng.random(events) * n).astype(np.int64), n - 1)
+        started = profiling.record('magnitude draw', started, events=events, size=events)
+        totals = np.bincount(years, weights=magnitudes, minlength=n)
+        log_ratio = rate * (frequency_tilt - 1.) - np.log(frequency_tilt) * np.bincount(years, minlength=n)
+        log_ratio += np.bincount(years, weights=magnitude_tilt ** 2 / 2. - magnitude_tilt * shifts, minlength=n)
+        profiling.record('aggregation', started, size=n)
+        return weighted.WeightedYearLosses(totals, np.exp(log_ratio))
+
+    def simulate_years_stratified(self, n, rng=None):
+        """Simulate about n years, stratified by the number of events in a year.
+
+        The number of events in a year is Poisson with the total rate of the portfolio, and
+        each event is scenario i's with probability frequency[i] / rate. Years without events
+        lose nothing, so they are not simulated: one zero year carries their probability.
+        The other years are split into strata of 1, 2, ..., K - 1 events and one of K or
+        more, where K - 1 is the 1 - 1/n quantile of the count. Each stratum gets at least
+        one year, and otherwise years in proportion to its probability times the square root
+        of its count (the spread of a sum of k losses grows like sqrt(k)). Each of its years
+        weighs the stratum's probability divided by its number of years.
+
+        :param n = About the number of years to simulate
+        :param rng = A numpy Generator or seed, or None for numpy's global random state
+        :return riskquant.weighted.WeightedYearLosses of the simulated years and the zero year"""
+        from scipy.stats import poisson
+        rng = streams.as_generator(rng)
+        rate = float(self.frequency.sum())
+        if rate == 0:
+            return weighted.WeightedYearLosses(np.zeros(1), np.ones(1))
+        started = profiling.start()
+        top = int(poisson.ppf(1. - 1. / n, rate)) + 1  # The last stratum holds the counts from top up
+        counts = np.arange(1, top + 1)
+        probability = poisson.pmf(counts, rate)
+        probability[-1] = poisson.sf(top - 1, rate)
+        allocation = n * probability * np.sqrt(counts) / np.dot(probability, np.sqrt(counts))
+        years_per_stratum = np.maximum(np.round(allocation), 1).astype(np.int64)
+        stratum = np.repeat(np.arange(top), years_per_stratum)
+        num_events = counts[stratum]
+        tail = stratum == top - 1
+        # Invert the survival function for counts above top - 1 (1 - random() is in (0, 1])
+        num_events[tail] = np.maximum(poisson.isf((1. - rng.random(int(tail.sum()))) * probability[-1], rate), top)
+        events = int(num_events.sum())
+        started = profiling.record('frequency draw', started, events=events, size=stratum.size)
+        scenario = np.searchsorted(np.cumsum(self.frequency) / rate, rng.random(events), side='right')
+        scenario = np.minimum(scenario, len(self) - 1)
+        magnitudes = rng.lognormal(self.mu[scenario], self.sigma[scenario])
+        started = profiling.record('magnitude draw', started, events=events, size=events)
+        totals = np.bincount(np.repeat(np.arange(stratum.size), num_events), weights=magnitudes,
+                             minlength=stratum.size)
+        weights = probability[stratum] / years_per_stratum[stratum]
+        profiling.record('aggregation', started, size=stratum.size)
+        return weighted.WeightedYearLosses(np.concatenate([[0.], totals]),
+                                           np.concatenate([[np.exp(-rate)], weights]))
+
+    def _draw_events(self, n, rng, first, last):
+        """:return Arrays (scenario, year, magnitude) with one entry per event in n years"""
+        if isinstance(rng, list):
+            return self._draw_scenario_events(n, rng, first, last)
+        rng = streams.as_generator(rng)
+        scenarios = slice(first, last)
+        started = profiling.start()
+        counts = rng.poisson(self.frequency[scenarios] * n)  # Events per scenario over all n years
+        events = int(counts.sum())
+        started = self._record_draw('frequency draw', started, scenarios, counts, counts.size)
+        scenario = np.repeat(np.arange(counts.size), counts)
+        magnitudes = rng.lognormal(self.mu[scenarios][scenario], self.sigma[scenarios][scenario])
+        years = np.minimum((rng.random(magnitudes.size) * n).astype(np.int64), n - 1)
+        self._record_draw('magnitude draw', started, scenarios, counts, events)
+        return scenario, years, magnitudes
+
+    def _draw_scenario_events(self, n, rngs, first, last):
+        """_draw_events with one Generator per scenario, which draws all of that scenario's events"""
+        scenarios = slice(first, last)
+        if len(rngs) != self.frequency[scenarios].size:
+            raise AssertionError("Every scenario needs exactly one random stream.")
+        started = profiling.start()
+        counts = np.array([rng.poisson(frequency * n) for rng, frequency in zip(rngs, self.frequency[scenarios])],
+                          dtype=np.int64)
+        events = int(counts.sum())
+        started = self._record_draw('frequency draw', started, scenarios, counts, counts.size)
+        scenario = np.repeat(np.arange(counts.size), counts)
+        parameters = zip(rngs, self.mu[scenarios], self.sigma[scenarios], counts)
+        magnitudes = np.concatenate([np.empty(0)] + [rng.lognormal(mu, sigma, count) for rng, mu, sigma, count in parameters])
+        years = np.concatenate([np.empty(0, dtype=np.int64)] + [(rng.random(count) * n).astype(np.int64)
+                                                                for rng, count in zip(rngs, counts)])
+        years = np.minimum(years, n - 1)
+        self._record_draw('magnitude draw', started, scenarios, counts, events)
+        return scenario, years, magnitudes
+
+    def _record_draw(self, phase, started, scenarios, counts, size):
+        """Record a draw of the scenarios in the slice scenarios: one entry per scenario, with its events,
+        when the scenarios have labels."""
+        if self.labels is None:
+            return profiling.record(phase, started, events=int(counts.sum()), size=size)
+        return profiling.record_scenarios(phase, started, self.labels[scenarios], counts, size=size)
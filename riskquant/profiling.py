@@ -0,0 +1,152 @@
+"""Phase-level profiling of simulations and CLI runs.
+
+While a Profile is active, the simulation code records, for each phase (frequency
+draws, magnitude draws, per-year aggregation, percentiles, plotting, ...) and each
+scenario, the wall time, the number of calls, the number of loss events drawn and
+the size of the largest array involved:
+
+    with profiling.Profile() as profile:
+        m.loss_exceedance_curve(100000)
+    profile.report()
+
+Instrumented code calls start() before a phase and record() after it. With no
+active Profile, start() returns None and record() returns at once, so profiling
+costs two function calls per phase when it is off. The active Profile is a context
+variable, so concurrent threads (e.g. riskquant serve requests) don't record into
+each other's profiles. Pool worker processes (MultiLoss workers=...) profile their
+own tasks and send the statistics back to be merged, so their times add up the
+work of all the processes rather than the wall time.
+"""
+
+#   Copyright 2019-2020 Netflix, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import contextvars
+import json
+import threading
+import time
+
+
+# The Profile that phases are recorded in, or None when profiling is off.
+_active = contextvars.ContextVar('riskquant_profile', default=None)
+
+
+def active():
+    """:return The active Profile, or None when profiling is off"""
+    return _active.get()
+
+
+def start():
+    """:return The start time of a phase, or None when profiling is off"""
+    return time.perf_counter() if _active.get() is not None else None
+
+
+def record(phase, started, scenario=None, events=0, size=0):
+    """Record a phase that began at started (from start()) in the active Profile.
+
+    :param phase = Name of the phase
+    :param started = The value start() returned when the phase began
+    :param scenario = Label of the scenario the phase worked on, or None
+    :param events = Number of loss events drawn in the phase
+    :param size = Number of elements of the largest array the phase produced
+    :return The time now, to start the next phase with, or None when profiling is off"""
+    profile = _active.get()
+    if started is None or profile is None:
+        return None
+    now = time.perf_counter()
+    profile.add(phase, now - started, scenario, events, size)
+    return now
+
+
+def record_scenarios(phase, started, scenarios, events, size=0):
+    """Record a phase that worked on several scenarios at once, such as a vectorized draw, as one
+    call of each scenario. The time is split between them in proportion to their events.
+
+    :param scenarios = Labels of the scenarios
+    :param events = Number of loss events drawn for each scenario
+    :return As for record()"""
+    profile = _active.get()
+    if started is None or profile is None:
+        return None
+    now = time.perf_counter()
+    events = [int(count) for count in events]
+    total = sum(events)
+    for scenario, count in zip(scenarios, events):
+        share = count / total if total else 1. / len(events)
+        profile.add(phase, (now - started) * share, scenario, count, size)
+    return now
+
+
+def merge(stats):
+    """Add statistics from Profile.stats() of another process to the active Profile, if any."""
+    profile = _active.get()
+    if profile is not None:
+        profile.merge(stats)
+
+
+class Profile(object):
+    """Wall time, calls, events and peak array size of each (phase, scenario)."""
+
+    def __init__(self):
+        self._stats = {}
+        self._tokens = []
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self._tokens.append(_active.set(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        _active.reset(self._tokens.pop())
+
+    def add(self, phase, seconds, scenario=None, events=0, size=0, calls=1):
+        with self._lock:
+            stats = self._stats.get((phase, scenario))
+            if stats is None:
+                stats = self._stats[(phase, scenario)] = {'calls': 0, 'seconds': 0., 'events': 0, 'max_array_size': 0}
+            stats['calls'] += calls
+            stats['seconds'] += seconds
+            stats['events'] += int(events)
+            stats['max_array_size'] = max(stats['max_array_size'], int(size))
+
+    def stats(self):
+        """:return List of (phase, scenario, statistics) recorded so far, to merge() into another Profile"""
+        with self._lock:
+            return [(phase, scenario, dict(stats)) for (phase, scenario), stats in self._stats.items()]
+
+    def merge(self, stats):
+        """Add the statistics from another Profile's stats()."""
+        for phase, scenario, other in stats:
+            self.add(phase, other['seconds'], scenario, other['events'], other['max_array_size'], other['calls'])
+
+    def report(self):
+        """:return Dictionary with 'phases', the totals of each phase over all scenarios, and
+                  'scenarios', the statistics of each phase of each labelled scenario"""
+        phases = {}
+        scenarios = {}
+        with self._lock:
+            items = [(key, dict(stats)) for key, stats in self._stats.items()]
+        for (phase, scenario), stats in sorted(items, key=lambda item: (item[0][0], str(item[0][1]))):
+            total = phases.setdefault(phase, {'calls': 0, 'seconds': 0., 'events': 0, 'max_array_size': 0})
+            total['calls'] += stats['calls']
+            total['seconds'] += stats['seconds']
+            total['events'] += stats['events']
+            total['max_array_size'] = max(total['max_array_size'], stats['max_array_size'])
+            if scenario is not None:
+                scenarios.setdefault(str(scenario), {})[phase] = dict(stats)
+        return {'phases': phases, 'scenarios': scenarios}
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2, sort_keys=True)
@@ -0,0 +1,89 @@
+"""Quasi-Monte Carlo year simulation from scrambled Sobol sequences.
+
+Plain Monte Carlo estimates converge like 1 / sqrt(years). Drawing the uniforms behind
+each year from a scrambled Sobol sequence instead spreads the years evenly over the
+unit cube, and pushing them through inverse CDFs (ppf) gives estimates that converge
+faster for the same number of years.
+
+Each simulated year is one Sobol point: its first coordinate gives the number of events
+and the following ones the events, dimensions_per_event at a time, for up to
+max_events events. Further events of an unusually busy year use pseudo-random
+uniforms. Independently scrambled replicates of the sequence give error estimates:
+the spread of an estimate across replicates.
+"""
+
+#   Copyright 2019-2020 Netflix, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import numpy as np
+from riskquant import streams
+
+
+# Most events per year drawn from the Sobol sequence, which bounds its dimension (and memory).
+MAX_EVENTS = 16
+
+# Events per year are drawn from the sequence up to this quantile of the event count.
+EVENT_COUNT_QUANTILE = 0.999
+
+# Number of independently scrambled replicates for error estimates.
+DEFAULT_REPLICATES = 8
+
+
+def sobol(n, dimensions, rng=None):
+    """:param n = Number of points. Powers of 2 keep the sequence's balance properties; scipy warns otherwise.
+    :param dimensions = Dimension of each point
+    :param rng = A numpy Generator or seed for the scrambling
+    :return Array of shape (n, dimensions) of scrambled Sobol points in [0, 1)"""
+    from scipy.stats import qmc
+    rng = streams.as_generator(rng)
+    if not isinstance(rng, np.random.Generator):
+        rng = np.random.default_rng(rng.randint(0, 2 ** 32, dtype=np.int64))  # Seed the scrambling from the global state
+    return qmc.Sobol(dimensions, scramble=True, seed=rng).random(n)
+
+
+def event_uniforms(n, count_ppf, dimensions_per_event=1, rng=None):
+    """Draw the uniforms of n years of events from one Sobol sequence.
+
+    :param n = Number of years
+    :param count_ppf = Inverse CDF of the number of events in a year
+    :param dimensions_per_event = Number of uniforms each event needs
+    :param rng = A numpy Generator or seed, for the scrambling and any pseudo-random uniforms
+    :return Tuple (counts, year, uniforms): the number of events in each year, the year
+            of each event, and an (events x dimensions_per_event) array of their uniforms"""
+    rng = streams.as_generator(rng)
+    max_events = int(min(max(count_ppf(EVENT_COUNT_QUANTILE), 1), MAX_EVENTS))
+    points = sobol(n, 1 + dimensions_per_event * max_events, rng)
+    counts = np.asarray(count_ppf(points[:, 0])).astype(np.int64)
+    year = np.repeat(np.arange(n), counts)
+    first_event = np.cumsum(counts) - counts
+    position = np.arange(year.size) - first_event[year]  # Index of each event within its year
+    uniforms = np.empty((year.size, dimensions_per_event))
+    from_sequence = position < max_events
+    columns = 1 + dimensions_per_event * position[from_sequence, None] + np.arange(dimensions_per_event)
+    uniforms[from_sequence] = points[year[from_sequence, None], columns]
+    uniforms[~from_sequence] = rng.random((int(np.count_nonzero(~from_sequence)), dimensions_per_event))
+    return counts, year, uniforms
+
+
+def replicate_quantiles(replicates, q):
+    """Quantiles of replicated simulations, with error estimates.
+
+    :param replicates = Array with one row of simulated year losses per replicate
+    :param q = Quantile or array of quantiles in [0, 1]
+    :return Tuple (estimates, standard_errors): the quantiles of all the years together, and
+            the standard error of that estimate from the spread of the replicates' own quantiles"""
+    replicates = np.asarray(replicates)
+    estimates = np.quantile(replicates.ravel(), q)
+    spread = np.std(np.quantile(replicates, q, axis=1), axis=-1, ddof=1)
+    return estimates, spread / np.sqrt(replicates.shape[0])
@@ -0,0 +1,241 @@
+"""A long-lived worker that answers scenario and portfolio queries as JSON lines.
+
+    riskquant serve [--socket PATH] [--workers N] [--no-cache] [--cache-dir DIR]
+
+Each request is one line of JSON and gets one line of JSON back, with the request's
+"id". The server reads stdin and writes stdout, or with --socket serves any number
+of connections on a Unix socket. Imports, parsed registers, built models and seeded
+simulations (riskquant.cache) stay warm between requests, so a small query costs
+milliseconds rather than an interpreter start. Requests run concurrently on a
+bounded pool of threads, and responses are written as they finish, so they can
+come back out of order:
+
+    {"id": 1, "op": "prioritize", "file": "register.csv"}
+    {"id": 2, "op": "summary", "scenarios": [["L1", "Data breach", 0.1, 1000, 100000]], "years": 10000, "seed": 1}
+    {"id": 3, "op": "exceedance_curve", "file": "register.csv", "years": 100000, "seed": 1, "probs": [0.1, 0.01]}
+    {"id": 4, "op": "stats"}
+
+Scenarios come from a register "file" (re-read only when it changes) or from inline
+"scenarios" rows of label, name, probability, low_loss, high_loss. exceedance_curve
+also takes the MultiLoss.exceedance_curve options in CURVE_OPTIONS. The response is
+{"id": ..., "result": ...}, or {"id": ..., "error": "..."} for a bad request.
+"""
+
+#   Copyright 2019-2020 Netflix, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from argparse import ArgumentParser
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+import io
+import json
+import os
+import signal
+import socketserver
+import sys
+import threading
+import traceback
+
+import numpy as np
+import riskquant
+from riskquant import cache
+from riskquant import multiloss
+from riskquant import portfolio
+
+
+OPERATIONS = ('prioritize', 'summary', 'exceedance_curve', 'stats')
+
+# Request keys passed on to MultiLoss.exceedance_curve.
+CURVE_OPTIONS = ('streaming', 'analytic', 'tolerance', 'variance_reduction', 'qmc')
+
+# Years simulated when a request doesn't say, as for the CLI.
+DEFAULT_YEARS = 100000
+
+# Number of built portfolios kept warm, least recently used first out.
+DEFAULT_MAX_MODELS = 64
+
+
+class Server(object):
+    def __init__(self, workers=None, simulation_cache=None, max_models=DEFAULT_MAX_MODELS):
+        """:param workers = Number of requests answered at once. Defaults to the number of CPUs.
+        :param simulation_cache = A riskquant.cache.SimulationCache for seeded simulations, or None
+        :param max_models = Number of built portfolios kept warm
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.simulation_cache = simulation_cache
+        self.max_models = max_models
+        self.requests = 0
+        self._registers = {}
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        # At most 2 * workers requests are queued or running, so a fast client can't outrun the pool.
+        self._slots = threading.BoundedSemaphore(2 * self.workers)
+
+    def close(self):
+        self._executor.shutdown()
+
+    def serve_stream(self, reader, writer):
+        """Answer every JSON line read from reader with a JSON line on writer, until reader ends."""
+        write_lock = threading.Lock()
+        pending = set()
+        for line in reader:
+            if not line.strip():
+                continue
+            self._slots.acquire()
+            future = self._executor.submit(self._answer_line, line, writer, write_lock)
+            pending.add(future)
+            future.add_done_callback(pending.discard)
+        wait(list(pending))
+
+    def _answer_line(self, line, writer, write_lock):
+        try:
+            response = json.dumps(self.answer(line)) + '\n'
+            with write_lock:
+                writer.write(response)
+                writer.flush()
+        finally:
+            self._slots.release()
+
+    def answer(self, line):
+        """:param line = One JSON request
+        :return The response, a dictionary with the request's 'id' and its 'result' or 'error'.
+                Every request gets a response, even one that fails unexpectedly."""
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("A request must be a JSON object.")
+            request_id = request.get('id')
+            with self._lock:
+                self.requests += 1
+            return {'id': request_id, 'result': self._run(request)}
+        except (AssertionError, KeyError, OSError, TypeError, ValueError) as e:
+            return {'id': request_id, 'error': '{}: {}'.format(type(e).__name__, e)}
+        except Exception as e:  # A bug, not a bad request: log it, but still answer so the client isn't left waiting
+            sys.stderr.write("Request {!r} failed:\n{}".format(request_id, traceback.format_exc()))
+            return {'id': request_id, 'error': 'Internal error {}: {}'.format(type(e).__name__, e)}
+
+    def _run(self, request):
+        op = request.get('op')
+        if op == 'stats':
+            return self.stats()
+        if op not in OPERATIONS:
+            raise ValueError("Unknown op {!r}, expected one of {}.".format(op, ', '.join(OPERATIONS)))
+        columns = self._columns(request)
+        labels, names, frequency, low_loss, high_loss = columns
+        if op == 'prioritize':
+            annualized_losses = portfolio.SimpleLossPortfolio.from_ranges(frequency, low_loss, high_loss).annualized_losses()
+            return [[labels[i], names[i], annualized_losses[i]] for i in np.argsort(-annualized_losses, kind='stable').tolist()]
+        m = self._model(columns)
+        years = int(request.get('years', DEFAULT_YEARS))
+        if years <= 0:
+            raise ValueError("years must be positive, not {}.".format(years))
+        if op == 'summary':
+            return {key: value.item() for key, value in m.summarize_loss(years, seed=request.get('seed')).items()}
+        options = {key: request[key] for key in CURVE_OPTIONS if key in request}
+        losses, probs = m.exceedance_curve(years, probs=request.get('probs'), seed=request.get('seed'), **options)
+        return {'losses': np.asarray(losses).tolist(), 'probs': probs.tolist()}
+
+    def stats(self):
+        """:return Dictionary of the number of requests, warm registers and models, and cache statistics"""
+        with self._lock:
+            result = {'requests': self.requests, 'registers': len(self._registers), 'models': len(self._models)}
+        if self.simulation_cache is not None:
+            result['cache'] = self.simulation_cache.stats()
+        return result
+
+    def _columns(self, request):
+        """:return The (labels, names, frequency, low_loss, high_loss) arrays of the request's scenarios"""
+        if 'file' in request:
+            return self._register(request['file'])
+        if not isinstance(request.get('scenarios'), list):
+            raise ValueError('A request needs a register "file" or a list of "scenarios".')
+        return riskquant.rows_to_arrays(request['scenarios'], 'scenarios')
+
+    def _register(self, path):
+        """:return The parsed register at path, re-read only if it changed since the last request"""
+        stat = os.stat(path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            known = self._registers.get(path)
+        if known is not None and known[0] == version:
+            return known[1]
+        columns = riskquant.csv_to_arrays(path)
+        with self._lock:
+            self._registers[path] = (version, columns)
+        return columns
+
+    def _model(self, columns):
+        """:return The MultiLoss of the scenarios, built once and kept warm"""
+        labels, names, frequency, low_loss, high_loss = columns
+        key = (tuple(labels), tuple(names), frequency.tobytes(), low_loss.tobytes(), high_loss.tobytes())
+        with self._lock:
+            m = self._models.get(key)
+            if m is not None:
+                self._models.move_to_end(key)
+                return m
+        m = multiloss.MultiLoss(riskquant._arrays_to_simpleloss(columns), cache=self.simulation_cache)
+        with self._lock:
+            self._models[key] = m
+            while len(self._models) > self.max_models:
+                self._models.popitem(last=False)
+        return m
+
+
+class _StreamHandler(socketserver.StreamRequestHandler):
+    """Serve one Unix socket connection with the listener's Server."""
+
+    def handle(self):
+        self.server.answerer.serve_stream(io.TextIOWrapper(self.rfile, encoding='UTF-8'),
+                                          io.TextIOWrapper(self.wfile, encoding='UTF-8'))
+
+
+def serve_socket(server, path):
+    """Answer requests from every connection to a Unix socket at path, until interrupted or terminated."""
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))  # Unwind, so the socket file is removed
+    with socketserver.ThreadingUnixStreamServer(path, _StreamHandler) as listener:
+        listener.answerer = server
+        sys.stderr.write("Listening on {}\n".format(path))
+        try:
+            listener.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(path)
+
+
+def main(args=None):
+    parser = ArgumentParser(prog='riskquant serve',
+                            description='Answer scenario and portfolio queries as JSON lines.')
+    parser.add_argument('--socket', metavar='PATH', help='listen on this Unix socket instead of stdin')
+    parser.add_argument('--workers', type=int, help='number of requests answered at once [default: CPUs]')
+    parser.add_argument('--no-cache', dest='cache', action='store_false',
+                        help='don\'t re-use or save seeded simulations in the simulation cache')
+    parser.add_argument('--cache-dir', metavar='DIR',
+                        help='simulation cache directory [default {}]'.format(cache.default_directory()))
+    args = parser.parse_args(args)
+
+    simulation_cache = None
+    if args.cache:
+        simulation_cache = cache.SimulationCache(directory=args.cache_dir or cache.default_directory())
+    server = Server(args.workers, simulation_cache)
+    try:
+        if args.socket:
+            serve_socket(server, args.socket)
+        else:
+            server.serve_stream(sys.stdin, sys.stdout)
+    finally:
+        server.close()
+    return 0
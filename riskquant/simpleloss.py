@@ -39,4 +39,4 @@ class SimpleLoss(loss.Loss):
         self.high_loss = high_loss
         super(SimpleLoss, self).__init__(
             poisson_frequency.PoissonFrequency(frequency),
-            lognormal_magnitude.LognormalMagnitude(low_loss, high_loss))
+            lognormal_magnitude.LognormalMagnitude.shared(low_loss, high_loss))
@@ -0,0 +1,133 @@
+"""A mergeable, bounded-memory quantile sketch for streams of non-negative losses.
+
+Values are counted in logarithmically spaced buckets (as in DDSketch), so any
+quantile is reported within a fixed relative error, memory depends only on the
+range of values seen (not how many), and sketches of separate streams can be merged.
+"""
+
+#   Copyright 2019-2020 Netflix, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import math
+
+import numpy as np
+
+
+class QuantileSketch(object):
+    def __init__(self, relative_accuracy=0.001, min_value=0.01):
+        """:param relative_accuracy = Maximum relative error of reported quantiles
+        :param min_value = Values below this are counted (and reported) as zero losses.
+                           The default of 0.01 treats anything under a cent as no loss.
+        """
+        if not 0 < relative_accuracy < 1:
+            raise AssertionError("Relative accuracy must be between 0 and 1.")
+        if min_value <= 0:
+            raise AssertionError("Minimum value must be positive.")
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self._buckets = np.zeros(0, dtype=np.int64)  # Counts of buckets _offset, _offset + 1, ...
+        self._offset = 0
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+
+    def add(self, values):
+        """Add an array of non-negative values to the sketch."""
+        values = np.asarray(values, dtype=float).ravel()
+        if values.size == 0:
+            return
+        if values.min() < 0:
+            raise AssertionError("Sketched values must be non-negative.")
+        self.count += values.size
+        self.sum += float(values.sum())
+        self.minimum = min(self.minimum, float(values.min()))
+        self.maximum = max(self.maximum, float(values.max()))
+
+        positive = values[values >= self.min_value]
+        self.zero_count += values.size - positive.size
+        if positive.size:
+            keys = np.ceil(np.log(positive) / self._log_gamma).astype(np.int64)
+            low = int(keys.min())
+            self._add_buckets(low, np.bincount(keys - low))
+
+    def merge(self, other):
+        """Add all the values counted by another sketch with the same parameters."""
+        if (other.relative_accuracy, other.min_value) != (self.relative_accuracy, self.min_value):
+            raise AssertionError("Only sketches with the same parameters can be merged.")
+        self.count += other.count
+        self.sum += other.sum
+        self.zero_count += other.zero_count
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        if other._buckets.size:
+            self._add_buckets(other._offset, other._buckets)
+
+    def _add_buckets(self, offset, counts):
+        if self._buckets.size == 0:
+            self._offset, self._buckets = offset, counts.astype(np.int64)
+            return
+        low = min(self._offset, offset)
+        high = max(self._offset + self._buckets.size, offset + counts.size)
+        if (low, high) != (self._offset, self._offset + self._buckets.size):
+            grown = np.zeros(high - low, dtype=np.int64)
+            grown[self._offset - low:self._offset - low + self._buckets.size] = self._buckets
+            self._offset, self._buckets = low, grown
+        self._buckets[offset - self._offset:offset - self._offset + counts.size] += counts
+
+    def _bucket_values(self, keys):
+        """Representative value of each bucket key, within relative_accuracy of every value in it."""
+        return 2. * self._gamma ** keys / (self._gamma + 1.)
+
+    def quantile(self, q):
+        """:param q = Quantile or array of quantiles in [0, 1]
+        :return The estimated value(s) at q, using the same rank convention as np.quantile."""
+        if self.count == 0:
+            raise AssertionError("Cannot compute quantiles of an empty sketch.")
+        q = np.asarray(q, dtype=float)
+        ranks = q * (self.count - 1)
+        cumulative = self.zero_count + np.cumsum(self._buckets)
+        index = np.searchsorted(cumulative, ranks, side='right')
+        values = self._bucket_values(self._offset + np.minimum(index, self._buckets.size - 1))
+        result = np.where(ranks < self.zero_count, 0.0, values)
+        # The extremes are tracked exactly.
+        result = np.where(ranks >= self.count - 1, self.maximum, result)
+        result = np.where(ranks <= 0, self.minimum, result)
+        return np.clip(result, self.minimum if self.zero_count == 0 else 0.0, self.maximum)
+
+    def percentile(self, p):
+        """Like quantile(), with p in [0, 100]."""
+        return self.quantile(np.asarray(p, dtype=float) / 100.)
+
+    def mean(self):
+        return self.sum / self.count
+
+    def mode(self):
+        """Representative value of the most populated bucket (zero if most values were zero)."""
+        if self._buckets.size == 0 or self.zero_count >= self._buckets.max():
+            return 0.0
+        return float(self._bucket_values(self._offset + int(np.argmax(self._buckets))))
+
+    def summarize_loss(self):
+        """Statistics about the sketched losses, with the same keys as Loss.summarize_loss."""
+        percentiles = self.percentile([10, 50, 90]).astype(int)
+        return {'minimum': int(self.minimum),
+                'tenth_percentile': percentiles[0],
+                'mode': int(self.mode()),
+                'median': percentiles[1],
+                'ninetieth_percentile': percentiles[2],
+                'maximum': int(self.maximum)}
@@ -0,0 +1,173 @@
+"""Sparse year losses: the years with a loss and their loss, for rarely occurring scenarios.
+
+A scenario with an annual probability of 0.001-0.05 has no loss in almost every
+simulated year. SparseYearLosses keeps only the years with a non-zero loss, so
+memory, aggregation and percentile costs scale with the number of loss events
+rather than with the number of years. All losses are assumed to be non-negative.
+"""
+
+#   Copyright 2019-2020 Netflix, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import numpy as np
+from riskquant import loss
+
+
+class SparseYearLosses(object):
+    def __init__(self, years, index, values):
+        """:param years = Number of simulated years
+        :param index = Increasing array of the years with a loss
+        :param values = Array of the (non-negative) loss in each of those years
+        """
+        self.years = years
+        self.index = np.asarray(index, dtype=np.int64)
+        self.values = np.asarray(values)
+        if self.index.shape != self.values.shape:
+            raise AssertionError("Every year with a loss needs exactly one loss value.")
+
+    @classmethod
+    def from_dense(cls, losses):
+        """Build from an array with the loss of every year."""
+        losses = np.asarray(losses)
+        index = np.flatnonzero(losses)
+        return cls(losses.size, index, losses[index])
+
+    @classmethod
+    def from_rows(cls, matrix):
+        """:return List of SparseYearLosses, one for each row of a (scenarios x years) matrix"""
+        matrix = np.asarray(matrix)
+        row, index = np.nonzero(matrix)
+        bounds = np.searchsorted(row, np.arange(matrix.shape[0] + 1))
+        values = matrix[row, index]
+        return [cls(matrix.shape[1], index[low:high], values[low:high])
+                for low, high in zip(bounds[:-1], bounds[1:])]
+
+    @classmethod
+    def from_events(cls, years, year, values):
+        """Sum loss events into the years they fall in, touching only those years.
+
+        :param years = Number of simulated years
+        :param year = Array of the year of each event
+        :param values = Array of the loss of each event"""
+        index, position = np.unique(year, return_inverse=True)
+        return cls(years, index, np.bincount(position, weights=values, minlength=index.size))
+
+    @classmethod
+    def from_scenario_events(cls, num_scenarios, years, scenario, year, values):
+        """Like from_events, keeping each scenario's year losses apart.
+
+        :return List of SparseYearLosses, one per scenario 0, 1, ..., num_scenarios - 1"""
+        key, position = np.unique(np.asarray(scenario, dtype=np.int64) * years + year, return_inverse=True)
+        sums = np.bincount(position, weights=values, minlength=key.size)
+        bounds = np.searchsorted(key, np.arange(num_scenarios + 1) * years)
+        return [cls(years, key[low:high] - row * years, sums[low:high])
+                for row, (low, high) in enumerate(zip(bounds[:-1], bounds[1:]))]
+
+    def pack(self):
+        """:return A (2 x years with a loss) array of the index and values, e.g. for a SimulationCache"""
+        return np.stack([self.index.astype(float), self.values])
+
+    @classmethod
+    def unpack(cls, years, packed):
+        """The inverse of pack()."""
+        return cls(years, packed[0].astype(np.int64), packed[1])
+
+    @classmethod
+    def pack_rows(cls, rows):
+        """:return A (3 x entries) array of the row, index and values of a list of SparseYearLosses"""
+        return np.concatenate([[np.full(row.index.size, float(i))] + list(row.pack()) for i, row in enumerate(rows)],
+                              axis=1) if rows else np.zeros((3, 0))
+
+    @classmethod
+    def unpack_rows(cls, num_rows, years, packed):
+        """The inverse of pack_rows()."""
+        bounds = np.searchsorted(packed[0], np.arange(num_rows + 1))
+        return [cls.unpack(years, packed[1:, low:high]) for low, high in zip(bounds[:-1], bounds[1:])]
+
+    @classmethod
+    def concatenate(cls, parts):
+        """Join the year losses of consecutive spans of years, e.g. chunks of a simulation."""
+        if not parts:
+            return cls(0, [], [])
+        offsets = np.cumsum([0] + [part.years for part in parts])
+        return cls(int(offsets[-1]),
+                   np.concatenate([part.index + offset for part, offset in zip(parts, offsets)]),
+                   np.concatenate([part.values for part in parts]))
+
+    @classmethod
+    def sum(cls, parts):
+        """Aggregate the year losses of several scenarios over the same years.
+
+        :returns: SparseYearLosses of the total loss in each year."""
+        if not parts:
+            raise AssertionError("Cannot sum an empty list of year losses.")
+        years = parts[0].years
+        if any(part.years != years for part in parts):
+            raise AssertionError("Only year losses of the same number of years can be summed.")
+        index, position = np.unique(np.concatenate([part.index for part in parts]), return_inverse=True)
+        values = np.bincount(position, weights=np.concatenate([part.values for part in parts]),
+                             minlength=index.size)
+        return cls(years, index, values)
+
+    def to_dense(self, dtype=np.float64, out=None):
+        """:return Array with the loss of every year, written into out if it is given"""
+        if out is None:
+            out = np.zeros(self.years, dtype=dtype)
+        else:
+            out[:] = 0
+        out[self.index] = self.values
+        return out
+
+    def mean(self):
+        return self.values.sum() / self.years
+
+    def quantile(self, q):
+        """:param q = Quantile or array of quantiles in [0, 1]
+        :return The value(s) at q, the same as np.quantile of the dense year losses.
+                Only the years with a loss are sorted; the others are known to be zero."""
+        q = np.asarray(q, dtype=float)
+        if self.values.size == 0:
+            return np.zeros_like(q)
+        ordered = np.sort(self.values)
+        zeros = self.years - ordered.size
+        ranks = q * (self.years - 1)
+        low = np.floor(ranks).astype(np.int64)
+        high = np.minimum(low + 1, self.years - 1)
+
+        def value_at(rank):
+            return np.where(rank < zeros, 0.0, ordered[np.maximum(rank - zeros, 0)])
+
+        below, above = value_at(low), value_at(high)
+        fraction = ranks - low
+        # Interpolate as np.quantile does, so the results are identical, not just close.
+        return np.where(fraction >= 0.5, above - (above - below) * (1 - fraction), below + (above - below) * fraction)
+
+    def percentile(self, p):
+        """Like quantile(), with p in [0, 100]."""
+        return self.quantile(np.asarray(p, dtype=float) / 100.)
+
+    def summarize_loss(self, mode_bins=loss.DEFAULT_MODE_BINS):
+        """Statistics about the year losses, the same as Loss.summarize_loss of the dense array."""
+        minimum, tenth, median, ninetieth, maximum = self.quantile([0., .1, .5, .9, 1.])
+        if self.values.size:
+            mode = loss.histogram_mode(self.values, minimum, maximum, mode_bins,
+                                       zeros=self.years - self.values.size)
+        else:
+            mode = 0.
+        return {'minimum': minimum.astype(int),
+                'tenth_percentile': tenth.astype(int),
+                'mode': np.float64(mode).astype(int),
+                'median': median.astype(int),
+                'ninetieth_percentile': ninetieth.astype(int),
+                'maximum': maximum.astype(int)}
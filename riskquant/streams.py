@@ -0,0 +1,106 @@
+"""Random number streams for reproducible simulations.
+
+Every simulation accepts either an explicit numpy Generator (``rng``) or a
+``seed``. A seed is expanded with numpy's SeedSequence into independent
+streams, one per (scenario, chunk of years), so results are bit-for-bit
+reproducible no matter how the work is split up or in what order the pieces run.
+"""
+
+#   Copyright 2019-2020 Netflix, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from functools import lru_cache
+import inspect
+
+import numpy as np
+
+
+# Number of years simulated from each independent stream. Changing it changes
+# which random numbers each year sees, so it is part of a seeded result's identity.
+DEFAULT_CHUNK_YEARS = 65536
+
+
+def as_generator(rng=None):
+    """Resolve an rng argument to something with the numpy random sampling methods.
+
+    :arg: rng = None to use numpy's global random state (np.random.seed applies),
+                a numpy Generator, or anything np.random.default_rng accepts as a seed.
+
+    :returns: The np.random module or a numpy Generator."""
+    if rng is None:
+        return np.random
+    if rng is np.random or isinstance(rng, (np.random.Generator, np.random.RandomState)):
+        return rng
+    return np.random.default_rng(rng)
+
+
+def call_with_rng(function, *args, rng=None):
+    """Call function(*args), passing rng=rng only when rng isn't None and function takes an rng.
+
+    Models with the original draw(n=1) interface, and losses with simulate_years(n),
+    then still work, drawing from numpy's global random state.
+
+    :returns: What function returns."""
+    if rng is None or not _takes_rng(getattr(function, '__func__', function)):
+        return function(*args)
+    return function(*args, rng=rng)
+
+
+@lru_cache(maxsize=None)
+def _takes_rng(function):
+    try:
+        parameters = inspect.signature(function).parameters.values()
+    except (TypeError, ValueError):
+        return True
+    return any(parameter.name == 'rng' or parameter.kind == parameter.VAR_KEYWORD for parameter in parameters)
+
+
+def seed_sequence(seed=None):
+    """Resolve a seed argument to a numpy SeedSequence.
+
+    :arg: seed = None for fresh OS entropy, an int or sequence of ints, a SeedSequence,
+                 or a numpy Generator (which is advanced to derive the entropy).
+
+    :returns: A numpy SeedSequence."""
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    if isinstance(seed, np.random.Generator):
+        return np.random.SeedSequence(seed.integers(0, 2 ** 32, size=4, dtype=np.uint64).tolist())
+    return np.random.SeedSequence(seed)
+
+
+def stream(seed_seq, *key):
+    """Get the Generator for the independent stream identified by key.
+
+    stream(s, i, j) is the stream of s.spawn(...)[i].spawn(...)[j], built directly
+    from the spawn key so it never depends on how many streams were spawned before.
+
+    :arg: seed_seq = The parent SeedSequence
+          key = One or more non-negative ints, e.g. (scenario stream id, chunk index)
+
+    :returns: A numpy Generator."""
+    child = np.random.SeedSequence(seed_seq.entropy,
+                                   spawn_key=tuple(seed_seq.spawn_key) + key,
+                                   pool_size=seed_seq.pool_size)
+    return np.random.Generator(np.random.PCG64(child))
+
+
+def year_chunks(n, chunk_years=DEFAULT_CHUNK_YEARS):
+    """Split n years into consecutive chunks.
+
+    :returns: List of (chunk_index, start, stop) tuples covering range(n)."""
+    if chunk_years < 1:
+        raise AssertionError("chunk_years must be positive.")
+    return [(index, start, min(start + chunk_years, n))
+            for index, start in enumerate(range(0, n, chunk_years))]
@@ -0,0 +1,98 @@
+"""Weighted year losses, from variance-reduced simulations.
+
+Importance sampling and stratified sampling (SimpleLossPortfolio.simulate_years_importance
+and simulate_years_stratified) spend their simulated years where the tail is, rather
+than on the zero-loss and ordinary years that dominate plain Monte Carlo. Each simulated
+year then stands for a different share of the true distribution: its weight. Quantiles
+and summaries come from the weighted empirical distribution, with the weights
+normalized to add up to one.
+"""
+
+#   Copyright 2019-2020 Netflix, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import numpy as np
+from riskquant import loss
+
+
+class WeightedYearLosses(object):
+    def __init__(self, values, weights):
+        """:param values = Array of simulated year losses
+        :param weights = Array of the non-negative weight of each year, e.g. likelihood ratios
+        """
+        self.values = np.asarray(values)
+        self.weights = np.asarray(weights, dtype=float)
+        if self.values.shape != self.weights.shape or self.values.ndim != 1:
+            raise AssertionError("Every year loss needs exactly one weight.")
+        if np.any(self.weights < 0) or not self.weights.sum() > 0:
+            raise AssertionError("Weights must be non-negative, and not all zero.")
+        self._order = None
+
+    def __len__(self):
+        return self.values.size
+
+    def _sorted(self):
+        """:return Arrays (values, cumulative normalized weights) in increasing order of value"""
+        if self._order is None:
+            self._order = np.argsort(self.values, kind='stable')
+        cumulative = np.cumsum(self.weights[self._order])
+        return self.values[self._order], cumulative / cumulative[-1]
+
+    def mean(self):
+        return float(np.dot(self.values, self.weights) / self.weights.sum())
+
+    def effective_sample_size(self):
+        """:return The number of equally weighted years with the same sampling variance,
+                  (sum of weights) ** 2 / (sum of squared weights). Much smaller than
+                  len(self) means a few heavy years dominate the estimates."""
+        return float(self.weights.sum() ** 2 / np.dot(self.weights, self.weights))
+
+    def quantile(self, q):
+        """:param q = Quantile or array of quantiles in [0, 1]
+        :return The smallest year loss(es) whose cumulative weight reaches q. With equal
+                weights this is np.quantile(values, q, method='inverted_cdf')."""
+        values, cdf = self._sorted()
+        index = np.searchsorted(cdf, np.asarray(q, dtype=float), side='left')
+        return values[np.minimum(index, values.size - 1)]
+
+    def percentile(self, p):
+        """Like quantile(), with p in [0, 100]."""
+        return self.quantile(np.asarray(p, dtype=float) / 100.)
+
+    def exceedance_probability(self, losses):
+        """:return The weighted share of years with a loss above each of losses"""
+        values, cdf = self._sorted()
+        index = np.searchsorted(values, np.asarray(losses, dtype=float), side='right')
+        return 1. - np.concatenate([[0.], cdf])[index]
+
+    def exceedance_curve(self, probs=None):
+        """Loss Exceedance Curve data, as MultiLoss.exceedance_curve.
+
+        :returns: Tuple (losses, probs) of numpy arrays."""
+        if probs is None:
+            from riskquant import multiloss
+            probs = multiloss.DEFAULT_EXCEEDANCE_PROBS
+        probs = np.asarray(probs, dtype=float)
+        return self.quantile(1. - probs), probs
+
+    def summarize_loss(self, mode_bins=loss.DEFAULT_MODE_BINS):
+        """Statistics about the weighted year losses, with the keys of Loss.summarize_loss."""
+        minimum, tenth, median, ninetieth, maximum = self.quantile([0., .1, .5, .9, 1.])
+        mode = loss.histogram_mode(self.values, minimum, maximum, mode_bins, weights=self.weights)
+        return {'minimum': minimum.astype(int),
+                'tenth_percentile': tenth.astype(int),
+                'mode': np.float64(mode).astype(int),
+                'median': median.astype(int),
+                'ninetieth_percentile': ninetieth.astype(int),
+                'maximum': maximum.astype(int)}
@@ -0,0 +1,186 @@
+"""A persisted year-loss table: the simulated loss of every scenario in every year.
+
+A table is a directory holding
+
+* losses.npy = A (scenarios x years) float64 (or float32) array, one row of year losses per scenario
+* scenarios.json = The label and name of each row, and the number of years
+
+Tables are read through a numpy memory map, so follow-up questions (a subset of
+scenarios, per-label LECs, summaries) are answered at disk-read speed from one
+expensive simulation instead of re-simulating. Write one with
+MultiLoss.write_year_loss_table.
+"""
+
+#   Copyright 2019-2020 Netflix, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import json
+import os
+
+import numpy as np
+from riskquant import loss
+
+
+LOSSES_FILE = 'losses.npy'
+SCENARIOS_FILE = 'scenarios.json'
+
+# Number of rows summed at a time when aggregating, to bound memory for long tables.
+ROWS_PER_BLOCK = 64
+
+# Tail levels of the tail-contribution report: the 1-in-20 and 1-in-100 year losses.
+DEFAULT_TAIL_LEVELS = (0.95, 0.99)
+
+
+class YearLossTable(object):
+    def __init__(self, path, mode='r'):
+        """Open an existing table.
+
+        :param path = Directory of the table
+        :param mode = Memory map mode: 'r' (read-only, default) or 'r+' (read-write)
+        """
+        self.path = path
+        with open(os.path.join(path, SCENARIOS_FILE), 'r') as f:
+            scenarios = json.load(f)
+        self.labels = scenarios['labels']
+        self.names = scenarios['names']
+        self.losses = np.load(os.path.join(path, LOSSES_FILE), mmap_mode=mode)
+        if self.losses.shape != (len(self.labels), scenarios['years']):
+            raise AssertionError("Year-loss table {} does not match its scenario list.".format(path))
+
+    @classmethod
+    def create(cls, path, labels, names, n, dtype=np.float64):
+        """Create a zero-filled table for the given scenarios and n years, opened read-write.
+        A float32 table takes half the space of the default float64 one."""
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, SCENARIOS_FILE), 'w') as f:
+            json.dump({'labels': list(labels), 'names': list(names), 'years': n}, f)
+        losses = np.lib.format.open_memmap(os.path.join(path, LOSSES_FILE), mode='w+',
+                                           dtype=dtype, shape=(len(labels), n))
+        del losses  # Flush the header and allocation before reopening
+        return cls(path, mode='r+')
+
+    def __len__(self):
+        return len(self.labels)
+
+    @property
+    def years(self):
+        return self.losses.shape[1]
+
+    def flush(self):
+        self.losses.flush()
+
+    def scenarios(self, labels=None, exclude_labels=None):
+        """Select scenarios by label.
+
+        :arg: [labels] = Only include scenarios with these labels. Default: all.
+              [exclude_labels] = Leave out scenarios with these labels.
+
+        :returns: Array of the selected row indices."""
+        include = set(self.labels if labels is None else labels)
+        exclude = set(exclude_labels or [])
+        return np.array([i for i, label in enumerate(self.labels)
+                         if label in include and label not in exclude], dtype=np.int64)
+
+    def _rows(self, scenarios):
+        if scenarios is None:
+            return np.arange(len(self))
+        scenarios = np.asarray(scenarios)
+        if scenarios.dtype == bool:
+            return np.flatnonzero(scenarios)
+        return scenarios.astype(np.int64)
+
+    def annualized_losses(self, scenarios=None):
+        """:return Array of the mean simulated annual loss of each selected scenario"""
+        rows = self._rows(scenarios)
+        means = np.zeros(rows.size)
+        for block in range(0, rows.size, ROWS_PER_BLOCK):
+            means[block:block + ROWS_PER_BLOCK] = self.losses[rows[block:block + ROWS_PER_BLOCK]].mean(axis=1)
+        return means
+
+    def top_scenarios(self, k):
+        """:return Row indices of the k scenarios with the largest mean simulated annual loss"""
+        return np.argsort(-self.annualized_losses(), kind='stable')[:k]
+
+    def aggregate(self, scenarios=None):
+        """Sum the year losses of a subset of scenarios.
+
+        :arg: [scenarios] = Row indices or boolean mask of the scenarios to include. Default: all.
+
+        :returns: Array of the total loss in each simulated year."""
+        rows = self._rows(scenarios)
+        totals = np.zeros(self.years)
+        for block in range(0, rows.size, ROWS_PER_BLOCK):
+            totals += self.losses[rows[block:block + ROWS_PER_BLOCK]].sum(axis=0)
+        return totals
+
+    def exceedance_curve(self, probs=None, scenarios=None):
+        """Loss Exceedance Curve data for a subset of scenarios, as MultiLoss.exceedance_curve.
+
+        :returns: Tuple (losses, probs) of numpy arrays."""
+        from riskquant import multiloss
+        if probs is None:
+            probs = multiloss.DEFAULT_EXCEEDANCE_PROBS
+        probs = np.asarray(probs, dtype=float)
+        return np.percentile(self.aggregate(scenarios), 100.0 * (1.0 - probs)), probs
+
+    def summarize_loss(self, scenarios=None):
+        """Loss.summarize_loss of the aggregate year losses of a subset of scenarios."""
+        return loss.Loss.summarize_loss(self.aggregate(scenarios))
+
+    def tail_contributions(self, levels=DEFAULT_TAIL_LEVELS):
+        """Each scenario's share of the tail of the aggregate year losses (see tail_contributions)."""
+        return tail_contributions(self.losses, levels, totals=self.aggregate())
+
+
+def tail_contributions(losses, levels=DEFAULT_TAIL_LEVELS, totals=None):
+    """Each scenario's contribution to the worst years of the aggregate, from one year-loss matrix.
+
+    At each level q, the tail is the (1 - q) * years worst aggregate years. A scenario's
+    contribution (co-TVaR) is its mean loss over those years, so the contributions add up
+    to the tail value at risk (TVaR), the mean aggregate loss of the tail years. Unlike the
+    annualized loss, this ranks the scenarios that drive the bad years. The sensitivity
+    of each scenario is the value at risk (the quantile q of the aggregate) without it,
+    for tornado charts of how much each scenario moves the 1-in-N year loss.
+    Everything comes from the same simulated years, a block of rows at a time.
+
+    :arg: losses = A (scenarios x years) array of year losses, e.g. YearLossTable.losses
+          [levels] = Quantile levels of the tail, e.g. 0.99 for the worst 1% of years.
+          [totals] = The aggregate year losses (losses summed over the scenarios), if known.
+
+    :returns: Dictionary of 'levels', and for each level the 'value_at_risk' and
+              'tail_value_at_risk' of the aggregate; and (scenarios x levels) arrays of each
+              scenario's 'contribution' and the 'value_at_risk_without' it."""
+    levels = np.asarray(levels, dtype=float)
+    if np.any(levels < 0) or np.any(levels >= 1):
+        raise AssertionError("Tail levels must be in [0, 1).")
+    scenarios, years = losses.shape
+    if totals is None:
+        totals = np.zeros(years)
+        for block in range(0, scenarios, ROWS_PER_BLOCK):
+            totals += losses[block:block + ROWS_PER_BLOCK].sum(axis=0)
+    # The worst years of each level, as positions in a list of the worst years of the widest tail.
+    sizes = np.maximum(np.round((1. - levels) * years).astype(np.int64), 1)
+    worst = np.argsort(-totals, kind='stable')[:sizes.max()]
+    contribution = np.empty((scenarios, levels.size))
+    without = np.empty((scenarios, levels.size))
+    for block in range(0, scenarios, ROWS_PER_BLOCK):
+        rows = np.asarray(losses[block:block + ROWS_PER_BLOCK])
+        tail = np.cumsum(rows[:, worst], axis=1)
+        contribution[block:block + rows.shape[0]] = tail[:, sizes - 1] / sizes
+        without[block:block + rows.shape[0]] = np.quantile(totals - rows, levels, axis=1).T
+    return {'levels': levels,
+            'value_at_risk': np.quantile(totals, levels),
+            'tail_value_at_risk': np.cumsum(totals[worst])[sizes - 1] / sizes,
+            'contribution': contribution,
+            'value_at_risk_without': without}
@@ -33,14 +33,17 @@ setup(
         'matplotlib',
         'numpy',
         'scipy',
-        # Tensorflow probability is tested and stable against Tensorflow 2.1.0
-        # https://github.com/tensorflow/probability/releases
-        'tensorflow >= 2.1.0',
-        'tensorflow_probability',
-        'tensorflow-probability[tf]'
     ],
     extras_require={
         'test': ['tox'],
+        # Only needed for PERTFrequency.distribution, the tensorflow_probability equivalent.
+        # Tensorflow probability is tested and stable against Tensorflow 2.1.0
+        # https://github.com/tensorflow/probability/releases
+        'tensorflow': [
+            'tensorflow >= 2.1.0',
+            'tensorflow_probability',
+            'tensorflow-probability[tf]'
+        ],
     },
     scripts=['bin/riskquant'],
 )
@@ -0,0 +1,76 @@
+#   Copyright 2019-2020 Netflix, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import unittest
+
+import numpy as np
+from riskquant import analytic
+from riskquant import multiloss
+from riskquant import portfolio
+from riskquant import simpleloss
+
+
+class TestAnalytic(unittest.TestCase):
+    def setUp(self):
+        self.losses = [simpleloss.SimpleLoss('ALICE', 'Alice steals the data', 0.3, 1000, 10000),
+                       simpleloss.SimpleLoss('BOB', 'Bob steals the data', 0.1, 10000, 1000000)]
+
+    def assert_matches_monte_carlo(self, losses, q, years):
+        """Check the analytic quantiles and mean against years simulated with a fixed seed,
+        within 4 standard errors of the simulation."""
+        distribution = analytic.aggregate_distribution(losses)
+        simulated = portfolio.SimpleLossPortfolio.from_losses(losses).simulate_years(years, rng=1)
+        q = np.asarray(q)
+        spread = 4. * np.sqrt(years * q * (1. - q))  # Order statistics that bracket each quantile
+        ranks = np.clip(np.concatenate([np.floor(years * q - spread), np.ceil(years * q + spread)]), 0, years - 1)
+        ordered = np.partition(simulated, ranks.astype(np.int64))
+        low, high = np.split(ordered[ranks.astype(np.int64)], 2)
+        estimate = distribution.quantile(q)
+        self.assertTrue(np.all((low <= estimate) & (estimate <= high)), (low, estimate, high))
+        lower, upper = distribution.quantile_bounds(q)
+        self.assertTrue(np.all((lower <= estimate) & (estimate <= upper)))
+
+        self.assertAlmostEqual(sum(loss.annualized_loss() for loss in losses), distribution.mean())
+        standard_error = simulated.std() / np.sqrt(years)
+        self.assertLess(abs(distribution.mean() - simulated.mean()), 4. * standard_error)
+        return distribution
+
+    def test_matches_simulation(self):
+        self.assert_matches_monte_carlo(self.losses, [0.7, 0.8, 0.9, 0.99], 1000000)
+
+    def test_matches_simulation_of_register(self):
+        # Register-like scenarios whose magnitudes span four orders of magnitude: the middle
+        # quantiles are sums of many small losses, far below the tail the last grid reaches.
+        rng = np.random.default_rng(3)
+        losses = [simpleloss.SimpleLoss('L{}'.format(i), 'scenario', frequency, 1000, high_loss)
+                  for i, (frequency, high_loss) in enumerate(zip(rng.uniform(0.01, 0.5, 50), 10 ** rng.uniform(4, 7, 50)))]
+        distribution = self.assert_matches_monte_carlo(losses, [0.1, 0.5, 0.7, 0.9, 0.99], 400000)
+        lower, upper = distribution.quantile_bounds([0.1, 0.5, 0.9])
+        np.testing.assert_allclose(lower, upper, rtol=0.01)
+
+    def test_single_loss_and_exceedance(self):
+        one = analytic.aggregate_distribution(self.losses[:1], grid_size=2 ** 12)
+        loss, = one.quantile([0.95])
+        self.assertAlmostEqual(0.05, one.exceedance_probability(loss), delta=0.005)
+        losses, probs = multiloss.MultiLoss(self.losses).exceedance_curve(0, probs=[0.2, 0.05], analytic=True)
+        np.testing.assert_array_equal(analytic.aggregate_distribution(self.losses).quantile([0.8, 0.95]), losses)
+
+    def test_bounds_tighten_with_grid(self):
+        coarse = np.subtract(*analytic.aggregate_distribution(self.losses, grid_size=2 ** 10).quantile_bounds(0.99))
+        fine = np.subtract(*analytic.aggregate_distribution(self.losses, grid_size=2 ** 14).quantile_bounds(0.99))
+        self.assertLess(abs(fine), abs(coarse))
+
+
+if __name__ == '__main__':
+    unittest.main()
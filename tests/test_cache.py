@@ -0,0 +1,107 @@
+#   Copyright 2019-2020 Netflix, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import tempfile
+import unittest
+
+import numpy as np
+from riskquant import cache
+from riskquant import multiloss
+from riskquant import simpleloss
+
+
+class TestSimulationCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_memory_lru(self):
+        c = cache.SimulationCache(max_memory_bytes=2 * 800)  # Room for two arrays of 100 floats
+        for name in 'abc':
+            c.put(name, np.zeros(100))
+        self.assertIsNone(c.get('a'))  # Least recently used was evicted
+        self.assertIsNotNone(c.get('b'))
+        self.assertIsNotNone(c.get('c'))
+        self.assertEqual(c.stats()['hits'], 2)
+        self.assertEqual(c.stats()['misses'], 1)
+        self.assertEqual(c.stats()['memory_entries'], 2)
+
+    def test_disk_tier(self):
+        c = cache.SimulationCache(directory=self.directory.name)
+        c.put('a', np.arange(10.))
+        fresh = cache.SimulationCache(directory=self.directory.name)
+        np.testing.assert_array_equal(fresh.get('a'), np.arange(10.))
+        self.assertEqual(fresh.disk_hits, 1)
+        fresh.clear()
+        self.assertIsNone(cache.SimulationCache(directory=self.directory.name).get('a'))
+
+    def test_disk_eviction(self):
+        c = cache.SimulationCache(max_memory_bytes=0, directory=self.directory.name, max_disk_bytes=3000)
+        for name in 'abcd':
+            c.put(name, np.zeros(100))  # About 900 bytes each on disk
+        self.assertLessEqual(c.stats()['disk_bytes'], 3000)
+        self.assertIsNone(c.get('a'))
+        self.assertIsNotNone(c.get('d'))
+
+    def test_make_key(self):
+        self.assertEqual(cache.make_key('x', [1, 0.1]), cache.make_key('x', [1, 0.1]))
+        self.assertNotEqual(cache.make_key('x', [1, 0.1]), cache.make_key('x', [1, 0.1000001]))
+
+    def test_multiloss(self):
+        losses = [simpleloss.SimpleLoss('L%d' % i, 'loss%d' % i, 0.1, 1, 10 + i)
+                  for i in range(multiloss.SCENARIOS_PER_TASK + 1)]
+        c = cache.SimulationCache(directory=self.directory.name)
+        uncached = multiloss.MultiLoss(losses).simulate_years(1000, seed=3)
+        m = multiloss.MultiLoss(losses, cache=c)
+        first = m.simulate_years(1000, seed=3)
+        self.assertEqual((c.hits, c.misses), (0, 65))  # One entry for each scenario
+        np.testing.assert_array_equal(first, uncached)
+        np.testing.assert_array_equal(m.simulate_years(1000, seed=3), uncached)
+        self.assertEqual((c.hits, c.misses), (65, 65))
+
+        # Changing one scenario only re-simulates it.
+        losses[-1] = simpleloss.SimpleLoss('L', 'changed', 0.2, 1, 10)
+        changed = m.simulate_years(1000, seed=3)
+        self.assertEqual((c.hits, c.misses), (129, 66))
+        np.testing.assert_array_equal(changed, multiloss.MultiLoss(losses).simulate_years(1000, seed=3))
+
+        # So does inserting a row: the others keep their random streams, which follow their labels.
+        losses.insert(0, simpleloss.SimpleLoss('NEW', 'inserted', 0.3, 1, 10))
+        inserted = m.simulate_years(1000, seed=3)
+        self.assertEqual((c.hits, c.misses), (194, 67))
+        np.testing.assert_array_equal(inserted, multiloss.MultiLoss(losses).simulate_years(1000, seed=3))
+        np.testing.assert_allclose(inserted - changed, multiloss.MultiLoss(losses[:1]).simulate_years(1000, seed=3),
+                                   atol=1e-9)
+
+        # Unseeded simulations can't be re-used, so they bypass the cache, and so do
+        # year-loss tables, which would copy the whole table into it.
+        m.simulate_years(1000)
+        m.tail_contributions(1000, seed=3)
+        self.assertEqual((c.hits, c.misses), (194, 67))
+        self.assertEqual(67, c.stats()['memory_entries'])
+
+    def test_multiloss_scenario_engine(self):
+        losses = [simpleloss.SimpleLoss('L%d' % i, 'loss%d' % i, 0.5, 1, 10 + i) for i in range(3)]
+        c = cache.SimulationCache()
+        m = multiloss.MultiLoss(losses, engine='scenario', cache=c)
+        for aggregate in (m.simulate_years(500, seed=4, chunk_years=200), m.simulate_years(500, seed=4, chunk_years=200)):
+            np.testing.assert_array_equal(
+                aggregate, multiloss.MultiLoss(losses, engine='scenario').simulate_years(500, seed=4, chunk_years=200))
+        self.assertEqual((c.hits, c.misses), (9, 9))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,8 @@
 import unittest
 
+import numpy as np
 from riskquant import loss
+from riskquant.model import lognormal_magnitude, pert_frequency, poisson_frequency
 
 
 class FixedValueModel(object):
@@ -25,24 +27,79 @@ class TestLoss(unittest.TestCase):
     def test_simulate_years(self):
         loss_model = loss.Loss(FixedValueModel(1), FixedValueModel(0.5))
         multiple_years = loss_model.simulate_years(3)
-        self.assertEqual([0.5, 0.5, 0.5], multiple_years)
+        self.assertEqual([0.5, 0.5, 0.5], list(multiple_years))
+
+    def test_simulate_years_models_without_rng(self):
+        loss_model = loss.Loss(FixedValueModel(1), FixedValueModel(0.5))
+        self.assertEqual([0.5, 0.5, 0.5], list(loss_model.simulate_years(3, rng=1)))
+        self.assertEqual([0.5], loss_model.simulate_losses_one_year(rng=1))
 
     def test_simulate_years_frequency(self):
         loss_model = loss.Loss(FixedValueModel(2), FixedValueModel(0.5))
         multiple_years = loss_model.simulate_years(3)
-        self.assertEqual([1.0, 1.0, 1.0], multiple_years)
+        self.assertEqual([1.0, 1.0, 1.0], list(multiple_years))
 
     def test_simulate_zeros(self):
         loss_model = loss.Loss(FixedValueModel(0), FixedValueModel(0.5))
         multiple_years = loss_model.simulate_years(3)
-        self.assertEqual([0, 0, 0], multiple_years)
+        self.assertEqual([0, 0, 0], list(multiple_years))
+
+    def test_simulate_years_returns_array(self):
+        loss_model = loss.Loss(FixedValueModel(1), FixedValueModel(0.5))
+        self.assertIsInstance(loss_model.simulate_years(3), np.ndarray)
+
+    def test_vectorized_matches_loop(self):
+        # Same RNG state must give exactly the same yearly totals on both paths.
+        loss_model = loss.Loss(poisson_frequency.PoissonFrequency(2.5),
+                               lognormal_magnitude.LognormalMagnitude(1, 100))
+        np.random.seed(1234)
+        vectorized = loss_model.simulate_years(1000)
+        np.random.seed(1234)
+        looped = loss_model.simulate_years(1000, vectorized=False)
+        self.assertTrue(np.array_equal(vectorized, looped))
+
+    def test_simulate_years_seeded(self):
+        loss_model = loss.Loss(poisson_frequency.PoissonFrequency(2.5),
+                               lognormal_magnitude.LognormalMagnitude(1, 100))
+        first = loss_model.simulate_years(100, rng=np.random.default_rng(7))
+        second = loss_model.simulate_years(100, rng=7)
+        self.assertTrue(np.array_equal(first, second))
+        self.assertFalse(np.array_equal(first, loss_model.simulate_years(100, rng=8)))
+
+    def test_simulate_years_dtype_and_out(self):
+        loss_model = loss.Loss(poisson_frequency.PoissonFrequency(2.),
+                               lognormal_magnitude.LognormalMagnitude(100, 1000))
+        full = loss_model.simulate_years(100, rng=7)
+        compact = loss_model.simulate_years(100, rng=7, dtype=np.float32)
+        self.assertEqual(np.float32, compact.dtype)
+        np.testing.assert_allclose(full, compact, rtol=1e-6)
+        out = np.zeros(200)
+        result = loss_model.simulate_years(100, rng=7, out=out[50:150])
+        self.assertIs(out, result.base)
+        np.testing.assert_array_equal(full, out[50:150])
+        with self.assertRaises(AssertionError):
+            loss_model.simulate_years(100, out=out)
+
+    def test_simulate_years_qmc(self):
+        loss_model = loss.Loss(poisson_frequency.PoissonFrequency(0.5),
+                               lognormal_magnitude.LognormalMagnitude(100, 1000))
+        years = loss_model.simulate_years(4096, rng=3, qmc=True)
+        np.testing.assert_array_equal(years, loss_model.simulate_years(4096, rng=3, qmc=True))
+        # The event counts come from one stratified coordinate, so the share of years without
+        # a loss is much closer to exp(-0.5) than the 1 / sqrt(4096) of plain Monte Carlo.
+        self.assertAlmostEqual(np.exp(-0.5), np.mean(years == 0), delta=0.002)
+        self.assertAlmostEqual(1, years.mean() / loss_model.annualized_loss(), delta=0.05)
+        np.testing.assert_array_equal([0, 1, 1, 2, 6], poisson_frequency.PoissonFrequency(0.5).ppf(
+            [0, 0.61, 0.9, 0.95, 0.99999]))
+        pert = loss.Loss(pert_frequency.PERTFrequency(0.1, 0.9, 0.3, 4), lognormal_magnitude.LognormalMagnitude(1, 10))
+        self.assertRaises(AssertionError, pert.simulate_years, 10, qmc=True)
 
     def testSummary(self):
         loss_array = []
         for i in range(10):
             loss_model = loss.Loss(FixedValueModel(1), FixedValueModel(i))
-            loss_array += loss_model.simulate_years(100)
-        loss_array += loss_model.simulate_years(10)  # Add a few more for value 9
+            loss_array += list(loss_model.simulate_years(100))
+        loss_array += list(loss_model.simulate_years(10))  # Add a few more for value 9
 
         summary = loss_model.summarize_loss(loss_array)
         self.assertEqual(summary['minimum'], 0)
@@ -51,6 +108,23 @@ class TestLoss(unittest.TestCase):
         self.assertEqual(summary['median'], 5)
         self.assertEqual(summary['ninetieth_percentile'], 9)
         self.assertEqual(summary['maximum'], 9)
+        self.assertTrue(all(np.ndim(value) == 0 for value in summary.values()))
+
+    def test_summary_rows(self):
+        rng = np.random.default_rng(3)
+        losses = rng.lognormal(10, 1, size=(5, 1000))
+        losses[2, :600] = 0  # Mostly loss-free years
+        summary = loss.Loss.summarize_loss(losses)
+        for row in range(5):
+            row_summary = loss.Loss.summarize_loss(losses[row])
+            for key, value in row_summary.items():
+                self.assertEqual(value, summary[key][row])
+        self.assertEqual(0, summary['mode'][2])
+
+    def test_summary_mode_continuous(self):
+        rng = np.random.default_rng(4)
+        losses = rng.normal(1000, 10, 100000)
+        self.assertAlmostEqual(1000, loss.Loss.summarize_loss(losses, mode_bins=200)['mode'], delta=5)
 
 
 if __name__ == '__main__':
@@ -1,5 +1,7 @@
 import unittest
 
+import numpy as np
+from riskquant import simpleloss
 from riskquant.model import lognormal_magnitude
 
 
@@ -18,6 +20,19 @@ class MyTestCase(unittest.TestCase):
         hard = lognormal_magnitude.LognormalMagnitude(635000, 19000000)
         self.assertAlmostEqual(5922706.83351131, hard.mean())
 
+    def testDrawMatchesDistribution(self):
+        # The fast path draws exactly what scipy's rvs draws from the same generator.
+        fast = self.logn.draw(1000, rng=np.random.default_rng(4))
+        np.testing.assert_array_equal(self.logn.distribution.rvs(size=1000, random_state=np.random.default_rng(4)), fast)
+
+    def testShared(self):
+        shared = lognormal_magnitude.LognormalMagnitude.shared(2, 20)
+        self.assertIs(shared, lognormal_magnitude.LognormalMagnitude.shared(2, 20))
+        self.assertIsNot(shared, lognormal_magnitude.LognormalMagnitude.shared(2, 30))
+        a = simpleloss.SimpleLoss('A', 'a', 0.1, 2, 20)
+        b = simpleloss.SimpleLoss('B', 'b', 0.5, 2, 20)
+        self.assertIs(a.magnitude_model, b.magnitude_model)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,5 +1,6 @@
 import unittest
 
+import numpy as np
 from riskquant.model import pert_frequency
 
 
@@ -13,7 +14,7 @@ class TestPERTFrequency(unittest.TestCase):
 
     def test_draw_integers(self):
         # Draw returns integer values
-        self.assertEqual(int, type(self.s.draw()[0]))
+        self.assertTrue(np.issubdtype(self.s.draw().dtype, np.integer))
 
     def test_draw(self):
         num_values = 10000
@@ -26,6 +27,16 @@ class TestPERTFrequency(unittest.TestCase):
         total = sum(s.draw(num_values))
         self.assertTrue(0.0040 < float(total) / float(num_values) < 0.006)
 
+    def test_draw_rates(self):
+        # Rates stay in [min, max] and have the Modified PERT mean (min + k * mode + max) / (k + 2)
+        s = pert_frequency.PERTFrequency(1, 9, 2, kurtosis=4)
+        rates = s.draw_rates(100000)
+        self.assertTrue(np.all((rates >= 1) & (rates <= 9)))
+        self.assertAlmostEqual(rates.mean(), (1 + 4 * 2 + 9) / 6., places=1)
+
+    def test_mean(self):
+        self.assertEqual(self.s.mean(), 5)
+
 
 if __name__ == '__main__':
     unittest.main()
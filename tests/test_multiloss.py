@@ -12,9 +12,14 @@
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 
+import io
+import sys
 import unittest
+import unittest.mock
 
+import numpy as np
 from riskquant import multiloss
+from riskquant import simpleloss
 
 
 class FixedValueLoss(object):
@@ -31,6 +36,17 @@ class FixedValueLoss(object):
         return [self.value for _ in range(n)]
 
 
+class CountingLoss(FixedValueLoss):
+    """Loss model whose year i has loss i, and which counts its simulations."""
+    def __init__(self, label, name):
+        super(CountingLoss, self).__init__(label, name, 0)
+        self.simulations = 0
+
+    def simulate_years(self, n, rng=None):
+        self.simulations += 1
+        return np.arange(n, dtype=float)
+
+
 class TestMultiLoss(unittest.TestCase):
     def setUp(self):
         self.m = multiloss.MultiLoss(
@@ -53,6 +69,151 @@ class TestMultiLoss(unittest.TestCase):
         for elem in result:
             self.assertTrue(elem == 3)
 
+    def test_simulate_years_dtype_and_out(self):
+        m = multiloss.MultiLoss([simpleloss.SimpleLoss('L%d' % i, 'loss', 0.3, 1000, 100000) for i in range(3)])
+        full = m.simulate_years(1000, seed=2)
+        compact = m.simulate_years(1000, seed=2, dtype=np.float32)
+        self.assertEqual(np.float32, compact.dtype)
+        np.testing.assert_allclose(full, compact, rtol=1e-6)
+        out = np.empty(1000)
+        self.assertIs(out, m.simulate_years(1000, seed=2, out=out))
+        np.testing.assert_array_equal(full, out)
+
+    def test_simulate_years_seeded(self):
+        m = multiloss.MultiLoss([simpleloss.SimpleLoss('L1', 'loss1', 0.5, 1, 10),
+                                 simpleloss.SimpleLoss('L2', 'loss2', 2, 10, 100)])
+        first = m.simulate_years(1000, seed=42)
+        self.assertTrue(np.array_equal(first, m.simulate_years(1000, seed=42)))
+        self.assertFalse(np.array_equal(first, m.simulate_years(1000, seed=43)))
+        self.assertTrue(np.array_equal(m.simulate_years(10, seed=np.random.default_rng(1)),
+                                       m.simulate_years(10, seed=np.random.default_rng(1))))
+
+    def test_simulate_years_chunks_are_independent_streams(self):
+        # Each chunk has its own stream, so simulating more years leaves earlier chunks unchanged.
+        m = multiloss.MultiLoss([simpleloss.SimpleLoss('L1', 'loss1', 0.5, 1, 10)])
+        short = m.simulate_years(300, seed=5, chunk_years=100)
+        longer = m.simulate_years(500, seed=5, chunk_years=100)
+        self.assertTrue(np.array_equal(short, longer[:300]))
+
+    def test_simulate_years_workers(self):
+        # Splitting the work across processes gives exactly the sequential result.
+        losses = [simpleloss.SimpleLoss('L%d' % i, 'loss%d' % i, 0.1 * (i % 7), 1, 10 + i)
+                  for i in range(multiloss.SCENARIOS_PER_TASK + 10)]
+        m = multiloss.MultiLoss(losses)
+        sequential = m.simulate_years(250, seed=11, chunk_years=100)
+        parallel = m.simulate_years(250, seed=11, chunk_years=100, workers=2)
+        self.assertTrue(np.array_equal(sequential, parallel))
+
+    def test_iter_simulated_years(self):
+        m = multiloss.MultiLoss([simpleloss.SimpleLoss('L1', 'loss1', 0.5, 1, 10)])
+        chunks = list(m.iter_simulated_years(250, seed=3, chunk_years=100))
+        self.assertEqual([100, 100, 50], [len(c) for c in chunks])
+        self.assertTrue(np.array_equal(np.concatenate(chunks), m.simulate_years(250, seed=3, chunk_years=100)))
+
+    def test_exceedance_curve_streaming(self):
+        m = multiloss.MultiLoss([simpleloss.SimpleLoss('L1', 'loss1', 2, 1000, 100000)])
+        probs = [0.5, 0.1, 0.01]
+        exact, _ = m.exceedance_curve(20000, probs=probs, seed=9)
+        streamed, _ = m.exceedance_curve(20000, probs=probs, seed=9, streaming=True)
+        np.testing.assert_allclose(streamed, exact, rtol=0.01)
+
+    def test_exceedance_curve_modes(self):
+        m = multiloss.MultiLoss([simpleloss.SimpleLoss('L1', 'loss1', 2, 1000, 100000)])
+        self.assertRaises(AssertionError, m.exceedance_curve, 1000, analytic=True, qmc=True)
+        self.assertRaises(AssertionError, m.exceedance_curve, 1000, tolerance=0.1, variance_reduction='stratified')
+
+    def test_simulate_years_adaptive(self):
+        m = multiloss.MultiLoss([simpleloss.SimpleLoss('L1', 'loss1', 2, 1000, 100000)])
+        years, report = m.simulate_years_adaptive(0.05, 100000, quantiles=(0.5, 0.9), seed=4, chunk_years=1000)
+        self.assertTrue(report['converged'])
+        self.assertLess(report['years'], 100000)
+        self.assertEqual(report['years'], len(years))
+        # The years are the first years of the fixed-length simulation.
+        self.assertTrue(np.array_equal(years, m.simulate_years(100000, seed=4, chunk_years=1000)[:len(years)]))
+        np.testing.assert_allclose(report['estimates'], np.quantile(years, [0.5, 0.9]))
+        self.assertTrue(np.all(report['lower'] <= report['estimates']))
+        self.assertTrue(np.all(report['estimates'] <= report['upper']))
+        self.assertTrue(np.all(report['relative_error'] <= 0.05))
+
+        _, capped = m.simulate_years_adaptive(1e-6, 3000, quantiles=(0.5, 0.9), seed=4, chunk_years=1000)
+        self.assertFalse(capped['converged'])
+        self.assertEqual(3000, capped['years'])
+
+        # By default it checks every few thousand years, not every chunk of simulate_years.
+        _, quick = m.simulate_years_adaptive(0.05, 1000000, quantiles=(0.5, 0.9), seed=4)
+        self.assertLessEqual(quick['years'], 4 * multiloss.ADAPTIVE_CHUNK_YEARS)
+        # exceedance_curve checks the quantiles of the requested probs.
+        with unittest.mock.patch('sys.stderr', io.StringIO()) as log:
+            m.exceedance_curve(1000000, probs=[0.5, 0.25], seed=4, tolerance=0.05)
+        self.assertIn('0.75 quantile', log.getvalue())
+        self.assertNotIn('0.999 quantile', log.getvalue())
+
+    def test_quantiles_qmc(self):
+        losses = [simpleloss.SimpleLoss('L%d' % i, 'loss', 0.3, 1000, 100000) for i in range(3)]
+        q = [0.5, 0.9, 0.99]
+        expected = np.quantile(multiloss.MultiLoss(losses).simulate_years(400000, seed=1), q)
+        for engine in ('portfolio', 'scenario'):
+            m = multiloss.MultiLoss(losses, engine=engine)
+            self.assertEqual((4, 4096), m.simulate_years_qmc(10000, seed=2, replicates=4).shape)
+            self.assertEqual((4, 2048), m.simulate_years_qmc(8192, seed=2, replicates=4).shape)
+            estimates, errors = m.quantiles_qmc(20000, q, seed=2)
+            self.assertTrue(np.all(errors > 0))
+            np.testing.assert_allclose(estimates, expected, rtol=0.05)
+            curve, _ = m.exceedance_curve(20000, probs=[0.5, 0.1, 0.01], seed=2, qmc=True)
+            np.testing.assert_allclose(curve, estimates)
+
+    def test_incremental(self):
+        def losses(high_loss=10):
+            return [simpleloss.SimpleLoss('L1', 'loss1', 0.5, 1, high_loss),
+                    simpleloss.SimpleLoss('L2', 'loss2', 2, 10, 100)]
+
+        m = multiloss.MultiLoss(losses())
+        m.start_incremental(1000, seed=6, chunk_years=300)
+        # Each scenario has its own streams, as with the scenario engine.
+        scenario_engine = multiloss.MultiLoss(losses(), engine='scenario')
+        np.testing.assert_allclose(m.simulate_years(1000), scenario_engine.simulate_years(1000, seed=6, chunk_years=300))
+
+        # Updating a scenario gives the same years as starting over with the new parameters.
+        m.update_loss(0, losses(high_loss=50)[0])
+        fresh = multiloss.MultiLoss(losses(high_loss=50))
+        fresh.start_incremental(1000, seed=6, chunk_years=300)
+        np.testing.assert_array_equal(m.simulate_years(1000), fresh.simulate_years(1000))
+        np.testing.assert_array_equal(m.exceedance_curve(1000, probs=[0.5])[0], fresh.exceedance_curve(1000, probs=[0.5])[0])
+        self.assertEqual(m.summarize_loss(1000), fresh.summarize_loss(1000))
+
+        m.add_loss(simpleloss.SimpleLoss('L3', 'loss3', 1, 100, 1000))
+        self.assertEqual(len(m.loss_list), 3)
+        self.assertGreater(m.simulate_years(1000).mean(), fresh.simulate_years(1000).mean())
+        m.remove_loss(2)
+        # Removing a loss leaves no rounding residue in the kept years.
+        np.testing.assert_array_equal(m.simulate_years(1000), fresh.simulate_years(1000))
+
+        # Alternative modes simulate their own years rather than reading the kept ones.
+        with unittest.mock.patch.object(m, 'simulate_years_qmc', return_value=np.zeros((4, 256))) as simulate:
+            np.testing.assert_array_equal([0], m.exceedance_curve(1000, probs=[0.5], qmc=True)[0])
+        simulate.assert_called_once_with(1000, seed=None)
+
+        # Other year counts, or an explicit seed, still simulate from scratch.
+        self.assertEqual(len(m.simulate_years(10)), 10)
+        m.stop_incremental()
+        self.assertFalse(np.array_equal(m.simulate_years(1000, seed=7), fresh.simulate_years(1000)))
+
+    def test_exceedance_curve(self):
+        counting = CountingLoss('L1', 'loss1')
+        m = multiloss.MultiLoss([counting])
+        losses, probs = m.exceedance_curve(101, probs=[0.9, 0.5, 0.1])
+        self.assertEqual(counting.simulations, 1)  # A single simulation serves every point
+        np.testing.assert_allclose(probs, [0.9, 0.5, 0.1])
+        np.testing.assert_allclose(losses, [10, 50, 90])
+
+    def test_exceedance_curve_default_probs(self):
+        losses, probs = self.m.exceedance_curve(10)
+        self.assertEqual(len(losses), 99)
+        self.assertAlmostEqual(probs[0], 0.99)
+        self.assertAlmostEqual(probs[-1], 0.01)
+        self.assertTrue(np.all(losses == 3))
+        self.assertNotIn('matplotlib.pyplot', sys.modules)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,124 @@
+#   Copyright 2019-2020 Netflix, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import math
+import unittest
+
+import numpy as np
+from riskquant import analytic
+from riskquant import loss
+from riskquant import multiloss
+from riskquant import portfolio
+from riskquant import simpleloss
+from riskquant.model import lognormal_magnitude, poisson_frequency
+
+
+class TestSimpleLossPortfolio(unittest.TestCase):
+    def setUp(self):
+        self.losses = [simpleloss.SimpleLoss('L1', 'loss1', 0.5, 1, 10),
+                       simpleloss.SimpleLoss('L2', 'loss2', 0.1, 100, 1000)]
+        self.p = portfolio.SimpleLossPortfolio.from_losses(self.losses)
+
+    def testAnnualized(self):
+        np.testing.assert_allclose(self.p.annualized_losses(),
+                                   [loss.annualized_loss() for loss in self.losses])
+
+    def testSimulateYears(self):
+        years = 200000
+        losses = self.p.simulate_years(years, rng=1)
+        self.assertEqual(len(losses), years)
+        # A year has no loss only if neither scenario had an event.
+        self.assertAlmostEqual(np.mean(losses == 0), math.exp(-0.6), places=2)
+        expected = sum(loss.annualized_loss() for loss in self.losses)
+        self.assertAlmostEqual(losses.mean() / expected, 1, places=1)
+
+    def testSimulateRange(self):
+        # Only the scenarios in [first, last) contribute.
+        losses = self.p.simulate_years(1000, rng=1, first=0, last=1)
+        self.assertLess(losses.max(), 100)
+
+    def testVarianceReduction(self):
+        # Both methods find the analytic quantiles of a rare loss from few years.
+        rare = multiloss.MultiLoss([simpleloss.SimpleLoss('L1', 'loss1', 0.02, 10000, 10000000)])
+        q = [0.99, 0.999]
+        expected = analytic.aggregate_distribution(rare.loss_list).quantile(q)
+        for method in multiloss.VARIANCE_REDUCTION_METHODS:
+            losses = rare.simulate_years_weighted(20000, method, seed=1)
+            np.testing.assert_allclose(losses.quantile(q), expected, rtol=0.15)
+            self.assertLess(abs(losses.mean() / rare.loss_list[0].annualized_loss() - 1), 0.1)
+            curve, _ = rare.exceedance_curve(20000, probs=[0.01], seed=1, variance_reduction=method)
+            np.testing.assert_array_equal(losses.quantile([0.99]), curve)
+        # The stratified years skip the 98% of years without an event.
+        stratified = rare.simulate_years_weighted(20000, seed=1)
+        self.assertEqual(1, np.count_nonzero(stratified.values == 0))
+        self.assertAlmostEqual(math.exp(-0.02), stratified.weights[stratified.values == 0][0])
+        self.assertRaises(AssertionError, rare.simulate_years_weighted, 100, 'other')
+
+    def testVariants(self):
+        halved = portfolio.SimpleLossPortfolio.from_ranges([0.25, 0.1], [1, 100], [10, 1000])
+        halved_range = portfolio.SimpleLossPortfolio.from_ranges([0.5, 0.1], [1, 50], [10, 500])
+        years = self.p.simulate_variants([self.p, halved, halved_range], 100000, rng=3)
+        self.assertEqual((4, 100000), years.shape)
+        # Common random numbers: an unchanged variant repeats the base years, a lower rate
+        # keeps a subset of the events, and a lower loss range shrinks the same events.
+        np.testing.assert_array_equal(years[0], years[1])
+        self.assertTrue(np.all(years[2] <= years[0]))
+        self.assertTrue(np.all(years[3] <= years[0]))
+        expected = [variant.annualized_losses().sum() for variant in (self.p, self.p, halved, halved_range)]
+        np.testing.assert_allclose(years.mean(axis=1), expected, rtol=0.05)
+        self.assertRaises(AssertionError, self.p.simulate_variants, [portfolio.SimpleLossPortfolio([1], [0], [1])], 10)
+
+    def testEvaluateVariants(self):
+        m = multiloss.MultiLoss(self.losses)
+        result = m.evaluate_variants({'halve L1': {'L1': {'frequency': 0.25}},
+                                      'cap L2': {'L2': {'high_loss': 500}}}, 10000, probs=[0.5, 0.1], seed=1)
+        self.assertEqual(['base', 'halve L1', 'cap L2'], list(result))
+        self.assertAlmostEqual(self.p.annualized_losses().sum(), result['base']['annualized_loss'])
+        self.assertLess(result['halve L1']['annualized_loss'], result['base']['annualized_loss'])
+        self.assertEqual(set(m.summarize_loss(10)), set(result['cap L2']['summary']))
+        losses, probs = result['halve L1']['exceedance_curve']
+        np.testing.assert_allclose([0.5, 0.1], probs)
+        self.assertTrue(np.all(losses <= result['base']['exceedance_curve'][0]))
+        again = m.evaluate_variants({'halve L1': {'L1': {'frequency': 0.25}}}, 10000, probs=[0.5, 0.1], seed=1)
+        self.assertEqual(result['halve L1']['mean'], again['halve L1']['mean'])
+        self.assertRaises(AssertionError, m.evaluate_variants, {'base': {}}, 10)
+        self.assertRaises(AssertionError, m.evaluate_variants, {'v': {'L9': {'frequency': 1}}}, 10)
+        self.assertRaises(AssertionError, m.evaluate_variants, {'v': {'L1': {'rate': 1}}}, 10)
+        # Losses without a label are simulated but never changed.
+        unlabeled = loss.Loss(poisson_frequency.PoissonFrequency(0.5), lognormal_magnitude.LognormalMagnitude(1, 10))
+        mixed = multiloss.MultiLoss([unlabeled, self.losses[1]])
+        result = mixed.evaluate_variants({'halve L2': {'L2': {'frequency': 0.05}}}, 1000, seed=1)
+        self.assertAlmostEqual(unlabeled.annualized_loss() + self.losses[1].annualized_loss() / 2,
+                               result['halve L2']['annualized_loss'])
+
+    def testContract(self):
+        self.assertRaises(AssertionError, portfolio.SimpleLossPortfolio, [-1], [0], [1])
+        self.assertRaises(AssertionError, portfolio.SimpleLossPortfolio, [1, 2], [0], [1])
+        self.assertFalse(portfolio.supports(object()))
+
+    def testMultiLossEngine(self):
+        auto = multiloss.MultiLoss(self.losses)
+        self.assertIsInstance(auto._simulator(), portfolio.SimpleLossPortfolio)
+        scenario = multiloss.MultiLoss(self.losses, engine='scenario')
+        self.assertIs(scenario._simulator(), self.losses)
+        # Both engines simulate the same distribution.
+        probs = [0.5, 0.2, 0.05]
+        auto_curve, _ = auto.exceedance_curve(100000, probs=probs, seed=2)
+        scenario_curve, _ = scenario.exceedance_curve(100000, probs=probs, seed=2)
+        np.testing.assert_allclose(auto_curve, scenario_curve, rtol=0.05)
+        self.assertRaises(AssertionError, multiloss.MultiLoss, self.losses, engine='other')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+#   Copyright 2019-2020 Netflix, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+import riskquant
+from riskquant import multiloss
+from riskquant import profiling
+from riskquant import simpleloss
+
+
+class TestProfiling(unittest.TestCase):
+    def test_off_by_default(self):
+        self.assertIsNone(profiling.start())
+        self.assertIsNone(profiling.record('phase', None))
+
+    def setUp(self):
+        self.losses = [simpleloss.SimpleLoss('L1', 'loss1', 2, 1000, 10000),
+                       simpleloss.SimpleLoss('L2', 'loss2', 1, 1000, 10000)]
+
+    def test_loss_phases(self):
+        for engine in ('scenario', 'auto'):
+            m = multiloss.MultiLoss(self.losses, engine=engine)
+            with profiling.Profile() as profile:
+                m.exceedance_curve(1000, seed=1)
+            self.assertIsNone(profiling.start())
+            report = profile.report()
+            self.assertEqual({'frequency draw', 'magnitude draw', 'aggregation', 'percentiles'},
+                             set(report['phases']))
+            self.assertEqual({'L1', 'L2'}, set(report['scenarios']))
+            frequency = report['scenarios']['L1']['frequency draw']
+            self.assertEqual(1, frequency['calls'])
+            self.assertGreater(frequency['events'], 1000)
+            self.assertEqual(frequency['events'], report['scenarios']['L1']['magnitude draw']['events'])
+            total_events = sum(report['scenarios'][label]['frequency draw']['events'] for label in ('L1', 'L2'))
+            self.assertEqual(total_events, report['phases']['frequency draw']['events'])
+        self.assertEqual(2, report['phases']['frequency draw']['max_array_size'])  # One Poisson draw for both
+
+    def test_workers(self):
+        # Phases run in worker processes are merged into the profile.
+        m = multiloss.MultiLoss(self.losses)
+        with profiling.Profile() as sequential:
+            m.simulate_years(2000, seed=1, chunk_years=500)
+        with profiling.Profile() as parallel:
+            m.simulate_years(2000, seed=1, chunk_years=500, workers=2)
+        for phase in ('frequency draw', 'magnitude draw', 'aggregation'):
+            self.assertEqual(sequential.report()['phases'][phase]['calls'], parallel.report()['phases'][phase]['calls'])
+        self.assertEqual(sequential.report()['scenarios']['L2']['magnitude draw']['events'],
+                         parallel.report()['scenarios']['L2']['magnitude draw']['events'])
+
+    def test_threads(self):
+        # Each thread records into its own active Profile.
+        m = multiloss.MultiLoss(self.losses)
+        reports = {}
+
+        def run(years):
+            with profiling.Profile() as profile:
+                m.simulate_years(years, seed=1, chunk_years=100)
+            reports[years] = profile.report()
+
+        threads = [threading.Thread(target=run, args=(years,)) for years in (300, 500)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(3, reports[300]['phases']['aggregation']['calls'])
+        self.assertEqual(5, reports[500]['phases']['aggregation']['calls'])
+
+    def test_cli_profile(self):
+        directory = tempfile.TemporaryDirectory()
+        register = os.path.join(directory.name, 'register.csv')
+        with open(register, 'w') as f:
+            f.write("L1,loss1,0.1,1000,10000\n")
+        output = os.path.join(directory.name, 'profile.json')
+        riskquant.main(['--file', register, '--profile', output])
+        with open(output, 'r') as f:
+            report = json.load(f)
+        self.assertEqual({'read register', 'prioritize'}, set(report['phases']))
+        self.assertEqual(1, report['phases']['read register']['max_array_size'])
+        directory.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main()
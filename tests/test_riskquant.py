@@ -14,11 +14,20 @@
 
 import unittest
 import os
+import subprocess
+import sys
 import tempfile
 
 import riskquant
 
 
+# Cumulative import time budget (microseconds) for a prioritize-only CLI run.
+IMPORT_BUDGET_US = 1000000
+
+# Modules that should only be imported by the code paths that need them.
+HEAVY_MODULES = ('matplotlib', 'scipy.stats', 'tensorflow', 'tensorflow_probability')
+
+
 class TestRiskquant(unittest.TestCase):
     """Test the functions implemented in riskquant/__init__.py"""
 
@@ -36,6 +45,61 @@ class TestRiskquant(unittest.TestCase):
             for j in range(5):
                 self.assertEqual(loss[j], expected[i][j])
 
+    def test_csv_to_arrays_reports_every_bad_row(self):
+        csvdata = "L1,loss1,0.1,1,10\n" \
+                  "L2,loss2,-0.2,1,10\n" \
+                  "L3,loss3,0.1,10,1\n" \
+                  "L4,loss4,0.1,one,10\n" \
+                  "L5,loss5\n"
+        path = TestRiskquant._write_to_tempfile(csvdata)
+        with self.assertRaises(ValueError) as raised:
+            riskquant.csv_to_arrays(path)
+        message = str(raised.exception)
+        for line in range(2, 6):
+            self.assertIn('line {}:'.format(line), message)
+        self.assertNotIn('line 1:', message)
+
+    def test_main_writes_prioritized(self):
+        path = TestRiskquant._write_to_tempfile("L1,loss1,0.1,1000,10000\n"
+                                                "L2,\"loss2, with a comma\",0.5,1000,10000\n")
+        riskquant.main(['--file', path])
+        with open(path + '_prioritized', 'r') as f:
+            self.assertEqual(['L2,"loss2, with a comma","$2,020"', 'L1,loss1,$404'], f.read().splitlines())
+        os.remove(path + '_prioritized')
+
+    def test_main_writes_tail_contributions(self):
+        path = TestRiskquant._write_to_tempfile("L1,loss1,0.1,1000,10000\n"
+                                                "L2,loss2,0.5,1000,10000\n")
+        riskquant.main(['--file', path, '--tail-contributions', '--years', '1000', '--seed', '1', '--no-cache'])
+        with open(path + '_tail_contributions', 'r') as f:
+            lines = f.read().splitlines()
+        self.assertTrue(lines[0].startswith('Identifier,Name,Annualized loss,Contribution to 95% TVaR'))
+        self.assertEqual(['L2', 'L1'], [line.split(',')[0] for line in lines[1:]])
+        os.remove(path + '_prioritized')
+        os.remove(path + '_tail_contributions')
+
+    def test_sigdigs(self):
+        self.assertEqual('$1,230', riskquant._sigdigs(1234.56, 3))
+        self.assertEqual(['$0', '$120', '$5,000,000'], riskquant._sigdigs_array([0, 125, 4999999], 2))
+
+    def test_main_import_time(self):
+        # A run without --plot must not import plotting, scipy.stats or tensorflow,
+        # and the imports it does need must fit in the budget.
+        path = TestRiskquant._write_to_tempfile("L1,loss1,0.1,1,10\n")
+        code = "import sys; import riskquant; sys.exit(riskquant.main(['--file', sys.argv[1]]))"
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code, path],
+                                stderr=subprocess.PIPE, universal_newlines=True, check=True)
+        imported = {}
+        for line in result.stderr.splitlines():
+            if line.startswith('import time:') and '|' in line:
+                _, cumulative, name = line[len('import time:'):].split('|')
+                if cumulative.strip().isdigit():
+                    imported[name.strip()] = int(cumulative)
+        self.assertIn('riskquant', imported)
+        heavy = [name for name in imported if name.startswith(HEAVY_MODULES)]
+        self.assertEqual([], heavy)
+        self.assertLess(imported['riskquant'], IMPORT_BUDGET_US)
+
     @staticmethod
     def _write_to_tempfile(data):
         fp, path = tempfile.mkstemp()
@@ -0,0 +1,86 @@
+#   Copyright 2019-2020 Netflix, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import io
+import json
+import os
+import tempfile
+import unittest
+import unittest.mock
+
+import numpy as np
+from riskquant import multiloss
+from riskquant import server
+from riskquant import simpleloss
+
+
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        self.server = server.Server(workers=2)
+        self.rows = [['L1', 'loss1', 0.5, 1000, 100000], ['L2', 'loss2', 2, 10, 100]]
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_answers(self):
+        prioritized = self.server.answer(json.dumps({'id': 1, 'op': 'prioritize', 'scenarios': self.rows}))
+        self.assertEqual(1, prioritized['id'])
+        self.assertEqual(['L1', 'L2'], [row[0] for row in prioritized['result']])
+
+        m = multiloss.MultiLoss([simpleloss.SimpleLoss(*row) for row in self.rows])
+        request = {'id': 'a', 'op': 'exceedance_curve', 'scenarios': self.rows, 'years': 1000, 'seed': 3,
+                   'probs': [0.5, 0.1]}
+        curve = self.server.answer(json.dumps(request))['result']
+        np.testing.assert_array_equal(m.exceedance_curve(1000, probs=[0.5, 0.1], seed=3)[0], curve['losses'])
+        request.update(op='summary')
+        summary = self.server.answer(json.dumps(request))['result']
+        self.assertEqual(m.summarize_loss(1000, seed=3)['median'], summary['median'])
+        self.assertEqual({'requests': 3, 'registers': 0, 'models': 1}, self.server.stats())
+
+    def test_errors(self):
+        self.assertIn('JSONDecodeError', self.server.answer('not json')['error'])
+        self.assertIn('Unknown op', self.server.answer('{"id": 2, "op": "other"}')['error'])
+        bad = self.server.answer(json.dumps({'id': 3, 'op': 'summary', 'scenarios': [['L1', 'loss1', 0.5, 10, 1]]}))
+        self.assertEqual(3, bad['id'])
+        self.assertIn('line 1: high loss must exceed low loss', bad['error'])
+        zero = self.server.answer(json.dumps({'id': 4, 'op': 'summary', 'scenarios': self.rows, 'years': 0}))
+        self.assertIn('years must be positive', zero['error'])
+
+    def test_unexpected_error(self):
+        # A failure that isn't a bad request still gets a response, so a stream never stalls.
+        def fail(request):
+            raise IndexError('bug')
+        self.server._run = fail
+        output = io.StringIO()
+        with unittest.mock.patch('sys.stderr', io.StringIO()) as log:
+            self.server.serve_stream(io.StringIO('{"id": 5, "op": "stats"}\n'), output)
+        self.assertEqual({'id': 5, 'error': 'Internal error IndexError: bug'}, json.loads(output.getvalue()))
+        self.assertIn('Traceback', log.getvalue())
+
+    def test_serve_stream(self):
+        with tempfile.TemporaryDirectory() as directory:
+            register = os.path.join(directory, 'register.csv')
+            with open(register, 'w') as f:
+                f.write('\n'.join(','.join(str(value) for value in row) for row in self.rows))
+            requests = [{'id': i, 'op': 'summary', 'file': register, 'years': 100, 'seed': i} for i in range(10)]
+            output = io.StringIO()
+            self.server.serve_stream(io.StringIO('\n'.join(json.dumps(r) for r in requests) + '\n\n'), output)
+        responses = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(list(range(10)), sorted(response['id'] for response in responses))
+        self.assertTrue(all('result' in response for response in responses))
+        self.assertEqual(1, self.server.stats()['registers'])
+
+
+if __name__ == '__main__':
+    unittest.main()
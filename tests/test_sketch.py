@@ -0,0 +1,66 @@
+#   Copyright 2019-2020 Netflix, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import unittest
+
+import numpy as np
+from riskquant import sketch
+
+
+class TestQuantileSketch(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        # Mostly zero-loss years with a lognormal tail, like a simulated portfolio.
+        self.values = np.where(rng.random(50000) < 0.7, 0.0, rng.lognormal(10, 2, 50000))
+
+    def test_quantiles_within_relative_accuracy(self):
+        s = sketch.QuantileSketch(relative_accuracy=0.01)
+        s.add(self.values)
+        q = np.array([0.1, 0.5, 0.75, 0.9, 0.99, 0.999])
+        exact = np.quantile(self.values, q, method='lower')
+        np.testing.assert_allclose(s.quantile(q), exact, rtol=0.01)
+        self.assertEqual(s.quantile(1.0), self.values.max())
+
+    def test_merge(self):
+        whole = sketch.QuantileSketch()
+        whole.add(self.values)
+        merged = sketch.QuantileSketch()
+        for part in np.array_split(self.values, 7):
+            partial = sketch.QuantileSketch()
+            partial.add(part)
+            merged.merge(partial)
+        self.assertEqual(merged.count, whole.count)
+        self.assertEqual(merged.zero_count, whole.zero_count)
+        q = np.linspace(0, 1, 21)
+        np.testing.assert_array_equal(merged.quantile(q), whole.quantile(q))
+        self.assertAlmostEqual(merged.mean(), self.values.mean())
+
+    def test_summarize_loss(self):
+        s = sketch.QuantileSketch()
+        s.add(self.values)
+        summary = s.summarize_loss()
+        self.assertEqual(summary['minimum'], 0)
+        self.assertEqual(summary['mode'], 0)
+        self.assertEqual(summary['median'], 0)
+        self.assertEqual(summary['maximum'], int(self.values.max()))
+
+    def testContract(self):
+        s = sketch.QuantileSketch()
+        self.assertRaises(AssertionError, s.add, [-1.0])
+        self.assertRaises(AssertionError, s.quantile, 0.5)
+        self.assertRaises(AssertionError, s.merge, sketch.QuantileSketch(relative_accuracy=0.01))
+
+
+if __name__ == '__main__':
+    unittest.main()
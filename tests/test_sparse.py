@@ -0,0 +1,86 @@
+#   Copyright 2019-2020 Netflix, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import unittest
+
+import numpy as np
+from riskquant import loss
+from riskquant import multiloss
+from riskquant import simpleloss
+from riskquant import sparse
+
+
+class TestSparseYearLosses(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(5)
+        self.dense = np.where(rng.random(10000) < 0.03, rng.lognormal(10, 1, 10000), 0.)
+
+    def test_round_trip(self):
+        losses = sparse.SparseYearLosses.from_dense(self.dense)
+        self.assertEqual(np.count_nonzero(self.dense), losses.index.size)
+        np.testing.assert_array_equal(self.dense, losses.to_dense())
+        self.assertAlmostEqual(self.dense.mean(), losses.mean())
+        halves = [sparse.SparseYearLosses.from_dense(self.dense[:4000]),
+                  sparse.SparseYearLosses.from_dense(self.dense[4000:])]
+        np.testing.assert_array_equal(self.dense, sparse.SparseYearLosses.concatenate(halves).to_dense())
+
+    def test_quantiles_and_summary(self):
+        losses = sparse.SparseYearLosses.from_dense(self.dense)
+        q = [0, 0.5, 0.97, 0.975, 0.99, 0.999, 1]
+        np.testing.assert_allclose(np.quantile(self.dense, q), losses.quantile(q))
+        self.assertEqual(loss.Loss.summarize_loss(self.dense), losses.summarize_loss())
+        self.assertEqual(type(losses.summarize_loss()['mode']), type(losses.summarize_loss()['median']))
+        np.testing.assert_array_equal([0, 0], sparse.SparseYearLosses(10, [], []).percentile([50, 99]))
+
+    def test_sum(self):
+        rows = np.stack([self.dense, self.dense[::-1], np.zeros(self.dense.size)])
+        parts = sparse.SparseYearLosses.from_rows(rows)
+        self.assertEqual(0, parts[2].index.size)
+        np.testing.assert_allclose(rows.sum(axis=0), sparse.SparseYearLosses.sum(parts).to_dense())
+
+    def test_from_events(self):
+        year, values = np.array([3, 1, 3, 7]), np.array([1., 2., 4., 8.])
+        losses = sparse.SparseYearLosses.from_events(10, year, values)
+        np.testing.assert_array_equal(np.bincount(year, weights=values, minlength=10), losses.to_dense())
+        rows = sparse.SparseYearLosses.from_scenario_events(3, 10, np.array([0, 2, 2, 0]), year, values)
+        np.testing.assert_array_equal([[0, 0, 0, 1, 0, 0, 0, 8, 0, 0], np.zeros(10), [0, 2, 0, 4, 0, 0, 0, 0, 0, 0]],
+                                      [row.to_dense() for row in rows])
+        unpacked = sparse.SparseYearLosses.unpack_rows(3, 10, sparse.SparseYearLosses.pack_rows(rows))
+        np.testing.assert_array_equal([row.to_dense() for row in rows], [row.to_dense() for row in unpacked])
+
+    def test_simulate_sparse(self):
+        losses = [simpleloss.SimpleLoss('L%d' % i, 'loss', 0.001 * (i % 7), 1000, 100000) for i in range(100)]
+        for engine in ('portfolio', 'scenario'):
+            m = multiloss.MultiLoss(losses, engine=engine)
+            scenario_losses = m.simulate_sparse(5000, seed=3, chunk_years=2000)
+            self.assertEqual(100, len(scenario_losses))
+            self.assertEqual(5000, scenario_losses[0].years)
+            dense = m.simulate_years(5000, seed=3, chunk_years=2000)
+            np.testing.assert_allclose(dense, sparse.SparseYearLosses.sum(scenario_losses).to_dense())
+            # The sparse aggregate is exactly the dense one.
+            total = m.simulate_sparse(5000, seed=3, chunk_years=2000, aggregate=True)
+            np.testing.assert_array_equal(dense, total.to_dense())
+
+    def test_rare_portfolio_percentiles(self):
+        # Few years have a loss, so the curve and summary come from sparse totals, with the same results.
+        m = multiloss.MultiLoss([simpleloss.SimpleLoss('L%d' % i, 'loss', 0.001, 1000, 100000) for i in range(100)])
+        self.assertIsInstance(m._aggregate_years(20000, 3, None), sparse.SparseYearLosses)
+        dense = m.simulate_years(20000, seed=3)
+        np.testing.assert_array_equal(np.percentile(dense, [50, 90, 99]),
+                                      m.exceedance_curve(20000, probs=[0.5, 0.1, 0.01], seed=3)[0])
+        self.assertEqual(loss.Loss.summarize_loss(dense), m.summarize_loss(20000, seed=3))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+#   Copyright 2019-2020 Netflix, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import unittest
+
+import numpy as np
+from riskquant import loss
+from riskquant import weighted
+
+
+class TestWeightedYearLosses(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.values = np.where(rng.random(5000) < 0.4, rng.lognormal(10, 1, 5000), 0.)
+
+    def test_equal_weights(self):
+        losses = weighted.WeightedYearLosses(self.values, np.full(self.values.size, 2.))
+        q = [0, 0.1, 0.5, 0.9, 0.99, 1]
+        np.testing.assert_array_equal(np.quantile(self.values, q, method='inverted_cdf'), losses.quantile(q))
+        self.assertAlmostEqual(self.values.mean(), losses.mean())
+        self.assertAlmostEqual(self.values.size, losses.effective_sample_size())
+        self.assertEqual(loss.Loss.summarize_loss(self.values)['mode'], losses.summarize_loss()['mode'])
+        self.assertAlmostEqual(np.mean(self.values > 30000), losses.exceedance_probability(30000))
+
+    def test_weights_count_as_repeats(self):
+        # A year of weight 3 counts like three copies of it.
+        repeated = weighted.WeightedYearLosses([1., 2., 2., 2., 5.], np.ones(5))
+        losses = weighted.WeightedYearLosses([5., 2., 1.], [1., 3., 1.])
+        np.testing.assert_array_equal(repeated.quantile([0, 0.2, 0.21, 0.8, 0.81, 1]),
+                                      losses.quantile([0, 0.2, 0.21, 0.8, 0.81, 1]))
+        self.assertEqual(repeated.summarize_loss(), losses.summarize_loss())
+        self.assertAlmostEqual(25. / 11., losses.effective_sample_size())
+
+    def test_contract(self):
+        self.assertRaises(AssertionError, weighted.WeightedYearLosses, [1., 2.], [1.])
+        self.assertRaises(AssertionError, weighted.WeightedYearLosses, [1., 2.], [1., -1.])
+        self.assertRaises(AssertionError, weighted.WeightedYearLosses, [1., 2.], [0., 0.])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+#   Copyright 2019-2020 Netflix, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from riskquant import loss
+from riskquant import multiloss
+from riskquant import simpleloss
+from riskquant import yearloss
+
+
+class TestYearLossTable(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'table')
+        self.losses = [simpleloss.SimpleLoss('ALICE', 'Alice steals the data', 0.5, 1000, 10000),
+                       simpleloss.SimpleLoss('BOB', 'Bob steals the data', 0.2, 10000, 100000),
+                       simpleloss.SimpleLoss('ALICE', 'Alice loses the data', 1, 100, 1000)]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_write_and_aggregate(self):
+        for engine in ('portfolio', 'scenario'):
+            m = multiloss.MultiLoss(self.losses, engine=engine)
+            table = m.write_year_loss_table(self.path, 1000, seed=4, chunk_years=300)
+            self.assertIsInstance(table.losses, np.memmap)
+            self.assertEqual(table.losses.shape, (3, 1000))
+            # The rows come from the same streams as simulate_years.
+            np.testing.assert_allclose(table.aggregate(), m.simulate_years(1000, seed=4, chunk_years=300))
+
+    def test_float32_table(self):
+        m = multiloss.MultiLoss(self.losses)
+        table = m.write_year_loss_table(self.path, 1000, seed=4, dtype=np.float32)
+        self.assertEqual(np.float32, yearloss.YearLossTable(self.path).losses.dtype)
+        np.testing.assert_allclose(table.aggregate(), m.simulate_years(1000, seed=4), rtol=1e-6)
+
+    def test_subsets(self):
+        m = multiloss.MultiLoss(self.losses)
+        table = m.write_year_loss_table(self.path, 2000, seed=4)
+        reopened = yearloss.YearLossTable(self.path)
+        self.assertEqual(reopened.labels, ['ALICE', 'BOB', 'ALICE'])
+        self.assertEqual(reopened.years, 2000)
+
+        alice = reopened.scenarios(labels=['ALICE'])
+        np.testing.assert_array_equal(alice, [0, 2])
+        np.testing.assert_array_equal(reopened.scenarios(exclude_labels=['ALICE']), [1])
+        np.testing.assert_allclose(reopened.aggregate(alice), table.losses[0] + table.losses[2])
+        np.testing.assert_allclose(reopened.aggregate([True, False, False]), table.losses[0])
+
+        losses, probs = reopened.exceedance_curve([0.5, 0.1], scenarios=alice)
+        np.testing.assert_allclose(losses, np.percentile(table.losses[0] + table.losses[2], [50, 90]))
+        self.assertEqual(reopened.summarize_loss(), loss.Loss.summarize_loss(table.aggregate()))
+        np.testing.assert_array_equal(reopened.top_scenarios(1), [1])
+
+    def test_tail_contributions(self):
+        m = multiloss.MultiLoss(self.losses)
+        table = m.write_year_loss_table(self.path, 2000, seed=4)
+        report = table.tail_contributions([0.9, 0.99])
+        totals = table.aggregate()
+        np.testing.assert_allclose(report['value_at_risk'], np.quantile(totals, [0.9, 0.99]))
+        # The contributions add up to the mean of the worst 200 and 20 years.
+        worst = np.sort(totals)[::-1]
+        np.testing.assert_allclose(report['tail_value_at_risk'], [worst[:200].mean(), worst[:20].mean()])
+        np.testing.assert_allclose(report['contribution'].sum(axis=0), report['tail_value_at_risk'])
+        without_bob = table.aggregate(table.scenarios(exclude_labels=['BOB']))
+        np.testing.assert_allclose(report['value_at_risk_without'][1], np.quantile(without_bob, [0.9, 0.99]))
+        # The same simulation in memory gives the same report.
+        in_memory = m.tail_contributions(2000, [0.9, 0.99], seed=4)
+        for key, value in report.items():
+            np.testing.assert_allclose(in_memory[key], value)
+        self.assertRaises(AssertionError, yearloss.tail_contributions, table.losses, [1.0])
+
+
+if __name__ == '__main__':
+    unittest.main()